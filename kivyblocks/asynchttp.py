@@ -0,0 +1,267 @@
+import time
+import asyncio
+from functools import partial
+from urllib.parse import urlparse
+from threading import Thread, Lock
+from concurrent.futures import CancelledError
+
+try:
+	import aiohttp
+except ImportError:
+	aiohttp = None
+import requests
+from requests.cookies import create_cookie, get_cookie_header
+
+from appPublic.Singleton import SingletonDecorator
+from appPublic.jsonConfig import getConfig
+from appPublic.http_client import NeedLogin, InsufficientPrivilege, \
+		HTTPError, hostsessions
+
+from .threadcall import HttpClient, SessionPool, result_pump, decodeBody
+from .resilience import Resilience
+from .instrument import instrument
+
+"""
+asyncio http transport
+
+AsyncTransport runs one asyncio event loop in a background thread,
+requests are multiplexed on it with aiohttp, so hundreds of requests
+in flight cost one thread instead of one worker thread each.
+without aiohttp the requests run on the loop's default executor.
+the cookies are kept in the SessionPool's cookie jar, shared with
+HttpClient, so a login done by either is seen by the other.
+
+coroutine api, await it in any event loop:
+	hc = AsyncHttpClient()
+	data = await hc.get(url, params={...})
+
+callback api, callback(future, data)/errback(future, e) are called
+in ui thread:
+	transport = AsyncTransport()
+	transport.call(transport.webcall(url), callback, errback)
+set config "http_transport" to "asyncio" to route
+HttpClient(..., callback=...) calls through the transport.
+
+config:
+	async_http_limit: connections in total, default 100
+	async_http_limit_per_host: connections per host, default 0 (no limit)
+"""
+
+def formParams(params):
+	ret = []
+	for k,v in params.items():
+		vs = v if isinstance(v, list) else [v]
+		ret += [ (k, str(i)) for i in vs ]
+	return ret
+
+@SingletonDecorator
+class AsyncTransport:
+	def __init__(self):
+		config = getConfig()
+		self.limit = config.async_http_limit or 100
+		self.limit_per_host = config.async_http_limit_per_host or 0
+		self.loop = asyncio.new_event_loop()
+		self.session = None
+		self.lock = Lock()
+		self.requests = 0
+		self.inflight = 0
+		self.thread = Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def run(self):
+		asyncio.set_event_loop(self.loop)
+		self.loop.run_forever()
+
+	def getSession(self):
+		if self.session is None:
+			connector = aiohttp.TCPConnector(limit=self.limit,
+						limit_per_host=self.limit_per_host,
+						ssl=False)
+			# the cookies are kept in SessionPool().cookies
+			self.session = aiohttp.ClientSession(connector=connector,
+						cookie_jar=aiohttp.DummyCookieJar())
+		return self.session
+
+	def cookieHeader(self, method, url):
+		return get_cookie_header(SessionPool().cookies,
+						requests.Request(method, url))
+
+	def keepCookies(self, url, resp):
+		"""
+		store the Set-Cookie cookies of resp in SessionPool().cookies
+		"""
+		jar = SessionPool().cookies
+		host = urlparse(url).hostname
+		for name, m in resp.cookies.items():
+			domain = m['domain'] or host
+			path = m['path'] or '/'
+			expires = None
+			if m['max-age']:
+				try:
+					expires = time.time() + int(m['max-age'])
+				except ValueError:
+					pass
+			if expires is not None and expires <= time.time():
+				# an expired cookie is deleted
+				try:
+					jar.clear(domain, path, name)
+				except KeyError:
+					pass
+				continue
+			jar.set_cookie(create_cookie(name, m.value, domain=domain,
+						path=path, expires=expires,
+						secure=bool(m['secure'])))
+
+	def submit(self, coro):
+		"""
+		run coro in the transport's loop, return a
+		concurrent.futures.Future
+		"""
+		return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+	def call(self, coro, callback=None, errback=None):
+		f = self.submit(coro)
+		def done(f):
+			try:
+				rez = f.result()
+			except CancelledError:
+				return
+			except Exception as e:
+				if errback:
+					result_pump.post(errback, f, e)
+				return
+			if callback:
+				result_pump.post(callback, f, rez)
+		f.add_done_callback(done)
+		return f
+
+	async def webcall(self, url, method='GET', params={}, files={},
+				headers={}, timeout=None):
+		"""
+		same as Http_Client.webcall(), must run in the transport's loop
+		"""
+		with self.lock:
+			self.requests += 1
+			self.inflight += 1
+		try:
+			if aiohttp is None:
+				hc = HttpClient()
+				f = partial(hc.webcall, url, method=method, params=params,
+							files=files, headers=headers, timeout=timeout)
+				return await self.loop.run_in_executor(None, f)
+			resilience = Resilience()
+			timeout = resilience.getTimeout(timeout)
+			if isinstance(timeout, (tuple, list)):
+				timeout = aiohttp.ClientTimeout(connect=timeout[0],
+							sock_read=timeout[1])
+			else:
+				timeout = aiohttp.ClientTimeout(total=timeout)
+			f = partial(self._webcall, url, method=method, params=params,
+							files=files, headers=headers, timeout=timeout)
+			return await resilience.acall(url, method, f)
+		finally:
+			with self.lock:
+				self.inflight -= 1
+
+	async def _webcall(self, url, method='GET', params={}, files={},
+				headers={}, timeout=None):
+		domain = '/'.join(url.split('/')[:3])
+		headers = headers.copy()
+		sessionid = hostsessions.get(domain,None)
+		if sessionid:
+			headers.update({'session':sessionid})
+		cookie = self.cookieHeader(method, url)
+		if cookie:
+			headers['Cookie'] = cookie
+		kw = {'headers':headers, 'timeout':timeout}
+		if method == 'GET':
+			kw['params'] = formParams(params)
+		elif files:
+			data = aiohttp.FormData()
+			for k,v in formParams(params):
+				data.add_field(k, v)
+			for k,v in files.items():
+				if isinstance(v, (tuple, list)):
+					data.add_field(k, v[1], filename=v[0])
+				else:
+					data.add_field(k, v)
+			kw['data'] = data
+		else:
+			kw['data'] = formParams(params)
+
+		session = self.getSession()
+		start = time.perf_counter()
+		try:
+			return await self._request(session, domain, url, method,
+							params, kw)
+		finally:
+			instrument.record('fetch', 'net', start,
+						time.perf_counter() - start,
+						{'url':url, 'method':method})
+
+	async def _request(self, session, domain, url, method, params, kw):
+		async with session.request(method, url, **kw) as resp:
+			self.keepCookies(url, resp)
+			if resp.status == 200:
+				h = resp.headers.get('Set-Cookie',None)
+				if h:
+					hostsessions[domain] = h.split(';')[0]
+			if resp.status == 401:
+				print('NeedLogin:',url)
+				raise NeedLogin
+			if resp.status == 403:
+				raise InsufficientPrivilege
+			if resp.status != 200:
+				print('Error', url, method, params, resp.status)
+				raise HTTPError(resp.status,url)
+			body = await resp.read()
+			return decodeBody(resp.headers.get('Content-Type'), body,
+						resp.charset)
+
+	def stats(self):
+		return {
+			"backend":"aiohttp" if aiohttp else "executor",
+			"requests":self.requests,
+			"inflight":self.inflight
+		}
+
+class AsyncHttpClient:
+	"""
+	coroutine version of HttpClient, the coroutines can be awaited in
+	any event loop, the request itself runs in AsyncTransport's loop
+	"""
+	def __init__(self):
+		self.transport = AsyncTransport()
+
+	async def __call__(self, url, method='GET', params={}, headers={},
+				files={}, timeout=None):
+		coro = self.transport.webcall(url, method=method, params=params,
+					files=files, headers=headers, timeout=timeout)
+		try:
+			loop = asyncio.get_running_loop()
+		except RuntimeError:
+			loop = None
+		if loop is self.transport.loop:
+			return await coro
+		return await asyncio.wrap_future(self.transport.submit(coro))
+
+	async def get(self, url, params={}, headers={}, timeout=None):
+		return await self(url, method='GET', params=params, headers=headers,
+					timeout=timeout)
+
+	async def post(self, url, params={}, headers={}, files={},
+				timeout=None):
+		return await self(url, method='POST', params=params,
+					headers=headers, files=files, timeout=timeout)
+
+	async def put(self, url, params={}, headers={}, timeout=None):
+		return await self(url, method='PUT', params=params, headers=headers,
+					timeout=timeout)
+
+	async def delete(self, url, params={}, headers={}, timeout=None):
+		return await self(url, method='DELETE', params=params,
+					headers=headers, timeout=timeout)
+
+	async def option(self, url, params={}, headers={}, timeout=None):
+		return await self(url, method='OPTION', params=params,
+					headers=headers, timeout=timeout)
@@ -51,7 +51,6 @@ from kivy.uix.bubble import Bubble
 from kivy.uix.codeinput import CodeInput
 from kivy.graphics import Color, Rectangle
 from kivy.properties import ListProperty
-from kivycalendar import DatePicker
 from kivy.factory import Factory
 
 from appPublic.dictObject import DictObject
@@ -2,7 +2,9 @@ import os
 import sys
 import codecs
 import json
+import time
 from traceback import print_exc
+from threading import Lock, RLock
 
 import kivy
 from functools import partial
@@ -15,6 +17,7 @@ from appPublic.datamapping import keyMapping
 from appPublic.registerfunction import RegisterFunction
 
 from kivy.logger import Logger
+from kivy.clock import Clock
 from kivy.config import Config
 from kivy.metrics import sp,dp,mm
 from kivy.core.window import WindowBase, Window
@@ -36,36 +39,98 @@ from .newvideo import Video
 from .ready import WidgetReady
 from .bgcolorbehavior import BGColorBehavior
 from .orientationlayout import OrientationLayout
-from .threadcall import HttpClient
+from .threadcall import HttpClient, USER_VISIBLE
+from .buildplan import BuildPlan, compileValue, planKey, plan_cache
+from .expression import ExpressionEngine
+from .widgetindex import widget_index
+from .desccache import DescCache
+from .instrument import instrument, InstrumentOverlay
 from .register import *
 
+expr_engine = ExpressionEngine(globals(), GlobalEnv(),
+				forbidens = [
+					"os",
+					"sys",
+					"codecs",
+					"json",
+				])
+
 def showError(e):
 	print('error',e)
 
 
+ready_classes = {}
+ready_lock = RLock()
+ready_stats = {
+	"hits":0,
+	"misses":0,
+	"wrapped":0
+}
+
+def ready_class(klass, w):
+	def __init__(self, **kw):
+		w.__init__(self, **kw)
+		WidgetReady.__init__(self)
+
+	return type(w)(f'R_{klass}', (WidgetReady, w), {'__init__':__init__})
+
 def wrap_ready(klass):
-	try:
-		w = Factory.get(klass)
-		if hasattr(w,'ready'):
+	"""
+	return the widget class registered as klass, mixed with WidgetReady,
+	the result is memoized per class name
+	"""
+	with ready_lock:
+		w = ready_classes.get(klass)
+		if w is not None:
+			ready_stats['hits'] += 1
 			return w
-		Factory.unregister(klass)
-		globals()[klass] = w
-	except:
-		w = globals().get(klass)
+		ready_stats['misses'] += 1
+		try:
+			w = Factory.get(klass)
+		except:
+			w = globals().get(klass)
 		if w is None:
 			return None
-		if hasattr(w,'ready'):
-			return w
-		
-	script = f"""class R_{klass}(WidgetReady, {klass}):
-	def __init__(self, **kw):
-		{klass}.__init__(self, **kw)
-		WidgetReady.__init__(self)
-""" 
-	exec(script,globals(),globals())
-	newWidget = globals().get(f'R_{klass}')
-	Factory.register(klass,newWidget)
-	return newWidget
+
+		if not hasattr(w,'ready'):
+			newWidget = ready_class(klass, w)
+			Factory.unregister(klass)
+			Factory.register(klass,newWidget)
+			globals()[klass] = w
+			globals()[f'R_{klass}'] = newWidget
+			expr_engine.invalidate()
+			ready_stats['wrapped'] += 1
+			w = newWidget
+		ready_classes[klass] = w
+		return w
+
+def readyClassStats():
+	with ready_lock:
+		d = ready_stats.copy()
+		d['size'] = len(ready_classes)
+	return d
+
+def invalidateClass(classname):
+	"""
+	forget the ready class and the plans using classname, plans hold
+	the resolved class, call it when a class is registered again
+	after descriptions were built with it
+	"""
+	with ready_lock:
+		w = ready_classes.pop(classname, None)
+		if w is not None and w is globals().get(f'R_{classname}'):
+			# the Factory keeps the ready class wrap_ready registered
+			Factory.unregister(classname)
+	plan_cache.dropClass(classname)
+
+def descCopy(desc):
+	"""
+	the widget's own copy of a description, plans share theirs
+	"""
+	d = dict(desc)
+	if isinstance(d.get('options'), dict):
+		d['options'] = d['options'].copy()
+	return d
 
 class WidgetNotFoundById(Exception):
 	def __init__(self, id):
@@ -131,9 +196,90 @@ class NotRegistedWidget(Exception):
 	def __expr__(self):
 		return self.__str__()
 
+class UrlWidgetHolder(BoxLayout):
+	"""
+	placeholder for a widget still being built by
+	Blocks.asyncWidgetBuild()
+	"""
+	def __init__(self, **kw):
+		super().__init__(**kw)
+		self.widget = None
+		self.loading_image = Image(source=blockImage('loading1.gif'),
+							size_hint=(None,None),
+							size=(CSize(2),CSize(2)))
+		self.add_widget(self.loading_image)
+
+	def replace(self, widget):
+		self.widget = widget
+		parent = self.parent
+		if parent is None:
+			return
+		if isinstance(parent, WindowBase):
+			parent.remove_widget(self)
+			parent.add_widget(widget)
+			app = App.get_running_app()
+			if app and app.root is self:
+				app.root = widget
+			return
+		index = parent.children.index(self)
+		parent.remove_widget(self)
+		parent.add_widget(widget, index=index)
+
 def registerWidget(name,widget):
 	globals()[name] = widget
+	invalidateClass(name)
+	expr_engine.invalidate()
+
+
+action_handlers = {
+	'blocks':'blocksAction',
+	'urlwidget':'urlwidgetAction',
+	'registedfunction':'registedfunctionAction',
+	'script':'scriptAction',
+	'method':'methodAction',
+	'event':'eventAction',
+	'multiple':'multipleAction'
+}
+
+class BindAction:
+	"""
+	the callable Blocks.buildAction() binds to a widget's event,
+	it holds the parsed bind description and the handler resolved from
+	the actiontype, if the description has a "conform" key, a Conform
+	widget is show before the handler is called.
+	"""
+	def __init__(self, blocks, widget, desc):
+		self.blocks = blocks
+		self.widget = widget
+		self.desc = desc
+		self.conform_desc = desc.get('conform')
+		self.actiontype = desc.get('actiontype')
+		handler = action_handlers.get(self.actiontype)
+		self.handler = None
+		if handler:
+			self.handler = getattr(blocks, handler)
+
+	def __call__(self, *args):
+		if self.conform_desc:
+			return self.conform(*args)
+		return self.action(*args)
 
+	def action(self, *args):
+		Logger.info('Block: uniaction() called, desc=%s', str(self.desc))
+		if self.handler is None:
+			alert("actiontype(%s) invalid" % self.actiontype,title='error')
+			return
+		return self.handler(self.widget, self.desc, *args)
+
+	def conform(self, *args):
+		# a Blocks of its own, the page's Blocks dispatches on_built
+		# to handlers that would place the popup in the page
+		w = Blocks().widgetBuild({
+			"widgettype":"Conform",
+			"options":self.conform_desc
+		})
+		w.bind(on_conform=self.action)
+		w.open()
 
 class Blocks(EventDispatcher):
 	def __init__(self):
@@ -141,81 +287,81 @@ class Blocks(EventDispatcher):
 		self.action_id = 0
 		self.register_event_type('on_built')
 		self.register_event_type('on_failed')
+		self.register_event_type('on_progress')
 		self.env = GlobalEnv()
 
 	def set(self,k,v):
 		self.env[k] = v
+		expr_engine.invalidate()
 	
 	def register_widget(self,name,widget):
 		globals()[name] = widget
+		invalidateClass(name)
+		expr_engine.invalidate()
 
 	def buildAction(self,widget,desc):
-		conform_desc = desc.get('conform')
-		blocks = Blocks()
-		if not conform_desc:
-			return partial(blocks.uniaction, widget, desc)
-		l = {
-		}
-		body="""def action(widget, *args, **kw):
-	jsonstr='''%s'''
-	desc = json.loads(jsonstr)
-	conform_desc = desc.get('conform')
-	blocks = Blocks()
-	if not conform_desc:
-		blocks.uniaction(widget, desc,*args, **kw)
-		return
-	w = blocks.widgetBuild({
-		"widgettype":"Conform",
-		"options":conform_desc
-	})
-	w.bind(on_conform=partial(blocks.uniaction, widget, desc))
-	w.open()
-	print('Conform show.....')
-""" % (json.dumps(desc))
-		exec(body,globals(),l)
-		f = l.get('action',None)
-		if f is None:
-			raise Exception('None Function')
-		func =partial(f,widget)
-		return func
+		return BindAction(self, widget, desc)
 		
 	def eval(self,s,l):
-		g = {}
-		forbidens = [
-			"os",
-			"sys",
-			"codecs",
-			"json",
-		]
-
-		for k,v in globals().copy().items():
-			if k not in forbidens:
-				g[k] = v
-
-		g['__builtins__'] = globals()['__builtins__'].copy()
-		g['__builtins__']['__import__'] = None
-		g['__builtins__']['__loader__'] = None
-		g['__builtins__']['open'] = None
-		g.update(self.env)
-		return eval(s,g,l)
+		return expr_engine.eval(s,l)
+
+	@classmethod
+	def exprStats(self):
+		return expr_engine.stats()
 
 	def getUrlData(self,url,method='GET',params={}, files={},
 					callback=None,
-					errback=None,**kw):
-
+					errback=None,
+					priority=USER_VISIBLE,
+					widget=None,**kw):
+		"""
+		get the description data from url, if callback is given,
+		the data is fetched in worker thread, callback(obj, data)
+		and errback(obj, e) are called in ui thread when done, and
+		a task handle is returned, see Workers.add() for priority and
+		widget.
+		file and GET descriptions go through DescCache
+		"""
 		if url is None:
 			if errback:
 				errback(None,Exception('url is None'))
-			else:
-				return None
+			return None
 
+		cache = DescCache()
 		if url.startswith('file://'):
 			filename = url[7:]
-			with codecs.open(filename,'r','utf-8') as f:
-				b = f.read()
-				dic = json.loads(b)
-				return dic
+			if callback:
+				app = App.get_running_app()
+				return app.workers.add(cache.readFile,callback,errback,
+							kwargs={'filename':filename},
+							priority=priority,
+							widget=widget)
+			return cache.readFile(filename)
 		elif url.startswith('http://') or url.startswith('https://'):
+			if method == 'GET' and not files:
+				kwargs = {
+					"url":url,
+					"params":params
+				}
+				if callback:
+					app = App.get_running_app()
+					return app.workers.add(cache.fetch,callback,errback,
+								kwargs=kwargs,
+								priority=priority,
+								widget=widget)
+				try:
+					return cache.fetch(**kwargs)
+				except Exception as e:
+					if errback:
+						return errback(None,e)
+					return None
+			if callback:
+				hc = HttpClient()
+				return hc(url,method=method,params=params,files=files,
+							callback=callback,
+							errback=errback,
+							priority=priority,
+							widget=widget)
 			try:
 				hc = HttpClient()
 				resp=hc(url,method=method,params=params,files=files)
@@ -231,8 +377,166 @@ class Blocks(EventDispatcher):
 			return self.getUrlData(url,method=method,
 					params=params,
 					files=files,
+					callback=callback,
+					errback=errback,
+					priority=priority,
+					widget=widget,
 					**kw)
 
+	def peekUrlData(self,url,method='GET',params={},files={},**kw):
+		"""
+		the description of url if DescCache has a fresh copy in memory,
+		None if it has to be loaded
+		"""
+		if url is None or method != 'GET' or files:
+			return None
+		if url.startswith('file://'):
+			return None
+		if not (url.startswith('http://') or url.startswith('https://')):
+			url = getConfig().uihome + url
+		return DescCache().peek(url, params)
+
+	def resolveUrlDesc(self,desc,callback,errback):
+		"""
+		resolve the urlwidget chain of desc without blocking the ui,
+		every url in the chain is fetched in worker thread and merged
+		with its "extend" dict, callback(desc) is called in ui thread
+		with the resolved description, errback(e) if it fails
+		"""
+		if desc.get('widgettype') != 'urlwidget':
+			callback(desc)
+			return
+
+		opts = desc.get('options',{}).copy()
+		addon = None
+		if desc.get('extend'):
+			addon = desc.get('extend').copy()
+		url = opts.get('url')
+		if url is None:
+			errback(Exception('miss url'))
+			return
+		del opts['url']
+
+		def loaded(o,d):
+			if not (isinstance(d, DictObject) or isinstance(d, dict)):
+				print('Block: desc must be a dict object',
+								d,type(d))
+				errback(Exception('miss url'))
+				return
+			if addon:
+				d = dictExtend(d,addon)
+			self.resolveUrlDesc(d,callback,errback)
+
+		def failed(o,e):
+			errback(e)
+
+		d = self.peekUrlData(url,**opts)
+		if d is not None:
+			loaded(None,d)
+			return
+		self.getUrlData(url,callback=loaded,errback=failed,**opts)
+
+	def resolveDescTree(self,desc,callback,errback):
+		"""
+		resolve desc and all the urlwidget subwidgets in it, independent
+		subwidget urls are fetched concurrently, callback(desc) is called
+		with the resolved description when all of them are done
+		"""
+		def subs_resolve(d):
+			subs = d.get('subwidgets',[])
+			pending = [ i for i,sw in enumerate(subs) \
+							if isinstance(sw,(dict,DictObject)) ]
+			if len(pending) == 0:
+				callback(d)
+				return
+			resolved_subs = list(subs)
+			state = {
+				"pending":len(pending),
+				"changed":False,
+				"failed":False
+			}
+			def sub_done(i,sd):
+				if sd is not subs[i]:
+					resolved_subs[i] = sd
+					state['changed'] = True
+				state['pending'] -= 1
+				if state['pending'] == 0 and not state['failed']:
+					# keep an unchanged desc, its plan is found by identity
+					if state['changed']:
+						d2 = d.copy()
+						d2['subwidgets'] = resolved_subs
+						plan_cache.own(d2)
+						callback(d2)
+					else:
+						callback(d)
+
+			def sub_failed(e):
+				if state['failed']:
+					return
+				state['failed'] = True
+				errback(e)
+
+			for i in pending:
+				self.resolveDescTree(subs[i],partial(sub_done,i),sub_failed)
+
+		self.resolveUrlDesc(desc,subs_resolve,errback)
+
+	def asyncWidgetBuild(self,desc):
+		"""
+		non-blocking version of widgetBuild(), the urlwidget chain and
+		the urlwidget subwidgets are fetched in worker threads,
+		subwidget urls are fetched concurrently.
+		if every thing is local or cached, the widget is built and
+		returned at once,
+		else a UrlWidgetHolder placeholder is returned, it is replaced
+		by the widget in its parent when the whole description resolved,
+		then on_built is fired.
+		"""
+		state = {
+			"resolved":None,
+			"failed":False
+		}
+		holder = None
+		def built(d):
+			if holder is None:
+				state['resolved'] = d
+				return
+			if getConfig().build_frame_budget:
+				widget = self.incrementalWidgetBuild(d)
+				if widget is not None:
+					holder.replace(widget)
+				return
+			try:
+				widget = self.w_build(d)
+			except Exception as e:
+				self.dispatch('on_failed',e)
+				return
+			holder.replace(widget)
+			self.dispatch('on_built',widget)
+			if hasattr(widget,'ready'):
+				widget.ready()
+
+		def failed(e):
+			Logger.info('Block: asyncWidgetBuild() failed, %s', str(e))
+			state['failed'] = True
+			self.dispatch('on_failed',e)
+
+		if isinstance(desc, BuildPlan):
+			return self.widgetBuild(desc)
+		if not isinstance(desc,(dict,DictObject)):
+			print('Block: desc must be a dict object', desc,type(desc))
+			self.dispatch('on_failed',Exception('miss url'))
+			return None
+		self.resolveDescTree(desc,built,failed)
+		if state['failed']:
+			return None
+		if state['resolved'] is not None:
+			if getConfig().build_frame_budget:
+				return self.incrementalWidgetBuild(state['resolved'])
+			return self.widgetBuild(state['resolved'])
+		holder = UrlWidgetHolder()
+		return holder
+
 	def strValueExpr(self,s:str,localnamespace:dict={}):
 		if not s.startswith('py::'):
 			return s
@@ -291,36 +595,93 @@ class Blocks(EventDispatcher):
 			return self.dictValueExpr(obj,localnamespace)
 		return obj
 
-	def w_build(self,desc:dict):
-		# print('w_build(),desc=',desc)
+	def compileDesc(self,desc:dict):
 		widgetClass = desc.get('widgettype',None)
 		if not widgetClass:
 			Logger.info("Block: w_build(), desc invalid", desc)
 			raise Exception(desc)
 
-		widgetClass = desc['widgettype']
-		opts = self.valueExpr(desc.get('options',{}).copy())
+		klass = wrap_ready(widgetClass)
+		if klass is None:
+			print('Error:',widgetClass,'not registered')
+			raise NotExistsObject(widgetClass)
+
+		excludes = ['widgettype','options','subwidgets','binds']
+		attributes = []
+		for k,v in [(k,v) for k,v in desc.items() if k not in excludes]:
+			if isinstance(v,dict) and v.get('widgettype'):
+				attributes.append((k,self.getPlan(v)))
+				continue
+			attributes.append((k,compileValue(v)))
+
+		subwidgets = []
+		for sw in desc.get('subwidgets',[]):
+			if isinstance(sw,dict) and sw.get('widgettype') and \
+					sw.get('widgettype') != 'urlwidget':
+				subwidgets.append(self.getPlan(sw))
+				continue
+			subwidgets.append(sw)
+
+		binds = [ compileValue(b) for b in desc.get('binds',[]) ]
+		return BuildPlan(desc, klass,
+					compileValue(desc.get('options',{})),
+					attributes,
+					subwidgets,
+					binds)
+
+	def getPlan(self,desc:dict):
+		plan = plan_cache.planOf(desc)
+		if plan is not None:
+			return plan
+		key = planKey(desc)
+		plan = plan_cache.get(key)
+		if plan is None:
+			plan = self.compileDesc(desc)
+			plan_cache.put(key, plan)
+		plan_cache.remember(desc, plan)
+		return plan
+
+	def w_build(self,desc):
+		# print('w_build(),desc=',desc)
+		if isinstance(desc, BuildPlan):
+			plan = desc
+			desc = plan.desc
+		else:
+			plan = self.getPlan(desc)
+
+		widget = self.w_create(plan,desc)
+		with instrument.span('build_rest', 'build'):
+			self.build_rest(widget,plan)
+		return widget
+
+	def w_create(self,plan,desc):
+		"""
+		create the widget of plan and set its attributes,
+		subwidgets and binds are not built
+		"""
+		with instrument.span('valueExpr', 'build'):
+			opts = plan.options.evaluate(self)
 		widget = None
 		try:
-			klass = wrap_ready(widgetClass)
-			widget = klass(**opts)
+			with instrument.span('instantiate', 'build',
+						widgettype=plan.desc.get('widgettype')):
+				widget = plan.klass(**opts)
+			instrument.count('widgets')
 		except Exception as e:
-			print('Error:',widgetClass,'not registered')
+			print('Error:',desc['widgettype'],'build failed')
 			print_exc()
-			raise NotExistsObject(widgetClass)
+			raise NotExistsObject(desc['widgettype'])
 
-		if desc.get('id'):
-			widget.widget_id = desc.get('id')
+		if plan.widget_id:
+			widget.widget_id = plan.widget_id
 		
-		widget.build_desc = desc
-		self.build_attributes(widget,desc)
-		self.build_rest(widget,desc)
+		widget.build_desc = descCopy(desc)
+		self.build_attributes(widget,plan)
 		return widget
 		
-	def build_attributes(self,widget,desc,t=None):
-		excludes = ['widgettype','options','subwidgets','binds']
-		for k,v in [(k,v) for k,v in desc.items() if k not in excludes]:
-			if isinstance(v,dict) and v.get('widgettype'):
+	def build_attributes(self,widget,plan,t=None):
+		for k,v in plan.attributes:
+			if isinstance(v,BuildPlan):
 				b = Blocks()
 				w = b.w_build(v)
 				if hasattr(widget,k):
@@ -330,23 +691,49 @@ class Blocks(EventDispatcher):
 						continue
 				setattr(widget,k,w)
 				continue
-			setattr(widget,k,self.valueExpr(v,\
-						localnamespace={'self':widget}))
+			setattr(widget,k,v.evaluate(self, {'self':widget}))
 
-	def build_rest(self, widget,desc,t=None):
-		self.subwidget_total = len(desc.get('subwidgets',[]))
+	def build_rest(self, widget,plan,t=None):
+		self.subwidget_total = len(plan.subwidgets)
 		self.subwidgets = [ None for i in range(self.subwidget_total)]
-		pos = 0
-		for pos,sw in enumerate(desc.get('subwidgets',[])):
+		loading = []
+		for sw in plan.subwidgets:
 			b = Blocks()
-			kw = sw.copy()
-			w = b.widgetBuild(kw)
+			if isinstance(sw,BuildPlan):
+				w = b.widgetBuild(sw)
+			else:
+				w = b.asyncWidgetBuild(sw.copy())
+				if isinstance(w,UrlWidgetHolder):
+					loading.append(b)
 			widget.add_widget(w)
+		self.buildBinds(widget,plan,loading)
 
-		for b in desc.get('binds',[]):
-			kw = self.valueExpr(b.copy(), \
-						localnamespace={'self':widget})
-			self.buildBind(widget,kw)
+	def buildBinds(self,widget,plan,loading=[]):
+		"""
+		build the binds of plan, a bind to a widget not found while
+		urlwidget subwidgets are still loading (the Blocks in loading)
+		is built again when they are all done
+		"""
+		missed = []
+		for b in plan.binds:
+			with instrument.span('bind', 'build'):
+				kw = b.evaluate(self, {'self':widget})
+				if loading and Blocks.getWidgetById(kw.get('wid','self'),
+								from_widget=widget) is None:
+					missed.append(kw)
+					continue
+				self.buildBind(widget,kw)
+		if not missed:
+			return
+
+		state = {"pending":len(loading)}
+		def done(*args):
+			state['pending'] -= 1
+			if state['pending'] == 0:
+				for kw in missed:
+					self.buildBind(widget,kw)
+		for b in loading:
+			b.bind(on_built=done,on_failed=done)
 
 	def buildBind(self,widget,desc):
 		wid = desc.get('wid','self')
@@ -374,28 +761,17 @@ class Blocks(EventDispatcher):
 		for a in desc['actions']:
 			new_desc = mydesc.copy()
 			new_desc.update(a)
-			self.unication(widget,new_desc, **args)
+			self.uniaction(widget,new_desc, *args)
 
 	def uniaction(self,widget,desc, *args):
 		Logger.info('Block: uniaction() called, desc=%s', str(desc))
 			
 		acttype = desc.get('actiontype')
-		if acttype=='blocks':
-			return self.blocksAction(widget,desc, *args)
-		if acttype=='urlwidget':
-			return self.urlwidgetAction(widget,desc, *args)
-		if acttype == 'registedfunction':
-			return self.registedfunctionAction(widget,desc, *args)
-		if acttype == 'script':
-			return self.scriptAction(widget, desc, *args)
-		if acttype == 'method':
-			return self.methodAction(widget, desc, *args)
-		if acttype == 'event':
-			return self.eventAction(widget, desc, *args)
-		if acttype == 'multiple':
-			return self.MultipleAction(widget, desc, *args)
-
-		alert("actiontype(%s) invalid" % acttype,title='error')
+		handler = action_handlers.get(acttype)
+		if handler is None:
+			alert("actiontype(%s) invalid" % acttype,title='error')
+			return
+		return getattr(self, handler)(widget, desc, *args)
 
 	def eventAction(self, widget, desc, *args):
 		target = Blocks.getWidgetById(desc.get('target','self'),widget)
@@ -404,7 +780,7 @@ class Blocks(EventDispatcher):
 			Logger.info('Block: eventAction():desc(%s) miss dispatch_event',
 							str(desc))
 			return
-		params = desc.get('params',{})
+		params = desc.get('params',{}).copy()
 		d = self.getActionData(widget,desc)
 		if d:
 			params.update(d)
@@ -440,7 +816,7 @@ class Blocks(EventDispatcher):
 		b = Blocks()
 		b.bind(on_built=partial(doit,target,add_mode))
 		b.bind(on_failed=doerr)
-		b.widgetBuild(opts)
+		b.asyncWidgetBuild(opts)
 		
 	def urlwidgetAction(self,widget,desc, *args):
 		target = Blocks.getWidgetById(desc.get('target','self'),widget)
@@ -463,18 +839,21 @@ class Blocks(EventDispatcher):
 		}
 
 		def doit(target,add_mode,o,w):
+			loaded(target)
 			if add_mode == 'replace':
 				target.clear_widgets()
 			target.add_widget(w)
 
 		def doerr(o,e):
+			loaded(target)
 			Logger.info('Block: urlwidgetAction(): desc=%s widgetBuild error'
 								,str(desc))
 
 		b = Blocks()
 		b.bind(on_built=partial(doit,target,add_mode))
 		b.bind(on_failed=doerr)
-		b.widgetBuild(d)
+		loading(target)
+		b.asyncWidgetBuild(d)
 			
 	def getActionData(self,widget,desc,*args):
 		data = {}
@@ -555,6 +934,127 @@ class Blocks(EventDispatcher):
 		else:
 			alert('%s method not found' % method)
 
+	def resolveUrlwidget(self,desc):
+		"""
+		fetch the urlwidget chain of desc in the calling thread,
+		return the resolved description, None if it failed
+		"""
+		widgettype = desc.get('widgettype')
+		while widgettype == "urlwidget":
+			opts = desc.get('options',{}).copy()
+			extend = desc.get('extend')
+			addon = None
+			if desc.get('extend'):
+				addon = desc.get('extend').copy()
+			url = opts.get('url')
+			if url is None:
+				self.dispatch('on_failed',Exception('miss url'))
+				return None
+			
+			if opts.get('url'):
+				del opts['url']
+			desc = self.getUrlData(url,**opts)
+			if not (isinstance(desc, DictObject) or \
+							isinstance(desc, dict)):
+				print('Block: desc must be a dict object',
+								desc,type(desc))
+				self.dispatch('on_failed',Exception('miss url'))
+				return None
+
+			if addon:
+				desc = dictExtend(desc,addon)
+			widgettype = desc.get('widgettype')
+		if widgettype is None:
+			print('Block: desc must be a dict object',
+						desc,type(desc))
+			return None
+		return desc
+
+	def iterBuild(self,widget,plan,counter):
+		"""
+		generator builds the subwidgets and binds of widget,
+		it yields after each widget is created
+		"""
+		loading = []
+		for sw in plan.subwidgets:
+			b = Blocks()
+			if isinstance(sw,BuildPlan):
+				w = b.w_create(sw,sw.desc)
+				counter['built'] += 1
+				yield
+				yield from b.iterBuild(w,sw,counter)
+				widget.add_widget(w)
+				if hasattr(w,'ready'):
+					w.ready()
+			else:
+				w = b.asyncWidgetBuild(sw.copy())
+				if isinstance(w,UrlWidgetHolder):
+					loading.append(b)
+				widget.add_widget(w)
+				counter['built'] += 1
+			yield
+
+		self.buildBinds(widget,plan,loading)
+
+	def incrementalWidgetBuild(self,desc,frame_budget=None):
+		"""
+		build desc across Clock frames, no more than frame_budget
+		seconds (config.build_frame_budget, default 0.008) of build
+		work in a frame.
+		the top widget is returned at once, its subwidgets are created
+		in later frames, on_progress(built, total) fires after each
+		frame, on_built fires and ready() is called when the tree is
+		complete
+		"""
+		if frame_budget is None:
+			config = getConfig()
+			frame_budget = config.build_frame_budget or 0.008
+		plan = None
+		if isinstance(desc, BuildPlan):
+			plan = desc
+			desc = plan.desc
+		else:
+			if not isinstance(desc,(dict,DictObject)):
+				self.dispatch('on_failed',Exception('miss url'))
+				return None
+			if desc.get('widgettype') == 'urlwidget':
+				# resolved in worker threads, comes back here when done
+				return self.asyncWidgetBuild(desc)
+		try:
+			if plan is None:
+				plan = self.getPlan(desc)
+			widget = self.w_create(plan,desc)
+		except Exception as e:
+			self.dispatch('on_failed',e)
+			return None
+
+		counter = {
+			"built":1,
+			"total":plan.widgetCount()
+		}
+		steps = self.iterBuild(widget,plan,counter)
+		def step(t):
+			start = time.perf_counter()
+			try:
+				while time.perf_counter() - start < frame_budget:
+					next(steps)
+			except StopIteration:
+				self.dispatch('on_progress',counter['built'],
+								counter['total'])
+				self.dispatch('on_built',widget)
+				if hasattr(widget,'ready'):
+					widget.ready()
+				return
+			except Exception as e:
+				print_exc()
+				self.dispatch('on_failed',e)
+				return
+			self.dispatch('on_progress',counter['built'],counter['total'])
+			Clock.schedule_once(step,0)
+
+		Clock.schedule_once(step,0)
+		return widget
+
 	def widgetBuild(self,desc):
 		"""
 		desc format:
@@ -567,16 +1067,18 @@ class Blocks(EventDispatcher):
 			binds:[
 			]
 		}
+		desc also can be a BuildPlan returned by Blocks.getPlan()
 		"""
 		def doit(desc):
-			if not isinstance(desc,dict):
+			if not isinstance(desc,(dict,BuildPlan)):
 				Logger.info('Block: desc must be a dict object',
 							desc,type(desc))
 				return None
 
 			# desc = self.valueExpr(desc)
 			try:
-				widget = self.w_build(desc)
+				with instrument.span('build', 'build'):
+					widget = self.w_build(desc)
 				self.dispatch('on_built',widget)
 				if hasattr(widget,'ready'):
 					widget.ready()
@@ -585,40 +1087,17 @@ class Blocks(EventDispatcher):
 				self.dispatch('on_failed',e)
 				return None
 
+		if isinstance(desc, BuildPlan):
+			return doit(desc)
+
 		if not (isinstance(desc, DictObject) or isinstance(desc, dict)):
 			print('Block: desc must be a dict object',
 						desc,type(desc))
 			self.dispatch('on_failed',Exception('miss url'))
 			return
 
-		widgettype = desc.get('widgettype')
-		while widgettype == "urlwidget":
-			opts = desc.get('options',{}).copy()
-			extend = desc.get('extend')
-			addon = None
-			if desc.get('extend'):
-				addon = desc.get('extend').copy()
-			url = opts.get('url')
-			if url is None:
-				self.dispatch('on_failed',Exception('miss url'))
-				return
-			
-			if opts.get('url'):
-				del opts['url']
-			desc = self.getUrlData(url,**opts)
-			if not (isinstance(desc, DictObject) or \
-							isinstance(desc, dict)):
-				print('Block: desc must be a dict object',
-								desc,type(desc))
-				self.dispatch('on_failed',Exception('miss url'))
-				return
-
-			if addon:
-				desc = dictExtend(desc,addon)
-			widgettype = desc.get('widgettype')
-		if widgettype is None:
-			print('Block: desc must be a dict object',
-						desc,type(desc))
+		desc = self.resolveUrlwidget(desc)
+		if desc is None:
 			return None
 		return doit(desc)
 	
@@ -645,6 +1124,25 @@ class Blocks(EventDispatcher):
 					if w:
 						return find_widget_by_id(id, w)
 			return None
+		def index_find(id, from_widget):
+			if id=='self':
+				return from_widget
+			if getattr(from_widget,'widget_id',None) == id:
+				return from_widget
+			w = getattr(from_widget, id, None)
+			if isinstance(w,Widget):
+				return w
+			w = widget_index.find(id, from_widget)
+			if w is not None:
+				return w
+			app = App.get_running_app()
+			if app and from_widget == app.root and Window.fullscreen == True:
+				if getattr(app,'fs_widget',None):
+					w = widget_index.find(id, app.fs_widget)
+					if w is not None:
+						return w
+			return find_widget_by_id(id, from_widget)
+
 		ids = id.split('.')
 		app = App.get_running_app()
 		if id.startswith('/self') or id.startswith('root'):
@@ -653,18 +1151,26 @@ class Blocks(EventDispatcher):
 		if from_widget is None:
 			from_widget = app.root
 		for id in ids:
-			w = find_widget_by_id(id,from_widget=from_widget)
+			w = index_find(id,from_widget=from_widget)
 			if w is None:
 				return None
 			from_widget = w
 		return w
 
+	@classmethod
+	def widgetIndexStats(self):
+		return widget_index.stats()
+
 	def on_built(self,v=None):
 		return
 
 	def on_failed(self,e=None):
 		return
 
+	def on_progress(self,built,total):
+		return
+
 Factory.register('Blocks',Blocks)
+Factory.register('InstrumentOverlay',InstrumentOverlay)
 Factory.register('Video',Video)
 Factory.register('OrientationLayout', OrientationLayout)
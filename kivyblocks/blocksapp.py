@@ -27,10 +27,15 @@ Config.set('kivy', 'default_font', [
 
 from kivy.app import App
 from kivy.utils import platform
-from .threadcall import HttpClient,Workers
+from .threadcall import HttpClient,Workers,SessionPool
+from .httpcache import HttpCache
+from .resilience import Resilience
+from .instrument import instrument
 from .utils import *
 from .pagescontainer import PageContainer
-from .blocks import Blocks
+from .blocks import Blocks, UrlWidgetHolder
+from .buildplan import plan_cache
+from .prefetch import Prefetcher
 from .theming import ThemeManager
 from appPublic.rsa import RSA
 if platform == 'android':
@@ -91,14 +96,34 @@ class BlocksApp(App):
 		self.workers = Workers(maxworkers=config.maxworkers or 80)
 		self.workers.start()
 		self.running = True
+		self.setupInstrument()
 		blocks = Blocks()
 		print(config.root)
-		x = blocks.widgetBuild(config.root)
+		# a urlwidget root is loaded in worker threads, a placeholder
+		# is shown until it is built
+		x = blocks.asyncWidgetBuild(config.root)
 		if x is None:
-			alert('buildError,Exit', title='Error')
-			self.on_close()
+			self.build_failed()
+			return x
+		if isinstance(x, UrlWidgetHolder):
+			blocks.bind(on_failed=self.build_failed)
+		Prefetcher().start(config.root)
 		return x
 
+	def build_failed(self, *args):
+		alert('buildError,Exit', title='Error')
+		self.on_close()
+
+	def setupInstrument(self):
+		instrument.configure()
+		instrument.addProvider('workers', self.workers.stats)
+		instrument.addProvider('sessions', lambda:SessionPool().stats())
+		instrument.addProvider('http_cache', lambda:HttpCache().stats())
+		instrument.addProvider('resilience', lambda:Resilience().stats())
+		instrument.addProvider('plan_cache', plan_cache.stats)
+		instrument.addProvider('expression', Blocks.exprStats)
+		instrument.addProvider('widget_index', Blocks.widgetIndexStats)
+
 	def get_user_data_path(self):
 		if platform == 'android':
 			Environment = autoclass('android.os.Environment')
@@ -149,6 +174,7 @@ class BlocksApp(App):
 		self.public_headers.update(device)
 
 	def on_close(self, *args):
-		self.workers.running = False
+		self.workers.shutdown()
+		instrument.dump()
 		return False
 
@@ -174,7 +174,7 @@ class BoxViewer(WidgetReady, BoxLayout):
 
 		blocks = Factory.Blocks()
 		blocks.bind(on_built=partial(add2box,box))
-		blocks.widgetBuild(desc)
+		blocks.asyncWidgetBuild(desc)
 
 	def on_scroll_stop(self,o,v=None):
 		if o.scroll_y <= 0.001:
@@ -0,0 +1,237 @@
+import json
+from threading import Lock
+from collections import OrderedDict
+from traceback import print_exc
+
+from appPublic.dictObject import DictObject
+
+"""
+build plan is the compiled form of a widget description,
+Blocks.w_build() walks the description, evaluates every option and
+resolves the widget class every time it builds a widget, a BuildPlan
+does the walking once:
+	widget class is resolved,
+	constant values are folded,
+	"py::" expressions are compiled to code objects,
+	subwidgets and attribute widgets are compiled to sub plans
+and Blocks uses the plan to instantiate widgets without re-parsing
+the description.
+"""
+
+class ConstValue:
+	is_const = True
+	def __init__(self, value):
+		self.value = value
+
+	def evaluate(self, blocks, localnamespace={}):
+		return self.value
+
+class ExprValue:
+	is_const = False
+	def __init__(self, src, code):
+		self.src = src
+		self.code = code
+
+	def evaluate(self, blocks, localnamespace={}):
+		try:
+			return blocks.eval(self.code, localnamespace)
+		except Exception as e:
+			print('Exception .... ',e,'script=',self.src)
+			print_exc()
+			return self.src
+
+class ListValue:
+	def __init__(self, items):
+		self.items = items
+		self.is_const = all(i.is_const for i in items)
+
+	def evaluate(self, blocks, localnamespace={}):
+		return [ i.evaluate(blocks, localnamespace) for i in self.items ]
+
+class DictValue:
+	def __init__(self, items):
+		self.items = items
+		self.is_const = all(v.is_const for k,v in items)
+
+	def evaluate(self, blocks, localnamespace={}):
+		return { k:v.evaluate(blocks, localnamespace) \
+						for k,v in self.items }
+
+def compileExpr(s):
+	"""
+	compile the "py::" expression into a code object,
+	a bad expression is folded to the stripped string, the same thing
+	Blocks.strValueExpr() returns when the evaluation fails
+	"""
+	s = s[4:]
+	try:
+		return ExprValue(s, compile(s, '<py::>', 'eval'))
+	except Exception as e:
+		print('Exception .... ',e,'script=',s)
+		return ConstValue(s)
+
+def compileValue(v):
+	if isinstance(v, str):
+		if v.startswith('py::'):
+			return compileExpr(v)
+		return ConstValue(v)
+	if isinstance(v, list):
+		return ListValue([ compileValue(i) for i in v ])
+	if isinstance(v, (dict, DictObject)):
+		return DictValue([ (k, compileValue(i)) for k,i in v.items() ])
+	return ConstValue(v)
+
+class BuildPlan:
+	"""
+	compiled widget description
+	klass: ready widget class
+	options: compiled options, evaluate it to get the constructor kwargs
+	attributes: [(name, sub plan or compiled value)]
+	subwidgets: [sub plan or description], urlwidget descriptions keep
+		their description form, they need to fetch data from network
+	binds: [compiled bind description]
+	"""
+	def __init__(self, desc, klass, options, attributes,
+					subwidgets, binds):
+		self.desc = desc
+		self.klass = klass
+		self.widget_id = desc.get('id')
+		self.options = options
+		self.attributes = attributes
+		self.subwidgets = subwidgets
+		self.binds = binds
+		self.widget_count = None
+
+	def usesClass(self, classname):
+		"""
+		True if the plan or a sub plan builds a classname widget
+		"""
+		if self.desc.get('widgettype') == classname:
+			return True
+		for k, v in self.attributes:
+			if isinstance(v, BuildPlan) and v.usesClass(classname):
+				return True
+		for sw in self.subwidgets:
+			if isinstance(sw, BuildPlan) and sw.usesClass(classname):
+				return True
+		return False
+
+	def widgetCount(self):
+		"""
+		widgets this plan builds, urlwidget subwidgets count one
+		"""
+		if self.widget_count is None:
+			cnt = 1
+			for sw in self.subwidgets:
+				if isinstance(sw, BuildPlan):
+					cnt += sw.widgetCount()
+				else:
+					cnt += 1
+			self.widget_count = cnt
+		return self.widget_count
+
+def planKey(desc):
+	try:
+		return json.dumps(desc, sort_keys=True, default=str)
+	except Exception:
+		return None
+
+class PlanCache:
+	"""
+	LRU cache for BuildPlan, keyed by the content of the description
+	(planKey()), so a description changed in place gets a new plan.
+	descriptions nobody changes, the ones DescCache keeps, are marked
+	with own(), their plans are found by identity without serializing
+	them.
+	"""
+	def __init__(self, maxsize=256):
+		self.maxsize = maxsize
+		self.plans = OrderedDict()
+		self.known = OrderedDict()
+		self.lock = Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def lru_put(self, d, key, value):
+		d[key] = value
+		d.move_to_end(key)
+		while len(d) > self.maxsize:
+			d.popitem(last=False)
+
+	def own(self, desc):
+		"""
+		mark desc read-only, its plan is remembered by identity, the
+		entry keeps desc alive so its id is not reused while it is cached
+		"""
+		with self.lock:
+			x = self.known.get(id(desc))
+			if x is None or x[0] is not desc:
+				self.lru_put(self.known, id(desc), (desc, None))
+
+	def planOf(self, desc):
+		"""
+		the plan compiled from an owned desc object, None if it is not
+		owned or not compiled yet
+		"""
+		with self.lock:
+			x = self.known.get(id(desc))
+			if x is None or x[0] is not desc or x[1] is None:
+				return None
+			self.known.move_to_end(id(desc))
+			self.hits += 1
+			return x[1]
+
+	def remember(self, desc, plan):
+		"""
+		keep the plan of desc by identity if desc is owned
+		"""
+		with self.lock:
+			x = self.known.get(id(desc))
+			if x is not None and x[0] is desc:
+				self.known[id(desc)] = (desc, plan)
+
+	def get(self, key):
+		if key is None:
+			return None
+		with self.lock:
+			plan = self.plans.get(key)
+			if plan is None:
+				self.misses += 1
+				return None
+			self.plans.move_to_end(key)
+			self.hits += 1
+			return plan
+
+	def put(self, key, plan):
+		if key is None:
+			return
+		with self.lock:
+			self.lru_put(self.plans, key, plan)
+
+	def dropClass(self, classname):
+		"""
+		drop the plans building classname widgets
+		"""
+		with self.lock:
+			for k in [ k for k, p in self.plans.items() \
+						if p.usesClass(classname) ]:
+				del self.plans[k]
+			for k in [ k for k, x in self.known.items() \
+						if x[1] is not None and x[1].usesClass(classname) ]:
+				self.known[k] = (self.known[k][0], None)
+
+	def clear(self):
+		with self.lock:
+			self.plans.clear()
+			self.known.clear()
+
+	def stats(self):
+		return {
+			"size":len(self.plans),
+			"known":len(self.known),
+			"maxsize":self.maxsize,
+			"hits":self.hits,
+			"misses":self.misses
+		}
+
+plan_cache = PlanCache()
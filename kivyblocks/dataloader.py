@@ -1,5 +1,6 @@
 
 from kivy.event import EventDispatcher
+from kivy.uix.widget import Widget
 from .threadcall import HttpClient
 from .utils import absurl
 from appPublic.registerfunction import RegisterFunction
@@ -10,9 +11,13 @@ class DataLoader(EventDispatcher):
 		EventDispatcher.__init__(self)
 		self.register_event_type('on_success')
 		self.register_event_type('on_error')
+		self.register_event_type('on_rows')
 
 	def success(self,o,d):
 		self.dispatch('on_success',d)
+
+	def rows(self,o,rows):
+		self.dispatch('on_rows',rows)
 	
 	def error(self,o,e):
 		self.dispatch('on_error',e)
@@ -22,6 +27,9 @@ class DataLoader(EventDispatcher):
 
 	def on_error(self,e):
 		pass
+
+	def on_rows(self,rows):
+		pass
 	
 	def load(self):
 		pass
@@ -36,11 +44,25 @@ class HttpDataLoader(DataLoader):
 			"rows":self.data_user.page_rows
 		})
 		hc = HttpClient()
+		widget = self.data_user.target
+		if not isinstance(widget, Widget):
+			widget = None
+		if self.data_user.options.get('stream_rows'):
+			hc.getRows(url,
+					method=method,
+					params=params,
+					on_rows=self.rows,
+					callback=self.success,
+					errback=self.error,
+					widget=widget)
+			return
 		hc(url,
 				method=method,
 				params=params,
+				headers=hc.dataHeaders(),
 				callback=self.success,
-				errback=self.error)
+				errback=self.error,
+				widget=widget)
 
 class ListDataLoader(DataLoader):
 	def load(self):
@@ -0,0 +1,307 @@
+import os
+import time
+import json
+import codecs
+import hashlib
+from functools import partial
+from threading import Lock
+from collections import OrderedDict
+
+from kivy.app import App
+from appPublic.Singleton import SingletonDecorator
+from appPublic.jsonConfig import getConfig
+
+from .threadcall import HttpClient, decodeResponse, single_flight
+from .httpcache import parseCacheControl, toInt
+from .buildplan import plan_cache
+
+"""
+cache for the ui descriptions Blocks.getUrlData() loads
+
+remote descriptions are kept in a memory LRU and in json files under
+the app's user_data_dir/desc_cache, keyed by url, params and the login
+session and cookies the request goes with (HttpClient.cacheScope()),
+so a description is never served to another session.
+a cached description is used without network access while it is
+fresh, for the response's Cache-Control max-age, or desc_cache_ttl
+seconds without Cache-Control, an older one is revalidated with a
+conditional GET (If-None-Match/If-Modified-Since), and it is still used
+when the server can not be reached, so the app can start offline.
+Cache-Control: no-store descriptions are not cached, no-cache ones
+are revalidated every time.
+the files are evicted, least recently used first, when they take more
+than desc_cache_max_bytes.
+
+file:// descriptions are kept in memory until the file's mtime changes.
+
+config:
+	desc_cache_ttl: seconds, default 0
+	desc_cache_size: memory entries, default 128
+	desc_cache_dir: folder, default user_data_dir/desc_cache
+	desc_cache_max_bytes: bytes on disk, default 20971520
+
+cached descriptions are shared and read-only, PlanCache finds their
+plans by identity (PlanCache.own())
+"""
+
+def cacheKey(url, params={}, scope=None):
+	s = json.dumps([url, params, scope], sort_keys=True, default=str)
+	return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+@SingletonDecorator
+class DescCache:
+	def __init__(self):
+		config = getConfig()
+		self.ttl = config.desc_cache_ttl or 0
+		self.maxsize = config.desc_cache_size or 128
+		self.cache_dir = config.desc_cache_dir
+		self.max_bytes = config.desc_cache_max_bytes or 20 * 1024 * 1024
+		self.disk_bytes = None
+		self.entries = OrderedDict()
+		self.lock = Lock()
+		self.disk_lock = Lock()
+		self.hits = 0
+		self.misses = 0
+		self.revalidated = 0
+		self.stale_used = 0
+		self.evicted = 0
+
+	def getCacheDir(self):
+		if self.cache_dir is None:
+			app = App.get_running_app()
+			self.cache_dir = os.path.join(app.user_data_dir, 'desc_cache')
+		if not os.path.isdir(self.cache_dir):
+			os.makedirs(self.cache_dir, exist_ok=True)
+		return self.cache_dir
+
+	def remember(self, key, entry):
+		plan_cache.own(entry['data'])
+		with self.lock:
+			self.entries[key] = entry
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+
+	def get(self, url, params={}, scope=None):
+		key = cacheKey(url, params, scope)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None:
+				self.entries.move_to_end(key)
+				return entry
+		fname = os.path.join(self.getCacheDir(), key + '.json')
+		if not os.path.isfile(fname):
+			return None
+		try:
+			with codecs.open(fname, 'r', 'utf-8') as f:
+				entry = json.load(f)
+			# the files are evicted by mtime, least recently used first
+			os.utime(fname)
+		except Exception as e:
+			print('DescCache: read', fname, 'error', e)
+			return None
+		self.remember(key, entry)
+		return entry
+
+	def put(self, url, params, data, etag=None, last_modified=None,
+				max_age=None, scope=None):
+		key = cacheKey(url, params, scope)
+		entry = {
+			"url":url,
+			"params":params,
+			"etag":etag,
+			"last_modified":last_modified,
+			"max_age":self.ttl if max_age is None else max_age,
+			"fetched_at":time.time(),
+			"data":data
+		}
+		self.remember(key, entry)
+		self.save(key, entry)
+		return entry
+
+	def delete(self, url, params={}, scope=None):
+		key = cacheKey(url, params, scope)
+		with self.lock:
+			self.entries.pop(key, None)
+		fname = os.path.join(self.getCacheDir(), key + '.json')
+		with self.disk_lock:
+			self.diskBytes()
+			try:
+				size = os.path.getsize(fname)
+				os.remove(fname)
+				self.disk_bytes -= size
+			except OSError:
+				pass
+
+	def diskBytes(self):
+		"""
+		bytes the cache files take, counted once, call with disk_lock
+		"""
+		if self.disk_bytes is None:
+			self.disk_bytes = sum(e.stat().st_size for e in \
+						os.scandir(self.getCacheDir()) \
+						if e.name.endswith('.json'))
+		return self.disk_bytes
+
+	def save(self, key, entry):
+		fname = os.path.join(self.getCacheDir(), key + '.json')
+		tmpname = fname + '.tmp'
+		with self.disk_lock:
+			self.diskBytes()
+			try:
+				old = os.path.getsize(fname) if os.path.isfile(fname) else 0
+				with codecs.open(tmpname, 'w', 'utf-8') as f:
+					json.dump(entry, f)
+				size = os.path.getsize(tmpname)
+				os.replace(tmpname, fname)
+				self.disk_bytes += size - old
+			except Exception as e:
+				print('DescCache: write', fname, 'error', e)
+				return
+			if self.disk_bytes > self.max_bytes:
+				self.evict(keep=fname)
+
+	def evict(self, keep=None):
+		"""
+		remove the least recently used files until the cache files
+		fit in max_bytes, call with disk_lock
+		"""
+		files = sorted((e.stat().st_mtime, e.path, e.stat().st_size) \
+					for e in os.scandir(self.getCacheDir()) \
+					if e.name.endswith('.json') and e.path != keep)
+		for mtime, path, size in files:
+			if self.disk_bytes <= self.max_bytes:
+				return
+			try:
+				os.remove(path)
+				self.disk_bytes -= size
+				self.evicted += 1
+			except OSError:
+				pass
+
+	def isFresh(self, entry):
+		max_age = entry.get('max_age', self.ttl)
+		return time.time() - entry.get('fetched_at', 0) < max_age
+
+	def scope(self, url):
+		return HttpClient().cacheScope(url)
+
+	def peek(self, url, params={}):
+		"""
+		the description of url if a fresh copy is in memory, else None,
+		it never touches the disk or the network
+		"""
+		key = cacheKey(url, params, self.scope(url))
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None or not self.isFresh(entry):
+				return None
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return entry['data']
+
+	def fetch(self, url, params={}, headers={}):
+		"""
+		return the description of url, from cache if it is fresh,
+		else revalidate or download it
+		"""
+		scope = self.scope(url)
+		entry = self.get(url, params, scope)
+		if entry is not None and self.isFresh(entry):
+			self.hits += 1
+			return entry['data']
+
+		key = single_flight.key('GET', url, params, [headers, scope])
+		if key is None:
+			return self.download(url, params, headers, entry, scope)
+		return single_flight.run(key,
+				partial(self.download, url, params, headers, entry, scope))
+
+	def policy(self, resp):
+		"""
+		max_age of the response, None if it must not be cached
+		"""
+		cc = parseCacheControl(resp.headers.get('Cache-Control'))
+		if 'no-store' in cc:
+			return None
+		if 'no-cache' in cc:
+			return 0
+		if 'max-age' in cc:
+			return toInt(cc['max-age'])
+		return self.ttl
+
+	def download(self, url, params, headers, entry, scope=None):
+		"""
+		revalidate the cached entry or download the description,
+		concurrent fetches of the same url share one download
+		"""
+		h = headers.copy()
+		if entry is not None:
+			if entry.get('etag'):
+				h['If-None-Match'] = entry['etag']
+			if entry.get('last_modified'):
+				h['If-Modified-Since'] = entry['last_modified']
+		hc = HttpClient()
+		try:
+			resp = hc._webcall(url, method='GET', params=params, headers=h)
+		except Exception as e:
+			if entry is None:
+				self.misses += 1
+				raise e
+			print('DescCache: use cached', url, 'error', e)
+			self.stale_used += 1
+			return entry['data']
+
+		if entry is not None and resp.status_code == 304:
+			self.revalidated += 1
+			max_age = self.policy(resp)
+			entry = self.put(url, params, entry['data'],
+						etag=entry.get('etag'),
+						last_modified=entry.get('last_modified'),
+						max_age=entry.get('max_age') if max_age is None \
+							else max_age,
+						scope=scope)
+			return entry['data']
+		self.misses += 1
+		data = decodeResponse(resp)
+		max_age = self.policy(resp)
+		if max_age is None:
+			if entry is not None:
+				self.delete(url, params, scope)
+			return data
+		self.put(url, params, data,
+					etag=resp.headers.get('ETag'),
+					last_modified=resp.headers.get('Last-Modified'),
+					max_age=max_age,
+					scope=scope)
+		return data
+
+	def readFile(self, filename):
+		mtime = os.path.getmtime(filename)
+		key = 'file://' + filename
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None and entry['mtime'] == mtime:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return entry['data']
+		self.misses += 1
+		with codecs.open(filename,'r','utf-8') as f:
+			data = json.loads(f.read())
+		self.remember(key, {'mtime':mtime, 'data':data})
+		return data
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self):
+		return {
+			"size":len(self.entries),
+			"hits":self.hits,
+			"misses":self.misses,
+			"revalidated":self.revalidated,
+			"stale_used":self.stale_used,
+			"evicted":self.evicted,
+			"disk_bytes":self.disk_bytes
+		}
@@ -2,10 +2,15 @@ import time
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import ButtonBehavior
 from kivy.clock import Clock
+from kivy.logger import Logger
 from kivy.properties import BooleanProperty
+from kivy.properties import NumericProperty
 from kivy.properties import ListProperty
 from kivy.graphics import Color, Rectangle
 from kivy.app import App
@@ -22,6 +27,9 @@ from .paging import Paging, RelatedLoader
 from .ready import WidgetReady
 from .toolbar import Toolbar
 from .bgcolorbehavior import BGColorBehavior
+from .rowstore import RowStore
+from .gridquery import GridQuery
+from .threadcall import Cancelled
 
 class BLabel(ButtonBehavior, Text):
 	def __init__(self, **kw):
@@ -41,10 +49,14 @@ class Cell(BoxLayout):
 		"""
 		self.desc = desc
 		self.row = row
+		self.label = None
 		super().__init__(size_hint=(None,None),
 							width = self.desc['width'],
 							height = self.row.part.datagrid.rowHeight()
 		)
+		self.build()
+
+	def build(self):
 		if not self.row.header and self.desc.get('viewer'):
 			viewer = self.desc.get('viewer')
 			blocks = Factory.Blocks()
@@ -53,23 +65,35 @@ class Cell(BoxLayout):
 				l['row'] = self.row
 				viewer = blocks.eval(viewer,l)
 			if isinstance(viewer,dict):
-				print('viewer = ', viewer)
-				w = blocks.widgetBuild(viewer)
+				w = blocks.asyncWidgetBuild(viewer)
 				self.add_widget(w)
 				return
-		if desc['header']:
-			bl = Text(i18n=True, text=str(desc['value']),
+		if self.desc['header']:
+			bl = Text(i18n=True, text=str(self.desc['value']),
 				font_size=CSize(1),
 				halign='left'
 			)
 		else:
-			bl = BLabel(text = str(desc['value']), 
+			bl = BLabel(text = str(self.desc['value']), 
 					font_size=CSize(1),
 					halign='left'
 			)
+		self.label = bl
 		self.add_widget(bl)
 		bl.bind(on_press=self.cell_press)
 
+	def setValue(self, value):
+		"""
+		show another value, used when a recycled row is rebound
+		"""
+		self.desc['value'] = value
+		if self.label is not None and not self.desc.get('viewer'):
+			self.label.text = str(value)
+			return
+		self.label = None
+		self.clear_widgets()
+		self.build()
+
 	def cell_press(self,obj):
 		self.row.selected()
 
@@ -135,33 +159,148 @@ class Header(WidgetReady, BGColorBehavior, ScrollWidget):
 		self.add_widget(self.header)
 		self.height = self.header.height
 
-class Body(ScrollWidget):
+class RowView(RecycleDataViewBehavior, GridLayout):
+	"""
+	a body row, the RecycleView keeps only the visible ones and rebinds
+	them to other records when the body scrolls, so the selection is kept
+	in the body data by row id, row_selected follows it
+	"""
+	row_selected = BooleanProperty(False)
+	def __init__(self, **kw):
+		self.part = None
+		self.header = False
+		self.row_id = None
+		self.index = None
+		self.linewidth = 1
+		self.cells = []
+		super().__init__(spacing=self.linewidth, **kw)
+
+	@property
+	def row_data(self):
+		return self.part.datagrid.storeOf(self.row_id).row(self.row_id)
+
+	def init(self, part):
+		self.part = part
+		self.cols = len(part.rowdesc)
+		store = part.datagrid.storeOf(self.row_id)
+		for f in part.rowdesc:
+			c = f.copy()
+			c['header'] = False
+			c['value'] = store.get(self.row_id, c['name'])
+			cell = Cell(self, c)
+			self.add_widget(cell)
+			self.cells.append(cell)
+
+	def refresh_view_attrs(self, rv, index, data):
+		self.index = index
+		self.row_id = data['row_id']
+		self.row_selected = data.get('selected', False)
+		if self.part is not rv.part:
+			# a cached view of another grid, its cells are kept if the
+			# columns are the same
+			if self.part is None or self.part.rowkey != rv.part.rowkey:
+				self.clear_widgets()
+				self.cells = []
+				self.init(rv.part)
+				return
+			self.part = rv.part
+		store = self.part.datagrid.storeOf(self.row_id)
+		for cell in self.cells:
+			cell.setValue(store.get(self.row_id, cell.desc['name']))
+
+	def selected(self):
+		Logger.debug('DataGrid: row selected %s', self.row_id)
+		self.part.datagrid.selectRow(self.row_id)
+		self.part.datagrid.dispatch('on_selected',self)
+
+rowViewClasses = {}
+
+def rowViewClass(rowkey):
+	"""
+	kivy caches the recycled views by class, a class for every columns
+	layout keeps the rows of the freeze and normal parts apart, and
+	lets grids with the same columns share them
+	"""
+	klass = rowViewClasses.get(rowkey)
+	if klass is None:
+		klass = rowViewClasses[rowkey] = type('RowView', (RowView,), {})
+	return klass
+
+class BodyLayout(RecycleBoxLayout):
+	"""
+	lay out overscan rows more above and below the viewport, so a
+	short scroll shows rows already built
+	"""
+	overscan = NumericProperty(2)
+	def compute_visible_views(self, data, viewport):
+		x, y, w, h = viewport
+		o = self.overscan * (self.default_size[1] + self.spacing)
+		return super().compute_visible_views(data, (x, y - o, w, h + 2 * o))
+
+class Body(RecycleView):
 	def __init__(self,part,**kw):
 		self.part = part
-		ScrollWidget.__init__(self,**kw)
-		self.idRow = {}
+		super().__init__(**kw)
+		rd = self.part.rowdesc
+		width = sum(f['width'] for f in rd) + 2 * len(rd)
+		self.layout = BodyLayout(orientation='vertical',
+						viewclass=rowViewClass(self.part.rowkey),
+						spacing=1,
+						padding=[5,0,5,0],
+						overscan=self.part.datagrid.options.get('overscan',2),
+						default_size=(width, self.getRowHeight()),
+						default_size_hint=(None,None),
+						size_hint=(None,None),
+						width=width + 10)
+		self.layout.bind(minimum_height=self.layout.setter('height'))
+		self.add_widget(self.layout)
 		self.bind(on_scroll_stop=self.part.datagrid.on_scrollstop)
 
-	def addRow(self,id, data,index=0):
-		rd = [ f.copy() for f in self.part.rowdesc ]
-		[ f.update({'value':data.get(f['name'])}) for f in rd ]
-		row = Row(self.part,rd,data=data)
-		row.row_id = id
-		self.add_widget(row,index=index)
-		self.idRow[id] = row
-		return row
+	def addRows(self, ids, index=0):
+		"""
+		show rows of the datagrid rowstore, index counts from the bottom
+		as in add_widget, a negative index puts the rows on the top
+		"""
+		items = [ self.item(id) for id in ids ]
+		pos = 0 if index < 0 else len(self.data) - index
+		self.data = self.data[:pos] + items + self.data[pos:]
+
+	def addRow(self,id, index=0):
+		self.addRows([id], index=index)
+
+	def item(self, id):
+		if id == self.part.datagrid.select_rowid:
+			return {'row_id':id, 'selected':True}
+		return {'row_id':id}
+
+	def setRows(self, ids):
+		self.data = [ self.item(id) for id in ids ]
+
+	def setSelected(self, rowid):
+		"""
+		mark the item of rowid selected and the others not
+		"""
+		changed = False
+		for d in self.data:
+			sel = d['row_id'] == rowid
+			if d.get('selected', False) != sel:
+				d['selected'] = sel
+				changed = True
+		if changed:
+			self.refresh_from_data()
 	
 	def clearRows(self):
-		self.idRow = {}
-		self.clear_widgets()
+		self.data = []
+
+	def delRows(self, ids):
+		ids = set(ids)
+		self.data = [ d for d in self.data if d['row_id'] not in ids ]
 
 	def delRowById(self,id):
-		row = self.idRow[id]
-		self.remove_widget(row)
-		del self.idRow[id]
+		self.delRows([id])
 
 	def getRowData(self,rowid):
-		return self.idRow[rowid].row_data
+		return self.part.datagrid.storeOf(rowid).row(rowid)
 
 	def getRowHeight(self):
 		return self.part.datagrid.rowHeight()
@@ -197,6 +336,9 @@ class DataGridPart(WidgetReady, BoxLayout):
 			r['width'] = CSize(f.get('width',10))
 			rd.append(r)
 		self.rowdesc = rd
+		self.rowkey = (self.datagrid.rowHeight(),
+						tuple((f['name'], f['width'], str(f.get('viewer'))) \
+							for f in rd))
 		self.setWidth()
 		kw = {}
 		if self.freeze_flag:
@@ -219,8 +361,8 @@ class DataGridPart(WidgetReady, BoxLayout):
 	def clearRows(self):
 		return self.body.clearRows()
 
-	def addRow(self,id, data):
-		return self.body.addRow(id, data)
+	def addRow(self,id, **kw):
+		return self.body.addRow(id, **kw)
 
 class DataGrid(WidgetReady, BGColorBehavior, BoxLayout):
 	row_selected = BooleanProperty(False)
@@ -231,6 +373,8 @@ class DataGrid(WidgetReady, BGColorBehavior, BoxLayout):
 		self.color_level = color_level
 		self.radius = radius
 		self.select_rowid = None
+		self.rowstore = RowStore()
+		self.groupstore = RowStore()
 		WidgetReady.__init__(self)
 		BoxLayout.__init__(self,**kw)
 		BGColorBehavior.__init__(self,color_level=color_level,
@@ -266,18 +410,61 @@ class DataGrid(WidgetReady, BGColorBehavior, BoxLayout):
 		self.dataloader.bind(on_newbegin=self.clearRows)
 		self.register_event_type('on_selected')
 		self.register_event_type('on_scrollstop')
+		self.register_event_type('on_query')
+		self.register_event_type('on_query_failed')
+		self.query_spec = options.get('query')
+		self.query_task = None
+		self.requery_task = None
+		self.group_fields = None
+		self.group_part = None
+		self.query_label = None
 		self.createDataGridPart()
 		self.createToolbar()
 		if self.toolbar:
 			self.add_widget(self.toolbar)
 		
-		b = BoxLayout(orientation='horizontal')
-		if self.freeze_part:
-			b.add_widget(self.freeze_part)
-		if self.normal_part:
-			b.add_widget(self.normal_part)
-		self.add_widget(b)
+		self.parts_box = BoxLayout(orientation='horizontal')
+		self.showParts()
+		self.add_widget(self.parts_box)
+		self.showQueryLabel()
+		self.syncing = False
+		self.bindScrollSync()
 	
+	def bindScrollSync(self):
+		"""
+		keep the bodies scrolled together and the header with the normal
+		body while they scroll, not only when the scroll stops
+		"""
+		self.normal_part.body.bind(scroll_y=self.syncScrollY,
+						scroll_x=self.syncScrollX)
+		if self.freeze_part:
+			self.freeze_part.body.bind(scroll_y=self.syncScrollY)
+		if not self.noheader:
+			self.normal_part.header.bind(scroll_x=self.syncScrollX)
+
+	def syncScroll(self, o, name, v, others):
+		if self.syncing:
+			return
+		self.syncing = True
+		try:
+			for w in others:
+				if w is not o and getattr(w, name) != v:
+					setattr(w, name, v)
+		finally:
+			self.syncing = False
+
+	def syncScrollY(self, o, v):
+		bodies = [ self.normal_part.body ]
+		if self.freeze_part:
+			bodies.append(self.freeze_part.body)
+		self.syncScroll(o, 'scroll_y', v, bodies)
+
+	def syncScrollX(self, o, v):
+		ws = [ self.normal_part.body ]
+		if not self.noheader:
+			ws.append(self.normal_part.header)
+		self.syncScroll(o, 'scroll_x', v, ws)
+
 	def locater(self,pos):
 		self.normal_part.body.scroll_y = pos
 		if self.freeze_part:
@@ -285,31 +472,33 @@ class DataGrid(WidgetReady, BGColorBehavior, BoxLayout):
 
 	def on_scrollstop(self,o,v=None):
 		if not self.noheader and o == self.normal_part.header:
-			self.normal_part.body.scroll_x = o.scroll_x
 			return
-		if o == self.normal_part.body:
-			if not self.noheader:
-				self.normal_part.header.scroll_x = o.scroll_x
-			if self.freeze_part:
-				self.freeze_part.body.scroll_y = o.scroll_y
-		if self.freeze_part and o == self.freeze_part.body:
-			self.normal_part.body.scroll_y = o.scroll_y
-
+		if self.query_spec is not None:
+			return
 		if o.scroll_y <= 0.001:
 			self.dataloader.loadNextPage()
 		if o.scroll_y >= 0.999:
 			self.dataloader.loadPreviousPage()
 
+	def selectRow(self, rowid):
+		"""
+		select the row of rowid, None clears the selection
+		"""
+		self.select_rowid = rowid
+		self.row_selected = rowid is not None
+		if self.freeze_part:
+			self.freeze_part.body.setSelected(rowid)
+		self.normal_part.body.setSelected(rowid)
+		if self.group_part:
+			self.group_part.body.setSelected(rowid)
+
 	def getValue(self):
 		if not self.select_rowid:
 			return None
 		return self._getRowData(self.select_rowid)
 	
 	def _getRowData(self, rowid):
-		d = {}
-		if self.freeze_part:
-			d.update(self.freeze_part.body.getRowData(rowid))
-		d.update(self.normal_part.body.getRowData(rowid))
+		d = self.storeOf(rowid).row(rowid)
 		print('getValue() return=',d)
 		return DictObject(**d)
 
@@ -338,43 +527,211 @@ class DataGrid(WidgetReady, BGColorBehavior, BoxLayout):
 
 	def clearRows(self, *args):
 		print('dg.py:clearRows() called')
+		self.rowstore.clear()
+		self.groupstore.clear()
+		self.select_rowid = None
+		self.row_selected = False
 		if self.freeze_part:
 			self.freeze_part.body.clearRows()
 		self.normal_part.body.clearRows()
 
 	def add_page(self,o,data):
-		ids = []
 		recs = data['data']
 		page = data['page']
 		dir = data['dir']
 		idx = 0
 		if dir == 'up':
-			recs.reverse()
 			idx = -1
-		for r in recs:
-			id = self.addRow(r,index=idx)
-			ids.append(id)
+		ids = [ getID() for r in recs ]
+		self.rowstore.addRows(ids, recs)
+		if self.query_spec is not None:
+			self.dataloader.bufferObjects(page,ids)
+			self.requery()
+			return
+		if self.freeze_part:
+			self.freeze_part.body.addRows(ids, index=idx)
+		self.normal_part.body.addRows(ids, index=idx)
 		self.dataloader.bufferObjects(page,ids)
 		x = self.dataloader.getLocater()
 		self.locater(x)
 
 	def delete_page(self,o,data):
 		print('dg.py:delete_page() called')
-		for id in data:
-			self.delRow(id)
+		if self.freeze_part:
+			self.freeze_part.body.delRows(data)
+		self.normal_part.body.delRows(data)
+		self.rowstore.delRows(data)
+		if self.select_rowid in data:
+			self.select_rowid = None
+			self.row_selected = False
+		if self.query_spec is not None:
+			self.requery()
 
 	def addRow(self,data, **kw):
 		id = getID()
-		f_row = None
+		self.rowstore.addRow(id, data)
 		if self.freeze_part:
-			self.freeze_part.body.addRow(id, data, **kw)
-		self.normal_part.body.addRow(id, data, **kw)
+			self.freeze_part.body.addRow(id, **kw)
+		self.normal_part.body.addRow(id, **kw)
 		return id
 
 	def delRow(self,id,**kw):
 		if self.freeze_part:
 			self.freeze_part.body.delRowById(id)
 		self.normal_part.body.delRowById(id)
+		self.rowstore.delRow(id)
+		if self.select_rowid == id:
+			self.select_rowid = None
+			self.row_selected = False
+
+	def storeOf(self, rowid):
+		"""
+		the store of a row, the group rows of a query are kept apart
+		"""
+		if rowid in self.groupstore:
+			return self.groupstore
+		return self.rowstore
+
+	def query(self, spec=None):
+		"""
+		sort, filter and group the buffered rows on a worker thread and
+		show the result, see gridquery for spec.
+		only the rows of the pages the dataloader holds are queried,
+		not the whole data set of dataurl, a "buffered rows only" line
+		says so while a query is on. the query is run again when pages
+		are loaded or deleted, no page is loaded by scrolling while it
+		is on. groups are shown with their own columns, the by fields
+		and the aggregates. query(None) shows the rows as they are
+		loaded. on_query(result) is fired when the result is shown,
+		on_query_failed(e) when the query fails.
+		"""
+		if self.query_task is not None:
+			self.query_task.cancel()
+			self.query_task = None
+		if self.requery_task is not None:
+			self.requery_task.cancel()
+			self.requery_task = None
+		self.query_spec = spec or None
+		self.showQueryLabel()
+		if self.query_spec is None:
+			self.group_fields = None
+			self.showRows(GridQuery().run(self.rowstore).ids)
+			return None
+		q = GridQuery(self.query_spec)
+		self.group_fields = self.groupFields(q) if q.group else None
+		workers = App.get_running_app().workers
+		self.query_task = workers.add(q.run,
+						self.showQuery, self.queryError,
+						kwargs={'store':self.rowstore},
+						widget=self)
+		return self.query_task
+
+	def requery(self):
+		if self.requery_task is not None:
+			self.requery_task.cancel()
+		self.requery_task = Clock.schedule_once(self.rerunQuery, 0.1)
+
+	def rerunQuery(self, t=None):
+		self.requery_task = None
+		if self.query_spec is not None:
+			self.query(self.query_spec)
+
+	def showQuery(self, task, result):
+		if task is not self.query_task:
+			return
+		self.query_task = None
+		if result.groups is not None:
+			ids = [ getID() for g in result.groups ]
+			self.showGroups(ids, result.groups, self.group_fields)
+		else:
+			# rows deleted while the query ran
+			rowstore = self.rowstore
+			self.showRows([ id for id in result.ids if id in rowstore ])
+		self.dispatch('on_query', result)
+
+	def queryError(self, task, e):
+		if task is self.query_task:
+			self.query_task = None
+		if isinstance(e, Cancelled):
+			return
+		Logger.error('DataGrid: query %s failed, %s', self.query_spec, e)
+		self.dispatch('on_query_failed', e)
+
+	def showRows(self, ids):
+		self.groupstore.clear()
+		self.showParts()
+		if self.freeze_part:
+			self.freeze_part.body.setRows(ids)
+		self.normal_part.body.setRows(ids)
+		self.locater(1)
+
+	def showGroups(self, ids, groups, fields):
+		"""
+		show the group records in a part of their own columns
+		"""
+		self.groupstore.clear()
+		self.groupstore.addRows(ids, groups)
+		if self.group_part is None or self.group_part.fields != fields:
+			self.group_part = DataGridPart(self, False, fields)
+		if self.group_part.parent is None:
+			self.parts_box.clear_widgets()
+			self.parts_box.add_widget(self.group_part)
+		self.group_part.body.setRows(ids)
+		self.group_part.body.scroll_y = 1
+
+	def showParts(self):
+		"""
+		show the freeze and normal parts in place of the group part
+		"""
+		if self.freeze_part and self.freeze_part.parent is self.parts_box:
+			return
+		if self.normal_part and self.normal_part.parent is self.parts_box:
+			return
+		self.parts_box.clear_widgets()
+		if self.freeze_part:
+			self.parts_box.add_widget(self.freeze_part)
+		if self.normal_part:
+			self.parts_box.add_widget(self.normal_part)
+
+	def groupFields(self, q):
+		"""
+		the columns of the group records of GridQuery q, the by fields
+		as the grid shows them and the aggregates
+		"""
+		fields = { f['name']:f for f in self.options['fields'] }
+		fs = []
+		for name in q.group_by:
+			f = fields.get(name, {'name':name, 'label':name}).copy()
+			f.pop('freeze', None)
+			fs.append(f)
+		for name, op, src in q.aggregates:
+			fs.append({
+				'name':name,
+				'label':name,
+				'width':fields.get(src, {}).get('width', 10)
+			})
+		return fs
+
+	def showQueryLabel(self):
+		if self.query_spec is None:
+			if self.query_label is not None:
+				self.remove_widget(self.query_label)
+				self.query_label = None
+			return
+		if self.query_label is not None:
+			return
+		self.query_label = Text(i18n=True, text='buffered rows only',
+					halign='left',
+					size_hint_y=None,
+					height=self.rowHeight())
+		self.add_widget(self.query_label, index=len(self.children) - 1 \
+					if self.toolbar else len(self.children))
+
+	def on_query(self, result):
+		pass
+
+	def on_query_failed(self, e):
+		pass
 
 	def createToolbar(self):
 		if 'toolbar' in self.options.keys():
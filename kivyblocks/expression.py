@@ -0,0 +1,85 @@
+from types import CodeType
+from threading import Lock
+from collections import OrderedDict
+
+class ExpressionEngine:
+	"""
+	evaluate "py::" expressions for Blocks
+	each source string is compiled once and the code object is kept in
+	a LRU cache, the sandboxed global namespace is built once and reused
+	until invalidate() is called (Blocks.set() and register_widget() do)
+	"""
+	def __init__(self, module_globals, env, forbidens=[], maxsize=1024):
+		self.module_globals = module_globals
+		self.env = env
+		self.forbidens = forbidens
+		self.maxsize = maxsize
+		self.codes = OrderedDict()
+		self.lock = Lock()
+		self.namespace = None
+		self.hits = 0
+		self.misses = 0
+		self.namespace_builds = 0
+
+	def buildNamespace(self):
+		g = {}
+		for k,v in self.module_globals.copy().items():
+			if k not in self.forbidens:
+				g[k] = v
+
+		builtins = self.module_globals['__builtins__']
+		if not isinstance(builtins, dict):
+			builtins = builtins.__dict__
+		g['__builtins__'] = builtins.copy()
+		g['__builtins__']['__import__'] = None
+		g['__builtins__']['__loader__'] = None
+		g['__builtins__']['open'] = None
+		g.update(self.env)
+		self.namespace_builds += 1
+		return g
+
+	def getNamespace(self):
+		g = self.namespace
+		if g is None:
+			with self.lock:
+				if self.namespace is None:
+					self.namespace = self.buildNamespace()
+				g = self.namespace
+		return g
+
+	def invalidate(self):
+		with self.lock:
+			self.namespace = None
+
+	def compile(self, s):
+		with self.lock:
+			code = self.codes.get(s)
+			if code is not None:
+				self.codes.move_to_end(s)
+				self.hits += 1
+				return code
+			self.misses += 1
+		code = compile(s, '<py::>', 'eval')
+		with self.lock:
+			self.codes[s] = code
+			while len(self.codes) > self.maxsize:
+				self.codes.popitem(last=False)
+		return code
+
+	def eval(self, s, localnamespace={}):
+		code = s if isinstance(s, CodeType) else self.compile(s)
+		return eval(code, self.getNamespace(), localnamespace)
+
+	def clear(self):
+		with self.lock:
+			self.codes.clear()
+			self.namespace = None
+
+	def stats(self):
+		return {
+			"size":len(self.codes),
+			"maxsize":self.maxsize,
+			"hits":self.hits,
+			"misses":self.misses,
+			"namespace_builds":self.namespace_builds
+		}
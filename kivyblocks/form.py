@@ -4,10 +4,14 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.boxlayout import BoxLayout
 from kivy.core.window import Window
 from kivy.graphics import Color
-from kivycalendar import DatePicker
 from .responsivelayout import VResponsiveLayout
 from .widgetExt.inputext import FloatInput,IntegerInput, \
 		StrInput,SelectInput, BoolInput, AmountInput, Password
+try:
+	from kivycalendar import DatePicker
+except ImportError:
+	# dates are typed in without the calendar widget
+	DatePicker = StrInput
 from .baseWidget import *
 from .utils import *
 from .i18n import I18n
@@ -0,0 +1,284 @@
+import time
+from operator import le
+from itertools import compress, islice, repeat
+from collections import defaultdict
+
+from .instrument import instrument
+from .rowstore import MISSING
+
+"""
+in memory sort, filter and group of the rows in a RowStore
+
+a query is a dict, every part is optional:
+{
+	"filters":[
+		{"field":"age", "op":">=", "value":18},
+		{"field":"city", "op":"in", "value":["Paris", "Lyon"]},
+		{"field":"name", "op":lambda v:...},
+		lambda record:...
+	],
+	"sort":["city", "-age", {"field":"name", "desc":true}],
+	"group":{
+		"by":["city"],
+		"aggregates":{
+			"age":"avg",
+			"people":"count",
+			"oldest":["max", "age"]
+		}
+	}
+}
+all the filters must match, ops are
+	= != > >= < <= in not_in contains startswith endswith between
+	isnull notnull
+or a function of the field value, a function in place of a filter gets
+the whole record as a dict (slower).
+
+sort keys are applied as stable sorts from the last one, None values go
+last whatever the direction, rows without sort keep their loading order
+(the __posInSet__ field set by PageLoader, then the store order).
+
+a group record has the by fields, the aggregates (count, sum, avg, min,
+max, first, last, an "output":"op" aggregate works on the field of the
+same name) and __ids__, the ids of its rows. sort keys naming group
+fields or aggregates sort the groups.
+
+GridQuery(spec).run(store) returns a QueryResult with
+	ids:	the matched row ids in order
+	groups:	the group records, None without group
+	total:	the count of the matched rows
+	time:	seconds the query took
+"""
+
+POS_FIELD = '__posInSet__'
+
+def _ne(v):
+	return lambda x: x != v
+
+def _cmp(op, v):
+	if op == '>':
+		return lambda x: x is not None and x > v
+	if op == '>=':
+		return lambda x: x is not None and x >= v
+	if op == '<':
+		return lambda x: x is not None and x < v
+	return lambda x: x is not None and x <= v
+
+def _contains(v):
+	return lambda x: x is not None and v in str(x)
+
+def _between(v):
+	lo, hi = v
+	return lambda x: x is not None and lo <= x <= hi
+
+def valueTest(op, v):
+	"""
+	a function of a field value for a filter op
+	"""
+	if callable(op):
+		return op
+	if op in ['=', '==']:
+		return lambda x: x == v
+	if op == '!=':
+		return _ne(v)
+	if op in ['>', '>=', '<', '<=']:
+		return _cmp(op, v)
+	if op == 'in':
+		s = set(v)
+		return lambda x: x in s
+	if op == 'not_in':
+		s = set(v)
+		return lambda x: x not in s
+	if op == 'contains':
+		return _contains(v)
+	if op == 'startswith':
+		return lambda x: x is not None and str(x).startswith(v)
+	if op == 'endswith':
+		return lambda x: x is not None and str(x).endswith(v)
+	if op == 'between':
+		return _between(v)
+	if op == 'isnull':
+		return lambda x: x is None
+	if op == 'notnull':
+		return lambda x: x is not None
+	raise ValueError('unknown filter op %s' % op)
+
+def sortKeys(sort):
+	"""
+	[(field, desc), ...] from "name", "-name" or {"field", "desc"}
+	"""
+	keys = []
+	for k in sort or []:
+		if isinstance(k, str):
+			if k.startswith('-'):
+				keys.append((k[1:], True))
+			else:
+				keys.append((k, False))
+		else:
+			keys.append((k['field'], k.get('desc', False)))
+	return keys
+
+def sortPositions(pos, col, desc):
+	"""
+	stable sort of the positions pos by col[pos], None last
+	"""
+	try:
+		return sorted(pos, key=col.__getitem__, reverse=desc)
+	except TypeError:
+		pass
+	values = [ i for i in pos if col[i] is not None ]
+	nones = [ i for i in pos if col[i] is None ] \
+				if len(values) < len(pos) else []
+	pos = values
+	try:
+		pos.sort(key=col.__getitem__, reverse=desc)
+	except TypeError:
+		pos.sort(key=lambda i:str(col[i]), reverse=desc)
+	return pos + nones
+
+def aggregate(op, values):
+	if op == 'count':
+		return len(values)
+	if op == 'first':
+		return values[0] if values else None
+	if op == 'last':
+		return values[-1] if values else None
+	values = [ v for v in values if v is not None ]
+	if not values:
+		return None
+	if op == 'sum':
+		return sum(values)
+	if op == 'avg':
+		return sum(values) / len(values)
+	if op == 'min':
+		return min(values)
+	if op == 'max':
+		return max(values)
+	raise ValueError('unknown aggregate %s' % op)
+
+class QueryResult:
+	def __init__(self, ids, groups, total, elapsed):
+		self.ids = ids
+		self.groups = groups
+		self.total = total
+		self.time = elapsed
+
+class GridQuery:
+	def __init__(self, spec=None):
+		spec = spec or {}
+		self.spec = spec
+		self.filters = []
+		self.record_filters = []
+		for f in spec.get('filters', []):
+			if callable(f):
+				self.record_filters.append(f)
+			else:
+				self.filters.append((f['field'],
+						valueTest(f.get('op', '='), f.get('value'))))
+		self.sort = sortKeys(spec.get('sort'))
+		self.group = spec.get('group')
+		self.group_by = []
+		self.aggregates = []
+		if self.group:
+			self.group_by = self.group.get('by', [])
+			if isinstance(self.group_by, str):
+				self.group_by = [self.group_by]
+			for name, a in self.group.get('aggregates', {}).items():
+				if isinstance(a, str):
+					self.aggregates.append((name, a, name))
+				else:
+					self.aggregates.append((name, a[0],
+							a[1] if len(a) > 1 else name))
+
+	def fields(self, store):
+		if self.record_filters:
+			return list(dict.fromkeys(list(store.columns.keys()) + \
+						[POS_FIELD]))
+		fs = [ f for f, t in self.filters ] + [ f for f, d in self.sort ] + \
+				self.group_by + [ f for n, op, f in self.aggregates ]
+		return list(dict.fromkeys(fs + [POS_FIELD]))
+
+	def snapshot(self, store):
+		"""
+		ids and column values of the live rows, so the query runs
+		without the store lock while pages are added or deleted
+		"""
+		fields = self.fields(store)
+		with store.lock:
+			if len(store.ids) == len(store.index):
+				ids = store.ids[:]
+				cols = { f:store.columns[f][:] for f in fields \
+							if f in store.columns }
+			else:
+				live = [ id is not None for id in store.ids ]
+				ids = list(compress(store.ids, live))
+				cols = { f:list(compress(store.columns[f], live)) \
+							for f in fields if f in store.columns }
+		for f in fields:
+			c = cols.get(f)
+			if c is None:
+				cols[f] = [None] * len(ids)
+			elif store.hasMissing(f):
+				cols[f] = [ None if v is MISSING else v for v in c ]
+		return ids, cols
+
+	def run(self, store):
+		t = time.perf_counter()
+		with instrument.span('query', 'grid', rows=len(store)):
+			ids, cols = self.snapshot(store)
+			pos = self.filterPositions(ids, cols)
+			total = len(pos)
+			pos = self.sortPositions(pos, cols)
+			groups = None
+			if self.group is not None:
+				groups = self.groupRecords(pos, ids, cols)
+		return QueryResult(list(map(ids.__getitem__, pos)), groups, total,
+					time.perf_counter() - t)
+
+	def filterPositions(self, ids, cols):
+		pos = range(len(ids))
+		for f, test in self.filters:
+			col = cols[f]
+			pos = list(compress(pos, map(test, map(col.__getitem__, pos))))
+		if self.record_filters:
+			names = list(cols.keys())
+			def record(i):
+				return { k:cols[k][i] for k in names }
+			for f in self.record_filters:
+				pos = [ i for i in pos if f(record(i)) ]
+		return list(pos)
+
+	def sortPositions(self, pos, cols):
+		col = cols[POS_FIELD]
+		try:
+			ordered = all(map(le, col, islice(col, 1, None)))
+		except TypeError:
+			ordered = False
+		if not ordered:
+			pos = sortPositions(pos, col, False)
+		for f, desc in reversed(self.sort):
+			pos = sortPositions(pos, cols[f], desc)
+		return pos
+
+	def groupRecords(self, pos, ids, cols):
+		groups = defaultdict(list)
+		keys = [ list(map(cols[f].__getitem__, pos)) for f in self.group_by ]
+		keys = zip(*keys) if keys else repeat((), len(pos))
+		for k, i in zip(keys, pos):
+			groups[k].append(i)
+		records = []
+		for k, members in groups.items():
+			r = dict(zip(self.group_by, k))
+			for name, op, f in self.aggregates:
+				if op == 'count':
+					r[name] = len(members)
+				else:
+					r[name] = aggregate(op,
+							list(map(cols[f].__getitem__, members)))
+			r['__ids__'] = list(map(ids.__getitem__, members))
+			records.append(r)
+		for f, desc in reversed(self.sort):
+			if f in self.group_by or f in [ a[0] for a in self.aggregates ]:
+				col = [ r.get(f) for r in records ]
+				order = sortPositions(list(range(len(records))), col, desc)
+				records = [ records[i] for i in order ]
+		return records
@@ -0,0 +1,365 @@
+import os
+import time
+import json
+import base64
+import sqlite3
+import hashlib
+from copy import deepcopy
+from threading import Lock
+from collections import OrderedDict
+
+from kivy.app import App
+from appPublic.Singleton import SingletonDecorator
+from appPublic.jsonConfig import getConfig
+from appPublic.dictObject import DictObject
+
+"""
+response cache for the GET data calls of HttpClient
+
+a response is cached as the decoded data with its freshness:
+	Cache-Control: no-store, the response is not cached
+	Cache-Control: no-cache, the response is revalidated every time
+	Cache-Control: max-age=N, fresh for N seconds
+	Cache-Control: stale-while-revalidate=N, after it turns stale,
+		it is still served for N seconds while a worker revalidates it
+	no Cache-Control, fresh for http_cache.default_ttl seconds
+	ETag/Last-Modified are used to revalidate with a conditional GET
+entries are keyed by url, params, headers and the scope HttpClient
+gives, the login session and the cookies sent with the request, so a
+user never gets the data cached for another session.
+the cache has a memory tier and a SQLite tier, both LRU, a store is any
+object with get(key)/put(key, entry)/delete(key)/clear()/stats(),
+HttpCache().stores can be replaced to plug other stores in. in the ui
+thread only the memory tier is looked up (peek(memory=True)), the other
+tiers are read by the worker doing the request.
+the SQLite tier keeps data json can encode, bytes are base64 encoded,
+other data is only cached in memory.
+
+the cache is off unless config "http_cache" is true or a dict:
+{
+	"memory_size":entries in memory, default 256,
+	"sqlite":database file, default user_data_dir/http_cache.db,
+		false for memory only,
+	"sqlite_size":bytes in the database, default 20971520,
+	"default_ttl":seconds, default 0,
+	"stale_while_revalidate":seconds, default 0
+}
+"""
+
+def parseCacheControl(s):
+	d = {}
+	for part in (s or '').split(','):
+		part = part.strip().lower()
+		if part == '':
+			continue
+		if '=' in part:
+			k, v = part.split('=', 1)
+			d[k.strip()] = v.strip().strip('"')
+		else:
+			d[part] = True
+	return d
+
+def encodeValue(o):
+	if isinstance(o, (bytes, bytearray)):
+		return {"__bytes__":base64.b64encode(o).decode('ascii')}
+	raise TypeError('%s is not JSON serializable' % type(o))
+
+def decodeValue(d):
+	if len(d) == 1 and '__bytes__' in d:
+		return base64.b64decode(d['__bytes__'])
+	return d
+
+def toInt(v, default=0):
+	try:
+		return int(v)
+	except Exception:
+		return default
+
+class MemoryStore:
+	def __init__(self, maxsize=256):
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+		self.lock = Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None:
+				self.entries.move_to_end(key)
+			return entry
+
+	def put(self, key, entry):
+		with self.lock:
+			self.entries[key] = entry
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+
+	def delete(self, key):
+		with self.lock:
+			self.entries.pop(key, None)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self):
+		return {
+			"store":"memory",
+			"size":len(self.entries),
+			"maxsize":self.maxsize
+		}
+
+class SqliteStore:
+	def __init__(self, filename, maxbytes=20 * 1024 * 1024):
+		self.filename = filename
+		self.maxbytes = maxbytes
+		self.lock = Lock()
+		self.db = sqlite3.connect(filename, check_same_thread=False)
+		self.db.execute("""create table if not exists http_cache (
+	key text primary key,
+	entry text,
+	size integer,
+	used real
+)""")
+		self.db.execute("""create index if not exists http_cache_used
+	on http_cache(used)""")
+		self.db.commit()
+		self.bytes, self.count = self.db.execute("""select
+	coalesce(sum(size),0), count(*) from http_cache""").fetchone()
+
+	def get(self, key):
+		with self.lock:
+			r = self.db.execute("select entry from http_cache where key=?",
+						(key,)).fetchone()
+			if r is None:
+				return None
+			self.db.execute("update http_cache set used=? where key=?",
+						(time.time(), key))
+			self.db.commit()
+		return json.loads(r[0], object_hook=decodeValue)
+
+	def put(self, key, entry):
+		try:
+			txt = json.dumps(entry, default=encodeValue)
+		except (TypeError, ValueError) as e:
+			print('HttpCache: not cached on disk,', entry.get('url'), e)
+			self.delete(key)
+			return
+		with self.lock:
+			r = self.db.execute("select size from http_cache where key=?",
+						(key,)).fetchone()
+			if r is not None:
+				self.bytes -= r[0]
+			else:
+				self.count += 1
+			self.db.execute("""insert or replace into http_cache
+	(key, entry, size, used) values (?,?,?,?)""",
+						(key, txt, len(txt), time.time()))
+			self.bytes += len(txt)
+			self.evict()
+			self.db.commit()
+
+	def evict(self):
+		while self.bytes > self.maxbytes:
+			r = self.db.execute("""select key, size from http_cache
+	order by used limit 1""").fetchone()
+			if r is None:
+				self.bytes = 0
+				return
+			self.db.execute("delete from http_cache where key=?", (r[0],))
+			self.bytes -= r[1]
+			self.count -= 1
+
+	def delete(self, key):
+		with self.lock:
+			r = self.db.execute("select size from http_cache where key=?",
+						(key,)).fetchone()
+			if r is None:
+				return
+			self.db.execute("delete from http_cache where key=?", (key,))
+			self.bytes -= r[0]
+			self.count -= 1
+			self.db.commit()
+
+	def clear(self):
+		with self.lock:
+			self.db.execute("delete from http_cache")
+			self.db.commit()
+			self.bytes = 0
+			self.count = 0
+
+	def stats(self):
+		return {
+			"store":"sqlite",
+			"size":self.count,
+			"bytes":self.bytes,
+			"maxbytes":self.maxbytes
+		}
+
+@SingletonDecorator
+class HttpCache:
+	def __init__(self):
+		config = getConfig()
+		opts = config.http_cache
+		self.enabled = opts is True or isinstance(opts, (dict, DictObject))
+		if not isinstance(opts, (dict, DictObject)):
+			opts = {}
+		self.default_ttl = opts.get('default_ttl', 0)
+		self.swr = opts.get('stale_while_revalidate', 0)
+		self.stores = [ MemoryStore(opts.get('memory_size', 256)) ]
+		sqlite = opts.get('sqlite', True)
+		if self.enabled and sqlite is not False:
+			if sqlite is True:
+				app = App.get_running_app()
+				sqlite = None
+				if app is not None:
+					sqlite = os.path.join(app.user_data_dir, 'http_cache.db')
+			if sqlite:
+				try:
+					self.stores.append(SqliteStore(sqlite,
+							opts.get('sqlite_size', 20 * 1024 * 1024)))
+				except Exception as e:
+					print('HttpCache: open', sqlite, 'error', e)
+		self.lock = Lock()
+		self.revalidating = set()
+		self.hits = 0
+		self.stale_served = 0
+		self.revalidated = 0
+		self.misses = 0
+
+	def key(self, url, params={}, headers={}, scope=None):
+		s = json.dumps([url, params, headers, scope], sort_keys=True,
+					default=str)
+		return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+	def get(self, key, memory=False):
+		stores = self.stores[:1] if memory else self.stores
+		for i, store in enumerate(stores):
+			entry = store.get(key)
+			if entry is not None:
+				for s in self.stores[:i]:
+					s.put(key, entry)
+				return entry
+		return None
+
+	def put(self, key, entry):
+		for store in self.stores:
+			store.put(key, entry)
+
+	def policy(self, resp):
+		"""
+		freshness of the response, None if it should not be cached
+		"""
+		cc = parseCacheControl(resp.headers.get('Cache-Control'))
+		if 'no-store' in cc:
+			return None
+		etag = resp.headers.get('ETag')
+		last_modified = resp.headers.get('Last-Modified')
+		if 'no-cache' in cc:
+			max_age = 0
+		elif 'max-age' in cc:
+			max_age = toInt(cc['max-age'])
+		else:
+			max_age = self.default_ttl
+		swr = toInt(cc.get('stale-while-revalidate', self.swr))
+		if max_age <= 0 and swr <= 0 and not etag and not last_modified:
+			return None
+		return {
+			"etag":etag,
+			"last_modified":last_modified,
+			"max_age":max_age,
+			"swr":swr
+		}
+
+	def peek(self, url, params={}, headers={}, scope=None, memory=False):
+		"""
+		return (True, data) if the cache can answer without network,
+		a stale entry in its stale-while-revalidate window is answered
+		and revalidated in a worker thread.
+		memory=True looks up the memory tier only, for the ui thread
+		"""
+		if not self.enabled:
+			return False, None
+		key = self.key(url, params, headers, scope)
+		entry = self.get(key, memory=memory)
+		if entry is None:
+			return False, None
+		age = time.time() - entry['fetched_at']
+		if age < entry['max_age']:
+			self.hits += 1
+			return True, deepcopy(entry['data'])
+		if age < entry['max_age'] + entry['swr']:
+			self.stale_served += 1
+			self.revalidateLater(key, url, params, headers, scope)
+			return True, deepcopy(entry['data'])
+		return False, None
+
+	def revalidateLater(self, key, url, params, headers, scope=None):
+		with self.lock:
+			if key in self.revalidating:
+				return
+			self.revalidating.add(key)
+		def done(*args):
+			with self.lock:
+				self.revalidating.discard(key)
+		from .threadcall import HttpClient, BACKGROUND
+		hc = HttpClient()
+		hc.workers.add(self.download, done, done, kwargs={
+			"hc":hc,
+			"url":url,
+			"params":params,
+			"headers":headers,
+			"scope":scope
+		}, priority=BACKGROUND)
+
+	def fetch(self, hc, url, params={}, headers={}, timeout=None,
+				scope=None):
+		hit, data = self.peek(url, params, headers, scope)
+		if hit:
+			return data
+		return self.download(hc, url, params, headers, timeout=timeout,
+					scope=scope)
+
+	def download(self, hc, url, params={}, headers={}, timeout=None,
+				scope=None):
+		key = self.key(url, params, headers, scope)
+		entry = self.get(key)
+		h = headers.copy()
+		if entry is not None:
+			if entry.get('etag'):
+				h['If-None-Match'] = entry['etag']
+			if entry.get('last_modified'):
+				h['If-Modified-Since'] = entry['last_modified']
+		resp = hc._webcall(url, method='GET', params=params, headers=h,
+					timeout=timeout)
+		if entry is not None and resp.status_code == 304:
+			self.revalidated += 1
+			entry = dict(entry, fetched_at=time.time())
+			self.put(key, entry)
+			return deepcopy(entry['data'])
+		self.misses += 1
+		from .threadcall import decodeResponse
+		data = decodeResponse(resp)
+		policy = self.policy(resp)
+		if policy is None:
+			if entry is not None:
+				for store in self.stores:
+					store.delete(key)
+			return data
+		entry = dict(policy, url=url, fetched_at=time.time(), data=data)
+		self.put(key, entry)
+		return deepcopy(data)
+
+	def clear(self):
+		for store in self.stores:
+			store.clear()
+
+	def stats(self):
+		return {
+			"hits":self.hits,
+			"stale_served":self.stale_served,
+			"revalidated":self.revalidated,
+			"misses":self.misses,
+			"stores":[ s.stats() for s in self.stores ]
+		}
@@ -0,0 +1,265 @@
+import os
+import time
+import json
+import codecs
+import logging
+from logging.handlers import RotatingFileHandler
+from threading import Lock, get_ident
+from collections import deque
+from traceback import print_exc
+
+from kivy.clock import Clock
+from kivy.uix.label import Label
+from kivy.properties import NumericProperty
+from appPublic.jsonConfig import getConfig
+from appPublic.dictObject import DictObject
+
+"""
+timings, counters and traces of the network and the build engine
+
+span(name, cat) times a block of code:
+	with instrument.span('fetch', 'net', url=url):
+		...
+the spans recorded are:
+	net:	fetch, parse
+	worker:	queue_wait
+	build:	build, valueExpr, instantiate, build_rest, bind
+	grid:	query
+every span adds to the timing of its name (count, total, max) and is
+kept in a bounded event list for the chrome trace.
+count(name) adds to a counter, addProvider(name, f) registers a stats()
+function (cache hits, coalesced requests, queue depth ...) called for
+every snapshot.
+
+the data goes out as:
+	snapshot lines in a rotating file, every interval seconds,
+	InstrumentOverlay, a label showing the latest snapshot,
+	chromeTrace(filename), a chrome://tracing (or perfetto) json file
+
+config "instrument" (absent or false disables the timings):
+{
+	"max_events":events kept for the trace, default 10000,
+	"file":rotating snapshot file, default none,
+	"max_bytes":default 1048576,
+	"backups":default 3,
+	"interval":seconds between snapshots, default 10,
+	"trace":chrome trace file written by dump(), default none
+}
+"""
+
+class NullSpan:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+null_span = NullSpan()
+
+class Span:
+	def __init__(self, instrument, name, cat, args):
+		self.instrument = instrument
+		self.name = name
+		self.cat = cat
+		self.args = args
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		self.instrument.record(self.name, self.cat, self.start,
+					time.perf_counter() - self.start, self.args)
+		return False
+
+class Instrument:
+	def __init__(self):
+		self.enabled = False
+		self.lock = Lock()
+		self.t0 = time.perf_counter()
+		self.events = deque(maxlen=10000)
+		self.timings = {}
+		self.counters = {}
+		self.providers = {}
+		self.logger = None
+		self.handler = None
+		self.trace_file = None
+		self.interval_event = None
+
+	def stopSnapshots(self):
+		"""
+		stop the snapshot timer and close the snapshot file
+		"""
+		if self.interval_event is not None:
+			self.interval_event.cancel()
+			self.interval_event = None
+		if self.handler is not None:
+			self.logger.removeHandler(self.handler)
+			self.handler.close()
+			self.handler = None
+
+	def configure(self, opts=None):
+		"""
+		set up from config "instrument" or opts, start the snapshot file
+		"""
+		if opts is None:
+			opts = getConfig().instrument
+		self.stopSnapshots()
+		if not opts:
+			self.enabled = False
+			return
+		if not isinstance(opts, (dict, DictObject)):
+			opts = {}
+		self.events = deque(self.events, maxlen=opts.get('max_events', 10000))
+		self.trace_file = opts.get('trace')
+		self.enabled = True
+		if opts.get('file'):
+			self.logger = logging.getLogger('kivyblocks.instrument')
+			self.logger.propagate = False
+			self.logger.setLevel(logging.INFO)
+			self.handler = RotatingFileHandler(opts.get('file'),
+						maxBytes=opts.get('max_bytes', 1024 * 1024),
+						backupCount=opts.get('backups', 3))
+			self.logger.addHandler(self.handler)
+			self.interval_event = Clock.schedule_interval(self.writeSnapshot,
+						opts.get('interval', 10))
+
+	def span(self, name, cat='app', **args):
+		if not self.enabled:
+			return null_span
+		return Span(self, name, cat, args)
+
+	def record(self, name, cat, start, duration, args={}):
+		"""
+		add a span measured by the caller, start is a perf_counter() value
+		"""
+		if not self.enabled:
+			return
+		with self.lock:
+			t = self.timings.get(name)
+			if t is None:
+				t = self.timings[name] = [0, 0.0, 0.0]
+			t[0] += 1
+			t[1] += duration
+			if duration > t[2]:
+				t[2] = duration
+			self.events.append((name, cat, start, duration, get_ident(),
+						args))
+
+	def count(self, name, n=1):
+		if not self.enabled:
+			return
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	def addProvider(self, name, f):
+		self.providers[name] = f
+
+	def snapshot(self):
+		with self.lock:
+			timings = { k:{
+						"count":c,
+						"total":total,
+						"avg":total / c if c else 0,
+						"max":mx
+					} for k, (c, total, mx) in self.timings.items() }
+			counters = self.counters.copy()
+		stats = {}
+		for name, f in list(self.providers.items()):
+			try:
+				stats[name] = f()
+			except Exception as e:
+				stats[name] = str(e)
+		return {
+			"time":time.time(),
+			"timings":timings,
+			"counters":counters,
+			"stats":stats
+		}
+
+	def writeSnapshot(self, *args):
+		if self.handler is None:
+			return
+		try:
+			self.logger.info(json.dumps(self.snapshot(), default=str))
+		except Exception as e:
+			print_exc()
+
+	def traceEvents(self):
+		with self.lock:
+			events = list(self.events)
+		pid = os.getpid()
+		return [ {
+				"name":name,
+				"cat":cat,
+				"ph":"X",
+				"ts":(start - self.t0) * 1000000,
+				"dur":duration * 1000000,
+				"pid":pid,
+				"tid":tid,
+				"args":args
+			} for name, cat, start, duration, tid, args in events ]
+
+	def chromeTrace(self, filename):
+		"""
+		write the events as a chrome trace file
+		"""
+		with codecs.open(filename, 'w', 'utf-8') as f:
+			json.dump({
+					"traceEvents":self.traceEvents(),
+					"displayTimeUnit":"ms"
+				}, f, default=str)
+
+	def dump(self):
+		"""
+		write the last snapshot and the trace file of the config
+		"""
+		self.writeSnapshot()
+		if self.trace_file:
+			self.chromeTrace(self.trace_file)
+
+	def reset(self):
+		with self.lock:
+			self.events.clear()
+			self.timings = {}
+			self.counters = {}
+
+instrument = Instrument()
+
+class InstrumentOverlay(Label):
+	"""
+	show the timings and counters of instrument, refreshed every
+	interval seconds
+	"""
+	interval = NumericProperty(1)
+	def __init__(self, **kw):
+		kw.setdefault('halign', 'left')
+		kw.setdefault('valign', 'top')
+		kw.setdefault('font_size', 12)
+		super().__init__(**kw)
+		self.bind(size=self.setTextSize)
+		self.event = None
+		self.bind(parent=self.onParent)
+
+	def setTextSize(self, *args):
+		self.text_size = self.size
+
+	def onParent(self, o, parent):
+		if self.event is not None:
+			self.event.cancel()
+			self.event = None
+		if parent is not None:
+			self.event = Clock.schedule_interval(self.refresh, self.interval)
+			self.refresh()
+
+	def refresh(self, *args):
+		d = instrument.snapshot()
+		lines = []
+		for k, t in sorted(d['timings'].items()):
+			lines.append('%-12s %6d %8.2fms %8.2fms' % (k, t['count'],
+						t['avg'] * 1000, t['max'] * 1000))
+		for k, v in sorted(d['counters'].items()):
+			lines.append('%-12s %6d' % (k, v))
+		for k, v in sorted(d['stats'].items()):
+			lines.append('%s: %s' % (k, json.dumps(v, default=str)))
+		self.text = '\n'.join(lines)
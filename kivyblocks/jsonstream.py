@@ -0,0 +1,121 @@
+import json
+
+"""
+incremental decoder for json documents carrying a big "rows" array,
+like the data a PageLoader loads:
+	{"total":100000, "rows":[{...}, {...}, ...]}
+feed() takes the text as it comes from the network and returns the rows
+completed so far, the text of the rows is dropped once they are decoded,
+close() returns the rest of the document with an empty "rows".
+"""
+
+WHITESPACE = ' \t\r\n'
+
+class RowsDecoder:
+	def __init__(self, key='rows'):
+		self.key = key
+		self.decoder = json.JSONDecoder()
+		self.state = 'seek'
+		self.buf = ''
+		self.pos = 0
+		self.head = ''
+		self.tail = []
+		self.in_string = False
+		self.escape = False
+		self.string_start = 0
+		self.stage = 0
+		self.rows = 0
+
+	def feed(self, text):
+		if self.state == 'tail':
+			self.tail.append(text)
+			return []
+		self.buf += text
+		if self.state == 'seek':
+			self.seek()
+		if self.state == 'rows':
+			return self.readRows()
+		return []
+
+	def seek(self):
+		"""
+		scan the document head for the key's array, tracking strings,
+		so a "rows" inside a string value is not taken as the key
+		"""
+		buf = self.buf
+		i = self.pos
+		n = len(buf)
+		while i < n:
+			c = buf[i]
+			if self.in_string:
+				if self.escape:
+					self.escape = False
+				elif c == '\\':
+					self.escape = True
+				elif c == '"':
+					self.in_string = False
+					if buf[self.string_start:i] == self.key:
+						self.stage = 1
+				i += 1
+				continue
+			if c in WHITESPACE:
+				i += 1
+				continue
+			if c == '"':
+				self.in_string = True
+				self.string_start = i + 1
+				self.stage = 0
+			elif c == ':' and self.stage == 1:
+				self.stage = 2
+			elif c == '[' and self.stage == 2:
+				self.head = buf[:i+1]
+				self.buf = buf[i+1:]
+				self.state = 'rows'
+				return
+			else:
+				self.stage = 0
+			i += 1
+		self.pos = i
+
+	def readRows(self):
+		rows = []
+		buf = self.buf
+		i = 0
+		n = len(buf)
+		while True:
+			while i < n and (buf[i] in WHITESPACE or buf[i] == ','):
+				i += 1
+			if i >= n:
+				break
+			if buf[i] == ']':
+				self.state = 'tail'
+				self.tail.append(buf[i:])
+				buf = ''
+				i = 0
+				break
+			try:
+				obj, end = self.decoder.raw_decode(buf, i)
+			except ValueError:
+				break
+			if not isinstance(obj, (dict, list)):
+				# a number may continue in the next chunk
+				j = end
+				while j < n and buf[j] in WHITESPACE:
+					j += 1
+				if j >= n:
+					break
+			rows.append(obj)
+			i = end
+		self.buf = buf[i:]
+		self.rows += len(rows)
+		return rows
+
+	def close(self):
+		"""
+		return the document without the rows
+		"""
+		if self.state == 'seek':
+			return json.loads(self.buf)
+		if self.state == 'rows':
+			raise ValueError('json document ends in "%s" array' % self.key)
+		return json.loads(self.head + ''.join(self.tail))
@@ -146,7 +146,9 @@ sub-widget's description file format
 		elif isinstance(left_menu, Widget):
 			self.left_menu = left_menu
 		else:
-			self.left_menu = Factory.Blocks().widgetBuild(left_menu)
+			b = Factory.Blocks()
+			b.bind(on_built=self.left_menu_built)
+			self.left_menu = b.asyncWidgetBuild(left_menu)
 		self.sub_widgets = []
 		VBox.__init__(self, **kw)
 		self.bar = HBox(size_hint_y=None,
@@ -274,6 +276,9 @@ sub-widget's description file format
 		self.sub_widgets.append(w)
 		self.show_currentpage()
 
+	def left_menu_built(self, o, w):
+		self.left_menu = w
+
 	def show_left_menu(self, o):
 		def x(*args):
 			self.left_menu_showed = False
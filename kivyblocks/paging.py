@@ -16,6 +16,7 @@ from .form import StrSearchForm
 from .dataloader import HttpDataLoader
 from .dataloader import ListDataLoader
 from .dataloader import RegisterFunctionDataLoader
+from .threadcall import Cancelled
 
 class PagingButton(Button):
 	def __init__(self, **kw):
@@ -31,6 +32,7 @@ class PagingButton(Button):
 	method
 	locater
 	filter
+	stream_rows: show the rows of a page as they are downloaded
 }
 
 PageLoader load data in a page size once.
@@ -57,6 +59,7 @@ class PageLoader(EventDispatcher):
 		self.total_cnt = 0
 		self.total_page = 0
 		self.curpage = 0
+		self.prevpage = 0
 		self.dir = 'down'
 		self.register_event_type('on_newbegin')
 		self.register_event_type('on_pageloaded')
@@ -69,7 +72,10 @@ class PageLoader(EventDispatcher):
 			self.loader = ListDataLoader(self)
 		else:
 			raise Exception('need a url or rfname or data')
+		self.streamed = 0
+		self.pending_rows = []
 		self.loader.bind(on_success=self.show_page)
+		self.loader.bind(on_rows=self.show_rows)
 		self.loader.bind(on_error=self.onerror)
 	
 	def on_newbegin(self):
@@ -109,21 +115,53 @@ class PageLoader(EventDispatcher):
 			self.curpage = 1
 		self.loadPage(self.curpage)
 	
-	def show_page(self,o,d):
-		p = (self.curpage - 1) * self.page_rows + 1
-		for r in d['rows']:
+	def beginPage(self):
+		pass
+
+	def addRows(self,rows):
+		p = (self.curpage - 1) * self.page_rows + self.streamed + 1
+		for r in rows:
 			r['__posInSet__'] = p
 			p += 1
-		self.total_cnt = d['total']
-		self.calculateTotalPage()
+		self.streamed += len(rows)
 		d = {
 			"page":self.curpage,
 			"dir":self.dir,
-			"data":d['rows']
+			"data":rows
 		}
 		self.dispatch('on_pageloaded',d)
+
+	def show_rows(self,o,rows):
+		"""
+		a batch of rows of the current page, from a "stream_rows"
+		loader, they are shown as they come, except for an 'up' page,
+		its rows are shown at once in show_page()
+		"""
+		if self.dir == 'up':
+			self.pending_rows += rows
+			return
+		if self.streamed == 0:
+			self.beginPage()
+		self.addRows(rows)
+
+	def show_page(self,o,d):
+		self.total_cnt = d['total']
+		self.calculateTotalPage()
+		rows = self.pending_rows + d['rows']
+		self.pending_rows = []
+		if self.streamed == 0:
+			self.beginPage()
+			self.addRows(rows)
+		elif len(rows) > 0:
+			self.addRows(rows)
 		
 	def onerror(self,o,e):
+		# the page did not come, it can be loaded again
+		self.loading = False
+		self.curpage = self.prevpage
+		self.pending_rows = []
+		if isinstance(e, Cancelled):
+			return
 		traceback.print_exc()
 		alert(str(e),title='alert')
 
@@ -146,8 +184,11 @@ class PageLoader(EventDispatcher):
 			self.dir = 'reload'
 		else:
 			self.dir = 'down'
+		self.prevpage = self.curpage
 		self.curpage = p
 		self.loading = True
+		self.streamed = 0
+		self.pending_rows = []
 		self.loader.load()
 		"""
 		params = self.params.copy()
@@ -224,15 +265,19 @@ class RelatedLoader(PageLoader):
 		del self.objectPages[page]
 	
 	def bufferObjects(self,page,objects):
-		self.objectPages[page] = objects
+		self.objectPages[page] = self.objectPages.get(page,[]) + objects
 
-
-	def show_page(self,o,data):
+	def beginPage(self):
 		if self.objectPages.get(self.curpage):
 			self.deleteBuffer(self.curpage)
 		else:
 			self.doBufferMaintain()
-		self.totalObj += len(data['rows'])
+
+	def addRows(self,rows):
+		self.totalObj += len(rows)
+		super().addRows(rows)
+
+	def show_page(self,o,data):
 		super().show_page(o,data)
 		self.loading = False
 	
@@ -0,0 +1,218 @@
+import json
+import heapq
+from functools import partial
+
+from kivy.app import App
+from kivy.clock import Clock
+from kivy.factory import Factory
+from kivy.logger import Logger
+from appPublic.Singleton import SingletonDecorator
+from appPublic.jsonConfig import getConfig
+from appPublic.dictObject import DictObject
+
+from .threadcall import PREFETCH
+
+"""
+prefetch the screens reachable from the root description
+
+Prefetcher scans a description for the urls it may navigate to and
+are declared for prefetching with "prefetch":true:
+	urlwidget descriptions,
+	"url" of ToolPage tools,
+	"urlwidget" bind actions,
+and the urls listed in config, in declaration order. only static urls
+are prefetched, urls or params with "py::" or "{{" expressions are
+left alone.
+the urls are fetched (Blocks.getUrlData(), so they land in DescCache)
+in worker threads, started in idle frames, the descriptions are
+compiled to build plans in the ui thread, where the widget classes
+are looked up, and kept in the PlanCache, and the fetched
+descriptions are scanned for more urls.
+the first "prebuild" screens can be instantiated too, ToolPage takes
+them with Prefetcher().take(url) instead of building them again.
+
+prefetching is off unless config "prefetch" is true or a dict:
+{
+	"urls":[url, ...] more urls to prefetch,
+	"budget":description bytes to prefetch, default 2097152,
+	"depth":how many levels of screens to follow, default 2,
+	"concurrency":fetches in flight, default 2,
+	"prebuild":screens to instantiate, default 0,
+	"idle_frametime":skip frames slower than this, default 0.033
+}
+"""
+
+def urlKey(url, params={}):
+	return url + json.dumps(params, sort_keys=True, default=str)
+
+def isStatic(v):
+	if isinstance(v, str):
+		return not v.startswith('py::') and '{{' not in v
+	if isinstance(v, (list, tuple)):
+		return all(isStatic(i) for i in v)
+	if isinstance(v, (dict, DictObject)):
+		return all(isStatic(i) for i in v.values())
+	return True
+
+def isUrl(url):
+	return isinstance(url, str) and url != '' and isStatic(url)
+
+def scanUrls(desc):
+	"""
+	return the static [(url, params)] declared for prefetching in desc,
+	in declaration order
+	"""
+	urls = []
+	def scan(obj):
+		if isinstance(obj, list):
+			for i in obj:
+				scan(i)
+			return
+		if not isinstance(obj, (dict, DictObject)):
+			return
+		if obj.get('prefetch'):
+			if obj.get('widgettype') == 'urlwidget' or \
+					obj.get('actiontype') == 'urlwidget':
+				opts = obj.get('options') or {}
+				params = opts.get('params') or {}
+				if isUrl(opts.get('url')) and isStatic(params):
+					urls.append((opts.get('url'), params))
+			elif isUrl(obj.get('url')) and obj.get('name'):
+				# ToolPage tool
+				urls.append((obj.get('url'), {}))
+		for v in obj.values():
+			scan(v)
+	scan(desc)
+	return urls
+
+@SingletonDecorator
+class Prefetcher:
+	def __init__(self):
+		config = getConfig()
+		opts = config.prefetch
+		self.enabled = opts is True or isinstance(opts, (dict, DictObject))
+		if not isinstance(opts, (dict, DictObject)):
+			opts = {}
+		self.urls = [ u for u in opts.get('urls', []) if isUrl(u) ]
+		self.budget = opts.get('budget', 2 * 1024 * 1024)
+		self.depth = opts.get('depth', 2)
+		self.concurrency = opts.get('concurrency', 2)
+		self.prebuild = opts.get('prebuild', 0)
+		self.idle_frametime = opts.get('idle_frametime', 0.033)
+		self.queue = []
+		self.seen = set()
+		self.order = 0
+		self.inflight = 0
+		self.used = 0
+		self.blocks = None
+		self.compiled = 0
+		self.widgets = {}
+		self.task = None
+		self.fetched = 0
+		self.failed = 0
+
+	def start(self, desc):
+		if not self.enabled:
+			return
+		self.add(desc, 0)
+		for url in self.urls:
+			self.push(url, {}, 0)
+		if self.task is None:
+			self.task = Clock.schedule_interval(self.step, 0)
+
+	def stop(self):
+		if self.task:
+			self.task.cancel()
+			self.task = None
+
+	def add(self, desc, depth):
+		for url, params in scanUrls(desc):
+			self.push(url, params, depth)
+
+	def push(self, url, params, depth):
+		key = urlKey(url, params)
+		if key in self.seen:
+			return
+		self.seen.add(key)
+		heapq.heappush(self.queue, (depth, self.order, url, params))
+		self.order += 1
+
+	def step(self, dt):
+		if self.used >= self.budget:
+			Logger.info('Prefetcher: memory budget used, stop')
+			self.queue = []
+		if len(self.queue) == 0:
+			if self.inflight == 0:
+				self.stop()
+			return
+		if Clock.frametime > self.idle_frametime:
+			return
+		while self.queue and self.inflight < self.concurrency:
+			depth, order, url, params = heapq.heappop(self.queue)
+			self.fetch(url, params, depth)
+
+	def fetch(self, url, params, depth):
+		self.inflight += 1
+		if self.blocks is None:
+			self.blocks = Factory.Blocks()
+		app = App.get_running_app()
+		app.workers.add(self.load, partial(self.loaded, url, params, depth),
+				errback=partial(self.failed_cb, url),
+				kwargs={'url':url, 'params':params},
+				priority=PREFETCH)
+
+	def load(self, url, params):
+		"""
+		run in a worker thread, fetch and parse the description of
+		url, return (desc, size)
+		"""
+		desc = self.blocks.getUrlData(url, params=params)
+		if not isinstance(desc, (dict, DictObject)):
+			raise Exception('%s is not a description' % url)
+		try:
+			size = len(json.dumps(desc, default=str))
+		except Exception:
+			size = 0
+		return desc, size
+
+	def failed_cb(self, url, o, e):
+		Logger.info('Prefetcher: %s failed, %s', url, str(e))
+		self.inflight -= 1
+		self.failed += 1
+
+	def loaded(self, url, params, depth, o, result):
+		self.inflight -= 1
+		self.fetched += 1
+		desc, size = result
+		self.used += size
+		key = urlKey(url, params)
+		if desc.get('widgettype') != 'urlwidget':
+			# the plan stays in the PlanCache, DescCache owns desc
+			plan = self.blocks.getPlan(desc)
+			self.compiled += 1
+			if len(self.widgets) < self.prebuild and \
+					self.used < self.budget:
+				w = self.blocks.widgetBuild(plan)
+				if w is not None:
+					self.widgets[key] = w
+		if depth < self.depth:
+			self.add(desc, depth + 1)
+
+	def take(self, url, params={}):
+		"""
+		return the pre-built widget for url and forget it, None if
+		it is not built
+		"""
+		return self.widgets.pop(urlKey(url, params), None)
+
+	def stats(self):
+		return {
+			"queued":len(self.queue),
+			"inflight":self.inflight,
+			"fetched":self.fetched,
+			"failed":self.failed,
+			"compiled":self.compiled,
+			"prebuilt":len(self.widgets),
+			"used":self.used,
+			"budget":self.budget
+		}
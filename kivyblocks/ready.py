@@ -3,6 +3,7 @@ from kivy.core.window import Window
 from kivy.utils import platform
 from kivy.app import App
 from kivy.properties import BooleanProperty
+from .widgetindex import widget_index
 
 desktopOSs=[
 	"win",
@@ -18,6 +19,22 @@ class WidgetReady(EventDispatcher):
 		self.register_event_type('on_ready')
 		self._ready = False
 
+	def _get_widget_id(self):
+		try:
+			return self.__dict__['_widget_id']
+		except KeyError:
+			raise AttributeError('widget_id')
+
+	def _set_widget_id(self, widget_id):
+		old = self.__dict__.get('_widget_id')
+		if old is not None:
+			widget_index.remove(old, self)
+		self.__dict__['_widget_id'] = widget_id
+		if widget_id is not None:
+			widget_index.add(widget_id, self)
+
+	widget_id = property(_get_widget_id, _set_widget_id)
+
 	def on_ready(self):
 		pass
 
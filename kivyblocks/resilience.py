@@ -0,0 +1,266 @@
+import time
+import random
+import asyncio
+from threading import Lock
+
+from requests.exceptions import ConnectionError, Timeout
+try:
+	from aiohttp import ClientConnectionError
+except ImportError:
+	ClientConnectionError = ConnectionError
+from appPublic.Singleton import SingletonDecorator
+from appPublic.jsonConfig import getConfig
+from appPublic.dictObject import DictObject
+
+"""
+retry, circuit breaker and timeout for HttpClient
+
+idempotent requests (GET, HEAD, OPTION(S), PUT, DELETE) failed by a
+connection error, a timeout or a 429/502/503/504 response are retried
+after a jittered exponential backoff. file uploads are not retried,
+their body is read from the files as it is sent, and only the connect
+part of the default timeout applies to them.
+every host has a circuit breaker, it opens after failure_threshold
+failures in a row (connection errors, timeouts, 5xx), requests to an open
+host fail at once with CircuitOpen, after reset_timeout seconds one
+request is let through to probe the host, it closes the breaker if it
+succeeds.
+
+config "http_resilience":
+{
+	"retries":retries of idempotent requests, default 2,
+	"backoff":first backoff in seconds, default 0.5,
+	"max_backoff":default 8,
+	"timeout":seconds or [connect, read], default 30,
+	"failure_threshold":default 5,
+	"reset_timeout":seconds, default 30
+}
+"""
+
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTION', 'OPTIONS', 'PUT', 'DELETE']
+RETRY_STATUS = [429, 502, 503, 504]
+NETWORK_ERRORS = (ConnectionError, Timeout, asyncio.TimeoutError,
+					ClientConnectionError)
+
+class CircuitOpen(Exception):
+	def __init__(self, host):
+		self.host = host
+		Exception.__init__(self)
+
+	def __str__(self):
+		return f'{self.host}: circuit open'
+
+def url2host(url):
+	return '/'.join(url.split('/')[:3])
+
+class CircuitBreaker:
+	def __init__(self, host, threshold=5, reset_timeout=30):
+		self.host = host
+		self.threshold = threshold
+		self.reset_timeout = reset_timeout
+		self.state = 'closed'
+		self.failures = 0
+		self.opened_at = 0
+		self.probing = False
+		self.opens = 0
+		self.fast_fails = 0
+		self.lock = Lock()
+
+	def allow(self):
+		"""
+		raise CircuitOpen if the request should not be sent
+		"""
+		with self.lock:
+			if self.state == 'open':
+				if time.time() - self.opened_at < self.reset_timeout:
+					self.fast_fails += 1
+					raise CircuitOpen(self.host)
+				self.state = 'half-open'
+			if self.state == 'half-open':
+				if self.probing:
+					self.fast_fails += 1
+					raise CircuitOpen(self.host)
+				self.probing = True
+
+	def success(self):
+		with self.lock:
+			self.state = 'closed'
+			self.failures = 0
+			self.probing = False
+
+	def failure(self):
+		with self.lock:
+			self.failures += 1
+			self.probing = False
+			if self.state == 'half-open' or \
+					self.failures >= self.threshold:
+				if self.state != 'open':
+					self.opens += 1
+				self.state = 'open'
+				self.opened_at = time.time()
+
+	def stats(self):
+		return {
+			"state":self.state,
+			"failures":self.failures,
+			"opens":self.opens,
+			"fast_fails":self.fast_fails
+		}
+
+@SingletonDecorator
+class Resilience:
+	def __init__(self):
+		config = getConfig()
+		opts = config.http_resilience
+		if not isinstance(opts, (dict, DictObject)):
+			opts = {}
+		self.retries = opts.get('retries', 2)
+		self.backoff = opts.get('backoff', 0.5)
+		self.max_backoff = opts.get('max_backoff', 8)
+		self.timeout = opts.get('timeout', 30)
+		if isinstance(self.timeout, list):
+			self.timeout = tuple(self.timeout)
+		self.threshold = opts.get('failure_threshold', 5)
+		self.reset_timeout = opts.get('reset_timeout', 30)
+		self.breakers = {}
+		self.lock = Lock()
+		self.requests = 0
+		self.retried = 0
+		self.recovered = 0
+		self.giveups = 0
+		self.timeouts = 0
+
+	def breaker(self, url):
+		host = url2host(url)
+		with self.lock:
+			b = self.breakers.get(host)
+			if b is None:
+				b = self.breakers[host] = CircuitBreaker(host,
+						threshold=self.threshold,
+						reset_timeout=self.reset_timeout)
+			return b
+
+	def getTimeout(self, timeout=None, streaming=False):
+		"""
+		the default timeout, only its connect part for streaming
+		bodies, a big upload may take longer than the read timeout
+		"""
+		if timeout is not None:
+			return timeout
+		if not streaming:
+			return self.timeout
+		if isinstance(self.timeout, tuple):
+			return (self.timeout[0], None)
+		return (self.timeout, None)
+
+	def isFailure(self, e):
+		"""
+		the error says the host is in trouble
+		"""
+		if isinstance(e, NETWORK_ERRORS):
+			return True
+		code = getattr(e, 'resp_code', None)
+		return code is not None and code >= 500
+
+	def isRetryable(self, e):
+		if isinstance(e, CircuitOpen):
+			return False
+		if isinstance(e, NETWORK_ERRORS):
+			return True
+		return getattr(e, 'resp_code', None) in RETRY_STATUS
+
+	def delay(self, attempt):
+		return random.uniform(0, min(self.max_backoff,
+						self.backoff * 2 ** (attempt - 1)))
+
+	def failed(self, breaker, e):
+		if isinstance(e, (Timeout, asyncio.TimeoutError)):
+			with self.lock:
+				self.timeouts += 1
+		if self.isFailure(e):
+			breaker.failure()
+		else:
+			breaker.success()
+
+	def retry(self, breaker, method, attempt, e, retries=None):
+		"""
+		return True if the request should be sent again
+		"""
+		if retries is None:
+			retries = self.retries \
+					if method.upper() in IDEMPOTENT_METHODS else 0
+		if not self.isRetryable(e):
+			return False
+		if attempt >= retries or breaker.state == 'open':
+			with self.lock:
+				self.giveups += 1
+			return False
+		with self.lock:
+			self.retried += 1
+		return True
+
+	def call(self, url, method, f, retries=None):
+		"""
+		return f(), f sends the request, retries overrides the
+		configured retries, 0 for a body that can not be sent again
+		"""
+		breaker = self.breaker(url)
+		attempt = 0
+		with self.lock:
+			self.requests += 1
+		while True:
+			breaker.allow()
+			try:
+				rez = f()
+			except Exception as e:
+				self.failed(breaker, e)
+				if not self.retry(breaker, method, attempt, e,
+							retries=retries):
+					raise e
+				attempt += 1
+				time.sleep(self.delay(attempt))
+				continue
+			breaker.success()
+			if attempt > 0:
+				with self.lock:
+					self.recovered += 1
+			return rez
+
+	async def acall(self, url, method, f, retries=None):
+		"""
+		coroutine version of call(), f() returns the coroutine sending
+		the request
+		"""
+		breaker = self.breaker(url)
+		attempt = 0
+		with self.lock:
+			self.requests += 1
+		while True:
+			breaker.allow()
+			try:
+				rez = await f()
+			except Exception as e:
+				self.failed(breaker, e)
+				if not self.retry(breaker, method, attempt, e,
+							retries=retries):
+					raise e
+				attempt += 1
+				await asyncio.sleep(self.delay(attempt))
+				continue
+			breaker.success()
+			if attempt > 0:
+				with self.lock:
+					self.recovered += 1
+			return rez
+
+	def stats(self):
+		with self.lock:
+			hosts = { h:b.stats() for h,b in self.breakers.items() }
+		return {
+			"requests":self.requests,
+			"retried":self.retried,
+			"recovered":self.recovered,
+			"giveups":self.giveups,
+			"timeouts":self.timeouts,
+			"hosts":hosts
+		}
@@ -0,0 +1,155 @@
+from threading import RLock
+
+"""
+column oriented store of the records a DataGrid shows
+
+every field is a list of values, a record is a slot, the same position
+in all the lists, index maps a row id to its slot. deleted slots are
+reused by the next records, so adding and deleting a page never moves
+the other records.
+
+the freeze and normal parts of a DataGrid share one store, their bodies
+only keep the row ids in display order and read the values from here.
+
+	store = RowStore()
+	store.addRows(ids, records)
+	store.get(id, 'name')
+	store.row(id)			# the record as a dict
+	store.delRows(ids)
+"""
+
+class _Missing:
+	def __repr__(self):
+		return 'MISSING'
+
+MISSING = _Missing()
+
+class RowStore:
+	def __init__(self, fields=[]):
+		self.lock = RLock()
+		self.columns = { f:[] for f in fields }
+		self.ids = []
+		self.index = {}
+		self.free = []
+		self.sparse = set()
+
+	def __len__(self):
+		return len(self.index)
+
+	def __contains__(self, id):
+		return id in self.index
+
+	def addColumn(self, name):
+		if self.index:
+			self.sparse.add(name)
+		self.columns[name] = [MISSING] * len(self.ids)
+		return self.columns[name]
+
+	def newSlot(self, id):
+		if self.free:
+			slot = self.free.pop()
+			self.ids[slot] = id
+		else:
+			slot = len(self.ids)
+			self.ids.append(id)
+			for col in self.columns.values():
+				col.append(MISSING)
+		self.index[id] = slot
+		return slot
+
+	def addRow(self, id, data):
+		with self.lock:
+			for k in data.keys():
+				if k not in self.columns:
+					self.addColumn(k)
+			slot = self.index.get(id)
+			if slot is None:
+				slot = self.newSlot(id)
+			else:
+				for col in self.columns.values():
+					col[slot] = MISSING
+			columns = self.columns
+			for k, v in data.items():
+				columns[k][slot] = v
+			if len(data) < len(self.columns):
+				self.sparse.update(k for k in self.columns if k not in data)
+			return slot
+
+	def addRows(self, ids, rows):
+		with self.lock:
+			for id, data in zip(ids, rows):
+				self.addRow(id, data)
+
+	def delRows(self, ids):
+		with self.lock:
+			cols = list(self.columns.values())
+			for id in ids:
+				slot = self.index.pop(id, None)
+				if slot is None:
+					continue
+				self.ids[slot] = None
+				for col in cols:
+					col[slot] = MISSING
+				self.free.append(slot)
+
+	def delRow(self, id):
+		self.delRows([id])
+
+	def clear(self):
+		with self.lock:
+			self.columns = { k:[] for k in self.columns.keys() }
+			self.ids = []
+			self.index = {}
+			self.free = []
+			self.sparse = set()
+
+	def slot(self, id):
+		return self.index[id]
+
+	def get(self, id, name, default=None):
+		col = self.columns.get(name)
+		if col is None:
+			return default
+		v = col[self.index[id]]
+		return default if v is MISSING else v
+
+	def row(self, id):
+		"""
+		the record of id as a dict, KeyError if there is no such row
+		"""
+		slot = self.index[id]
+		return { k:col[slot] for k, col in self.columns.items() \
+					if col[slot] is not MISSING }
+
+	def column(self, name, ids=None):
+		"""
+		the values of a field in the order of ids, all the rows in slot
+		order without ids
+		"""
+		col = self.columns.get(name)
+		if ids is None:
+			if col is None:
+				return [None] * len(self.index)
+			return [ None if col[s] is MISSING else col[s] \
+						for s, id in enumerate(self.ids) if id is not None ]
+		if col is None:
+			return [None] * len(ids)
+		index = self.index
+		return [ None if v is MISSING else v \
+					for v in (col[index[id]] for id in ids) ]
+
+	def rowIds(self):
+		return [ id for id in self.ids if id is not None ]
+
+	def hasMissing(self, name):
+		"""
+		False if every row has a value for name
+		"""
+		return name in self.sparse
+
+	def stats(self):
+		return {
+			"rows":len(self.index),
+			"slots":len(self.ids),
+			"columns":len(self.columns)
+		}
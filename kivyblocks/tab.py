@@ -48,7 +48,7 @@ class TabsPanel(BGColorBehavior, TabbedPanel):
 			self.add_widget(TabbedPanelItem(text=text,content=w))
 		blocks = Factory.Blocks()
 		blocks.bind(on_built=add)
-		blocks.widgetBuild(desc)
+		blocks.asyncWidgetBuild(desc)
 
 	def add_tabs(self,*args):
 		for d in self.tabs_list:
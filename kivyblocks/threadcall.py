@@ -1,16 +1,103 @@
 # -*- coding=utf-8 -*-
 
 import time
-from threading import Thread, Lock, BoundedSemaphore
+import json
+import codecs
+from itertools import count
+from collections import deque
+from queue import PriorityQueue, Empty
+from copy import deepcopy
+from weakref import ref
+from threading import Thread, Lock, Event, current_thread, local
+from traceback import print_exc
 import requests
-from functools import wraps
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar, get_cookie_header
+from functools import wraps, partial
 
 from kivy.event import EventDispatcher
 from kivy.clock import Clock
 from kivy.app import App
 from .login import LoginForm
+from .httpcache import HttpCache
+from .jsonstream import RowsDecoder
+from .resilience import Resilience
+from .uploader import MultipartReader, ProgressThrottle, ResumableUpload
+from .instrument import instrument
 
-from appPublic.http_client import Http_Client
+from appPublic.http_client import Http_Client, NeedLogin, \
+		InsufficientPrivilege, HTTPError, hostsessions
+from appPublic.jsonConfig import getConfig
+from appPublic.dictObject import DictObject
+from appPublic.Singleton import SingletonDecorator
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+class ResultPump:
+	"""
+	main thread completion queue, worker threads post the callbacks
+	of their results and errors here, they are run in the ui thread,
+	drained once per frame and no more than result_pump_budget
+	seconds (config, default 0.005) a frame, the rest waits for the
+	next frame
+	"""
+	def __init__(self):
+		self.queue = deque()
+		self.lock = Lock()
+		self.scheduled = False
+		self.budget = None
+		self.posted = 0
+		self.called = 0
+		self.frames = 0
+
+	def post(self, f, *args, **kw):
+		"""
+		call f(*args, **kw) in the ui thread, can be called from any thread
+		"""
+		self.queue.append((f, args, kw))
+		with self.lock:
+			self.posted += 1
+			if self.scheduled:
+				return
+			self.scheduled = True
+		Clock.schedule_once(self.drain, 0)
+
+	def getBudget(self):
+		if self.budget is None:
+			config = getConfig()
+			self.budget = config.result_pump_budget or 0.005
+		return self.budget
+
+	def drain(self, dt=None):
+		self.frames += 1
+		deadline = time.perf_counter() + self.getBudget()
+		while self.queue:
+			f, args, kw = self.queue.popleft()
+			self.called += 1
+			try:
+				f(*args, **kw)
+			except Exception as e:
+				print_exc()
+			if time.perf_counter() >= deadline:
+				break
+		with self.lock:
+			if len(self.queue) == 0:
+				self.scheduled = False
+				return
+		Clock.schedule_once(self.drain, 0)
+
+	def stats(self):
+		return {
+			"pending":len(self.queue),
+			"posted":self.posted,
+			"called":self.called,
+			"frames":self.frames
+		}
+
+result_pump = ResultPump()
 
 class ThreadCall(Thread,EventDispatcher):
 	def __init__(self,target, args=(), kwargs={}):
@@ -22,23 +109,15 @@ class ThreadCall(Thread,EventDispatcher):
 		self.daemon = False
 		self.target = target
 		self.args = args
-		self.timing = None
 		self.kwargs = kwargs
-	
-	def start(self):
-		Thread.start(self)
-		self.timing = Clock.schedule_once(self.checkStop,0)
 
 	def run(self):
 		try:
-			# print('ThreadCall()',self.args,'start...')
 			self.rez = self.target(*self.args,**self.kwargs)
-			self.dispatch('on_result',self.rez)
-			# print('ThreadCall()',*self.args,'finished...')
+			result_pump.post(self.dispatch, 'on_result', self.rez)
 
 		except Exception as e:
-			# print('ThreadCall()',*self.args,'Error...')
-			self.dispatch('on_error',e)
+			result_pump.post(self.dispatch, 'on_error', e)
 
 	def on_result(self, v):
 		pass # print('ThreadCall():on_result() called,v=',v)
@@ -46,51 +125,773 @@ class ThreadCall(Thread,EventDispatcher):
 	def on_error(self,e):
 		pass
 
-	def checkStop(self,timestamp):
-		x = self.join(timeout=0.001)
-		if self.is_alive():
-			self.timing = Clock.schedule_once(self.checkStop,0)
+USER_VISIBLE = 0
+PREFETCH = 10
+BACKGROUND = 20
+
+class Cancelled(Exception):
+	"""
+	the error a task's errback gets when the task is dropped because
+	its widget was removed
+	"""
+	pass
+
+class Cancellable:
+	"""
+	base of the task handles, a handle watching a widget is cancelled
+	when the widget is removed from its parent and not added again in
+	the same frame, or when the widget was in the window and it is not
+	when the result comes, the errback then gets a Cancelled error.
+	cancel() drops the task without calling anything
+	"""
+	def __init__(self):
+		self.state = 'pending'
+		self.lock = Lock()
+		self.widget_ref = None
+		self.attached = False
+
+	def watch(self, widget):
+		if widget is None:
+			return
+		self.widget_ref = ref(widget)
+		self.attached = widget.get_root_window() is not None
+		widget.fbind('parent', self.on_widget_parent)
+
+	def unwatch(self):
+		w = self.widget_ref() if self.widget_ref else None
+		self.widget_ref = None
+		if w is not None:
+			w.funbind('parent', self.on_widget_parent)
+
+	def on_widget_parent(self, w, parent):
+		if parent is None:
+			# a widget moved to another parent is not removed
+			Clock.schedule_once(self.checkWidget, 0)
+
+	def checkWidget(self, t=None):
+		w = self.widget_ref() if self.widget_ref else None
+		if w is not None and w.parent is not None:
+			return
+		if self.cancel():
+			self.fail(Cancelled('widget removed'))
+
+	def fail(self, e):
+		"""
+		called in ui thread, tell the errback the task failed
+		"""
+		pass
+
+	def detached(self):
+		if self.widget_ref is None or not self.attached:
+			return False
+		w = self.widget_ref()
+		return w is None or w.get_root_window() is None
+
+	def cancel(self):
+		with self.lock:
+			if self.state in ['done', 'cancelled']:
+				return False
+			self.state = 'cancelled'
+		self.unwatch()
+		return True
+
+	def cancelled(self):
+		return self.state == 'cancelled'
+
+	def done(self):
+		return self.state in ['done', 'cancelled']
+
+	def progress(self, f, v):
+		"""
+		called in ui thread, call f(self, v) for partial results
+		"""
+		if self.state == 'cancelled':
+			return
+		f(self, v)
+
+	def finish(self, f, v):
+		"""
+		called in ui thread, call f(self, v) if it is not cancelled
+		"""
+		with self.lock:
+			if self.state == 'cancelled':
+				return
+			self.state = 'done'
+		detached = self.detached()
+		self.unwatch()
+		if detached:
+			self.state = 'cancelled'
+			self.fail(Cancelled('widget left the window'))
+			return
+		if f:
+			f(self, v)
+
+class WorkerTask(Cancellable):
+	"""
+	handle of a task added to Workers, callback(task, result) and
+	errback(task, e) are called in the ui thread through result_pump,
+	cancel() drops a pending task, or the callbacks of a running one
+	"""
+	def __init__(self,callee,callback,errback=None,kwargs={},priority=0):
+		Cancellable.__init__(self)
+		self.callee = callee
+		self.callback = callback
+		self.errback = errback
+		self.kwargs = kwargs
+		self.priority = priority
+		self.queued_at = time.perf_counter()
+
+	def fail(self, e):
+		if self.errback:
+			self.errback(self, e)
+
+	def run(self):
+		with self.lock:
+			if self.state != 'pending':
+				return
+			self.state = 'running'
+		instrument.record('queue_wait', 'worker', self.queued_at,
+					time.perf_counter() - self.queued_at)
+		try:
+			rez = self.callee(**self.kwargs)
+		except Exception as e:
+			result_pump.post(self.finish,self.errback,e)
 			return
+		result_pump.post(self.finish,self.callback,rez)
 
-class Workers(Thread):
+class TaskHandle(Cancellable):
+	"""
+	handle of a HttpClient request, cancel() drops its callbacks and
+	cancels the work under it when no other request shares it
+	"""
+	def __init__(self,callback,errback=None,priority=USER_VISIBLE):
+		Cancellable.__init__(self)
+		self.cb = callback
+		self.eb = errback
+		self.priority = priority
+		self.task = None
+		self.flight = None
+
+	def callback(self,o,d):
+		self.finish(self.cb,d)
+
+	def errback(self,o,e):
+		self.finish(self.eb,e)
+
+	def fail(self, e):
+		if self.eb:
+			self.eb(self, e)
+
+	def cancel(self):
+		if not Cancellable.cancel(self):
+			return False
+		if self.flight is not None:
+			single_flight.leave(self.flight,self.callback)
+		elif self.task is not None:
+			self.task.cancel()
+		return True
+
+class Workers:
+	"""
+	thread pool, tasks are taken from a priority queue (lower priority
+	value first, FIFO in the same priority) by at most maxworkers
+	reusable worker threads, the threads are started when needed
+	"""
 	def __init__(self,maxworkers):
-		super().__init__()
 		self.max_workers = maxworkers
-		self.tasks = []
-		# task = [callee,callback,kwargs]
+		self.queue = PriorityQueue()
+		self.seq = count()
+		self.threads = []
+		self.idle = 0
 		self.lock = Lock()
-		self.work_sema = BoundedSemaphore(value=self.max_workers)
-		self.running = False
-	def run(self):
-		self.running = True
-		while self.running:
-			if len(self.tasks) == 0:
-				time.sleep(0.001)
-				continue
-			task = None
+		self._running = False
+
+	@property
+	def running(self):
+		return self._running
+
+	@running.setter
+	def running(self, v):
+		if v:
+			self.start()
+		else:
+			self.shutdown()
+
+	def start(self):
+		with self.lock:
+			self._running = True
+		for i in range(min(self.queue.qsize(), self.max_workers)):
+			self.adjustThreads()
+
+	def adjustThreads(self):
+		"""
+		start a thread if there are more queued tasks than threads
+		waiting for one, a thread being started counts as waiting
+		"""
+		with self.lock:
+			if not self._running:
+				return
+			if self.queue.qsize() <= self.idle or \
+					len(self.threads) >= self.max_workers:
+				return
+			t = Thread(target=self.work, daemon=True)
+			self.threads.append(t)
+			self.idle += 1
+		t.start()
+
+	def work(self):
+		while True:
+			priority, seq, task = self.queue.get()
 			with self.lock:
-				task = self.tasks.pop()
+				self.idle -= 1
 			if task is None:
+				break
+			# a task added while this thread was still counted as
+			# waiting did not start a thread
+			self.adjustThreads()
+			try:
+				task.run()
+			except Exception as e:
+				print_exc()
+			with self.lock:
+				self.idle += 1
+		with self.lock:
+			self.threads.remove(current_thread())
+
+	def add(self,callee,callback,errback=None,kwargs={},
+					priority=USER_VISIBLE,
+					widget=None):
+		"""
+		add a task, return its WorkerTask handle, priority is
+		USER_VISIBLE, PREFETCH, BACKGROUND or any number, the task is
+		cancelled when widget is removed from the window
+		"""
+		task = WorkerTask(callee,callback,errback=errback,
+						kwargs=kwargs,
+						priority=priority)
+		task.watch(widget)
+		self.queue.put((priority,next(self.seq),task))
+		self.adjustThreads()
+		return task
+
+	def qsize(self):
+		return self.queue.qsize()
+
+	def stats(self):
+		with self.lock:
+			return {
+				"queued":self.queue.qsize(),
+				"threads":len(self.threads),
+				"idle":self.idle
+			}
+
+	def shutdown(self,wait=False,timeout=None):
+		"""
+		cancel the pending tasks and stop the worker threads,
+		running tasks are finished
+		"""
+		with self.lock:
+			self._running = False
+			threads = self.threads[:]
+		while True:
+			try:
+				priority, seq, task = self.queue.get_nowait()
+			except Empty:
+				break
+			if task:
+				task.cancel()
+		for t in threads:
+			self.queue.put((-1,next(self.seq),None))
+		if wait:
+			for t in threads:
+				t.join(timeout)
+
+MSGPACK_TYPES = ['application/msgpack', 'application/x-msgpack']
+
+def columnsToRows(columns, arrays):
+	"""
+	expand column arrays to row dicts
+	"""
+	return [ dict(zip(columns, values)) for values in zip(*arrays) ]
+
+def expandRows(data):
+	"""
+	a columnar "rows", {"columns":[names], "arrays":[[values], ...]}
+	one array a column, is expanded to row dicts
+	"""
+	if type(data) != type({}):
+		return data
+	rows = data.get('rows')
+	if type(rows) == type({}) and 'columns' in rows and 'arrays' in rows:
+		data = data.copy()
+		data['rows'] = columnsToRows(rows['columns'], rows['arrays'])
+	return data
+
+def decodeData(data):
+	"""
+	unwrap {"status":"OK", "data":...} the same way
+	Http_Client.webcall() does
+	"""
+	if type(data) != type({}):
+		return data
+	status = data.get('status',None)
+	if status is None:
+		return expandRows(data)
+	if status == 'OK':
+		return expandRows(data.get('data'))
+	return data
+
+def decodeText(text):
+	"""
+	turn a 200 response body into data the same way
+	Http_Client.webcall() does
+	"""
+	try:
+		data = json.loads(text)
+	except:
+		return text
+	return decodeData(data)
+
+def decodeBody(content_type, content, encoding=None):
+	"""
+	decode a json or MessagePack body
+	"""
+	ctype = (content_type or '').split(';')[0].strip().lower()
+	with instrument.span('parse', 'net', bytes=len(content)):
+		if ctype in MSGPACK_TYPES and msgpack is not None:
+			return decodeData(msgpack.unpackb(content, raw=False))
+		return decodeText(content.decode(encoding or 'utf-8', 'replace'))
+
+class TransferStats:
+	"""
+	bytes on the wire against decoded body bytes, by content encoding
+	and type
+	"""
+	def __init__(self):
+		self.lock = Lock()
+		self.responses = 0
+		self.wire_bytes = 0
+		self.body_bytes = 0
+		self.encodings = {}
+		self.types = {}
+
+	def add(self, resp):
+		try:
+			wire = resp.raw.tell()
+		except Exception:
+			wire = len(resp.content)
+		encoding = resp.headers.get('Content-Encoding', 'identity')
+		ctype = (resp.headers.get('Content-Type') or '').split(';')[0]
+		with self.lock:
+			self.responses += 1
+			self.wire_bytes += wire
+			self.body_bytes += len(resp.content)
+			self.encodings[encoding] = self.encodings.get(encoding, 0) + 1
+			self.types[ctype] = self.types.get(ctype, 0) + 1
+
+	def stats(self):
+		return {
+			"responses":self.responses,
+			"wire_bytes":self.wire_bytes,
+			"body_bytes":self.body_bytes,
+			"encodings":self.encodings.copy(),
+			"types":self.types.copy()
+		}
+
+transfer_stats = TransferStats()
+
+def decodeResponse(resp):
+	transfer_stats.add(resp)
+	return decodeBody(resp.headers.get('Content-Type'), resp.content,
+				resp.encoding)
+
+class SingleFlight:
+	"""
+	in-flight request deduplication, identical GETs (method, url,
+	params and headers) running at the same time share one network call.
+	join()/done()/failed() fan the result out to the callbacks, every
+	callback but the first gets a copy of the data, so they can change
+	it freely. run() does the same for blocking calls.
+	"""
+	def __init__(self):
+		self.lock = Lock()
+		self.flights = {}
+		self.blocking = {}
+		self.requests = 0
+		self.coalesced = 0
+
+	def key(self, method, url, params={}, headers={}):
+		try:
+			return json.dumps([method, url, params, headers],
+						sort_keys=True, default=str)
+		except Exception:
+			return None
+
+	def join(self, key, callback, errback):
+		"""
+		return True if the same request is in flight, the callbacks
+		are called when it is done
+		"""
+		with self.lock:
+			self.requests += 1
+			flight = self.flights.get(key)
+			if flight is not None:
+				flight['waiters'].append((callback, errback))
+				self.coalesced += 1
+				return True
+			self.flights[key] = {
+				"waiters":[(callback, errback)],
+				"task":None
+			}
+			return False
+
+	def setTask(self, key, task):
+		with self.lock:
+			flight = self.flights.get(key)
+			if flight is not None:
+				flight['task'] = task
+
+	def leave(self, key, callback):
+		"""
+		remove a waiter, the request is cancelled when nobody waits
+		"""
+		with self.lock:
+			flight = self.flights.get(key)
+			if flight is None:
+				return
+			flight['waiters'] = [ w for w in flight['waiters'] \
+									if w[0] != callback ]
+			if len(flight['waiters']) > 0:
+				return
+			del self.flights[key]
+		if flight['task'] is not None:
+			flight['task'].cancel()
+
+	def pop(self, key):
+		with self.lock:
+			flight = self.flights.pop(key, None)
+		return flight['waiters'] if flight else []
+
+	def done(self, key, o, data):
+		for i, (callback, errback) in enumerate(self.pop(key)):
+			if callback is None:
 				continue
-			with self.work_sema:
-				callee,callback,errback,kwargs = task
-				x = ThreadCall(callee,kwargs=kwargs)
-				x.bind(on_result=callback)
-				"""
-				并发的时候，只有一个callback会被调用
-				"""
-				if errback:
-					x.bind(on_error=errback)
-				x.start()
+			try:
+				callback(o, data if i == 0 else deepcopy(data))
+			except Exception as e:
+				print_exc()
+
+	def failed(self, key, o, e):
+		for callback, errback in self.pop(key):
+			if errback is None:
+				continue
+			try:
+				errback(o, e)
+			except Exception as e1:
+				print_exc()
 
-	def add(self,callee,callback,errback=None,kwargs={}):
+	def run(self, key, f):
+		"""
+		return f(), if the same key is running in another thread,
+		wait for it and share its result instead
+		"""
 		with self.lock:
-			self.tasks.insert(0,[callee,callback,errback,kwargs])
+			self.requests += 1
+			flight = self.blocking.get(key)
+			leader = flight is None
+			if leader:
+				flight = self.blocking[key] = {'event':Event()}
+			else:
+				self.coalesced += 1
+		if not leader:
+			flight['event'].wait()
+			if 'error' in flight:
+				raise flight['error']
+			return flight['result']
+		try:
+			flight['result'] = f()
+			return flight['result']
+		except Exception as e:
+			flight['error'] = e
+			raise e
+		finally:
+			with self.lock:
+				del self.blocking[key]
+			flight['event'].set()
+
+	def stats(self):
+		return {
+			"inflight":len(self.flights) + len(self.blocking),
+			"requests":self.requests,
+			"coalesced":self.coalesced
+		}
+
+single_flight = SingleFlight()
+
+instrument.addProvider('result_pump', result_pump.stats)
+instrument.addProvider('single_flight', single_flight.stats)
+instrument.addProvider('transfer', transfer_stats.stats)
+
+@SingletonDecorator
+class SessionPool:
+	"""
+	process wide http connection pool, every HttpClient shares one
+	HTTPAdapter, so keep-alive connections are reused across clients
+	and threads. requests.Session is not thread-safe, each thread gets
+	its own Session mounted with the shared adapter and cookie jar.
+
+	config:
+		http_pool_hosts: hosts to keep connections for, default 16
+		http_pool_maxsize: connections per host, default 8
+		http_pool_block: wait for a free connection instead of
+			opening more than http_pool_maxsize, default true
+	"""
+	def __init__(self):
+		config = getConfig()
+		self.pool_hosts = config.http_pool_hosts or 16
+		self.pool_maxsize = config.http_pool_maxsize or 8
+		self.pool_block = config.http_pool_block is not False
+		self.adapter = HTTPAdapter(pool_connections=self.pool_hosts,
+						pool_maxsize=self.pool_maxsize,
+						pool_block=self.pool_block)
+		self.cookies = RequestsCookieJar()
+		self.data_headers = self.negotiateHeaders(config)
+		self.local = local()
+		self.lock = Lock()
+		self.sessions = 0
+
+	def negotiateHeaders(self, config):
+		"""
+		headers the data loaders send (HttpClient.dataHeaders()),
+		requests asks for gzip/deflate, and br when brotli is
+		installed, MessagePack and columnar rows are asked for as
+		config "data_transport" allows, both default true
+		"""
+		opts = config.data_transport
+		if not isinstance(opts, (dict, DictObject)):
+			opts = {}
+		headers = {}
+		if msgpack is not None and opts.get('msgpack', True):
+			headers['Accept'] = ', '.join(MSGPACK_TYPES) + \
+						', application/json;q=0.9, */*;q=0.8'
+		if opts.get('columnar', True):
+			headers['X-Rows-Format'] = 'columnar'
+		return headers
+
+	def getSession(self):
+		s = getattr(self.local, 'session', None)
+		if s is None:
+			s = requests.Session()
+			s.verify = False
+			s.cookies = self.cookies
+			s.mount('http://', self.adapter)
+			s.mount('https://', self.adapter)
+			self.local.session = s
+			with self.lock:
+				self.sessions += 1
+		return s
+
+	def stats(self):
+		"""
+		connections opened and requests sent per host,
+		reused = requests - connections
+		"""
+		pools = self.adapter.poolmanager.pools
+		hosts = {}
+		for k in pools.keys():
+			try:
+				p = pools[k]
+			except KeyError:
+				continue
+			host = '%s://%s:%s' % (k.key_scheme, k.key_host, k.key_port)
+			hosts[host] = {
+				"connections":p.num_connections,
+				"requests":p.num_requests,
+				"reused":p.num_requests - p.num_connections
+			}
+		return {
+			"sessions":self.sessions,
+			"maxsize":self.pool_maxsize,
+			"hosts":hosts
+		}
 
 class HttpClient(Http_Client):
+	"""
+	Http_Client on the process wide SessionPool, it is cheap to create
+	one for every request
+	"""
 	def __init__(self):
+		self.pool = SessionPool()
 		super().__init__()
+		# Http_Client.__init__() made a Session of its own, use the pool
+		self.session = None
 		self.workers = App.get_running_app().workers
+
+	@property
+	def s(self):
+		"""
+		the Session set on this client, else the pooled one of the
+		calling thread
+		"""
+		if self.session is not None:
+			return self.session
+		return self.pool.getSession()
+
+	@s.setter
+	def s(self, session):
+		self.session = session
+
+	def _webcall(self,url,method="GET",
+				params={},
+				files={},
+				headers={},
+				stream=False,
+				timeout=None,
+				progress=None):
+		"""
+		Http_Client._webcall() sends every request unstreamed,
+		this one honours stream, and it goes through Resilience for
+		retries, circuit breaking and timeout.
+		files are streamed from disk, progress(sent, total) is called
+		in the sending thread, such a request is not retried, the
+		files are read, and only the connect timeout applies to it
+		by default
+		"""
+		resilience = Resilience()
+		streaming = method != 'GET' and bool(files)
+		f = partial(self._send, url, method=method, params=params,
+					files=files, headers=headers, stream=stream,
+					timeout=resilience.getTimeout(timeout, streaming),
+					progress=progress)
+		with instrument.span('fetch', 'net', url=url, method=method):
+			return resilience.call(url, method, f,
+						retries=0 if streaming else None)
+
+	def _send(self,url,method="GET",
+				params={},
+				files={},
+				headers={},
+				stream=False,
+				timeout=None,
+				progress=None):
+		domain = self.url2domain(url)
+		sessionid = hostsessions.get(domain,None)
+		headers = headers.copy()
+		if sessionid:
+			headers.update({'session':sessionid})
+		
+		if method in ['GET']:
+			req = requests.Request(method,url,
+					params=params,headers=headers)
+		elif files:
+			body = MultipartReader(params, files, progress=progress)
+			headers['Content-Type'] = body.content_type
+			req = requests.Request(method,url,
+					data=body,headers=headers)
+		else:
+			req = requests.Request(method,url,
+					data=params,files=files,headers=headers)
+		resp = self.sendRequest(req, stream=stream, timeout=timeout)
+		if resp.status_code == 304:
+			# the answer to a conditional GET, the caller has the body
+			return resp
+
+		if resp.status_code != 200:
+			print('Error', url, method, 
+					params, resp.status_code,
+					type(resp.status_code))
+			resp.close()
+			raise HTTPError(resp.status_code,url)
+		return resp
+
+	def sendRequest(self, req, stream=False, timeout=None):
+		"""
+		send the requests.Request req, the Set-Cookie session is kept
+		for the host, 401 and 403 raise NeedLogin and
+		InsufficientPrivilege, other statuses are left to the caller
+		"""
+		req.register_hook('response', self.response_handler)
+		s = self.s
+		prepped = s.prepare_request(req)
+		self.prepped_handler(prepped)
+		resp = s.send(prepped, stream=stream, timeout=timeout)
+		if resp.status_code in [200, 201, 308]:
+			h = resp.headers.get('Set-Cookie',None)
+			if h:
+				sessionid = h.split(';')[0]
+				hostsessions[self.url2domain(req.url)] = sessionid
+
+		if resp.status_code == 401:
+			print('NeedLogin:',req.url)
+			resp.close()
+			raise NeedLogin
+
+		if resp.status_code == 403:
+			resp.close()
+			raise InsufficientPrivilege
+		return resp
+
+	def sendData(self, method, url, params={}, data=None, headers={},
+				timeout=None):
+		"""
+		send data as the body and params in the query string
+		"""
+		headers = headers.copy()
+		sessionid = hostsessions.get(self.url2domain(url),None)
+		if sessionid:
+			headers.update({'session':sessionid})
+		req = requests.Request(method, url, params=params, data=data,
+					headers=headers)
+		return self.sendRequest(req, timeout=timeout)
+
+	def webcall(self,url,method="GET",
+				params={},
+				files={},
+				headers={},
+				stream=False,
+				timeout=None):
+		cache = HttpCache()
+		if stream:
+			return self._webcall(url, method=method, params=params,
+						files=files, headers=headers, stream=stream,
+						timeout=timeout)
+		if method != 'GET' or not cache.enabled:
+			resp = self._webcall(url, method=method, params=params,
+						files=files, headers=headers, timeout=timeout)
+			return decodeResponse(resp)
+		return cache.fetch(self, url, params=params, headers=headers,
+						timeout=timeout,
+						scope=self.cacheScope(url))
+
+	def dataHeaders(self, headers={}):
+		"""
+		headers with the MessagePack and columnar rows negotiation,
+		for the requests of row data
+		"""
+		h = self.pool.data_headers.copy()
+		h.update(headers)
+		return h
+
+	def bufferedWebcall(self, **kwargs):
+		"""
+		webcall() for the callbacks, a streamed response is read in
+		the worker thread, so the callback in ui thread does not wait
+		on the network and the pooled connection is released at once
+		"""
+		resp = self.webcall(**kwargs)
+		if kwargs.get('stream'):
+			resp.content	# reads the body
+		return resp
+
+	def cacheScope(self, url):
+		"""
+		the login session and the cookies a request to url goes with,
+		cached responses are kept apart by them
+		"""
+		sessionid = hostsessions.get(self.url2domain(url),None)
+		cookie = get_cookie_header(self.pool.cookies,
+						requests.Request('GET', url))
+		return [sessionid, cookie]
 		
 	def __call__(self,url,method="GET",
 				params={},
@@ -98,50 +899,288 @@ class HttpClient(Http_Client):
 				files={},
 				stream=False,
 				callback=None,
-				errback=None):
+				errback=None,
+				priority=USER_VISIBLE,
+				widget=None,
+				timeout=None):
+		"""
+		without callback, do the request and return the data,
+		else do it in background and return a TaskHandle, the request
+		is cancelled when widget is removed from the window.
+		with stream=True the callback gets the response with its body
+		already read in the worker thread.
+		timeout in seconds or (connect, read), default from config
+		"""
 		def cb(t,resp):
 			return resp
 
 		if callback is None:
 			try:
 				resp = self.webcall(url, method=method,
-						params=params, files=files, headers=headers)
+						params=params, files=files, headers=headers,
+						timeout=timeout)
 				return cb(None,resp)
 			except Exception as e:
 				raise e
+		handle = TaskHandle(callback,errback,priority=priority)
+		handle.watch(widget)
+		callback = handle.callback
+		errback = handle.errback
 		kwargs = {
 			"url":url,
 			"method":method,
 			"params":params,
 			"files":files,
 			"stream":stream,
-			"headers":headers
+			"headers":headers,
+			"timeout":timeout
+		}
+
+		if method == 'GET' and not stream:
+			cache = HttpCache()
+			if cache.enabled:
+				# memory tier only, the worker looks the disk up
+				hit, data = cache.peek(url, params=params, headers=headers,
+							scope=self.cacheScope(url), memory=True)
+				if hit:
+					result_pump.post(callback, None, data)
+					return handle
+			key = single_flight.key(method, url, params, headers)
+			if key is not None:
+				handle.flight = key
+				if single_flight.join(key, callback, errback):
+					return handle
+				callback = partial(single_flight.done, key)
+				errback = partial(single_flight.failed, key)
+
+		if not stream and getConfig().http_transport == 'asyncio':
+			from .asynchttp import AsyncTransport
+			del kwargs['stream']
+			transport = AsyncTransport()
+			task = transport.call(transport.webcall(**kwargs),
+						callback,errback)
+		else:
+			task = self.workers.add(self.bufferedWebcall,callback,errback,
+						kwargs=kwargs,
+						priority=priority)
+		handle.task = task
+		if handle.flight is not None:
+			single_flight.setTask(handle.flight, task)
+		return handle
+
+	def getRows(self, url, method='GET', params={}, headers={},
+				on_rows=None,
+				callback=None,
+				errback=None,
+				batch_size=None,
+				priority=USER_VISIBLE,
+				widget=None,
+				timeout=None):
+		"""
+		stream a {..., "rows":[...]} document, the rows are decoded
+		in worker thread as they arrive, on_rows(handle, rows) is called
+		in ui thread for every batch_size rows (config stream_batch_rows,
+		default 200), then callback(handle, data) with the rest of the
+		document ("rows" is empty). return a TaskHandle
+		"""
+		if batch_size is None:
+			batch_size = getConfig().stream_batch_rows or 200
+		handle = TaskHandle(callback,errback,priority=priority)
+		handle.watch(widget)
+		kwargs = {
+			"url":url,
+			"method":method,
+			"params":params,
+			"headers":self.dataHeaders(headers),
+			"handle":handle,
+			"on_rows":on_rows,
+			"batch_size":batch_size,
+			"timeout":timeout
+		}
+		handle.task = self.workers.add(self.streamRows,
+					handle.callback,handle.errback,
+					kwargs=kwargs,
+					priority=priority)
+		return handle
+
+	def streamRows(self, url, method, params, headers, handle, on_rows,
+				batch_size, timeout=None):
+		resp = self._webcall(url, method=method, params=params,
+					headers=headers, stream=True, timeout=timeout)
+		ctype = (resp.headers.get('Content-Type') or '').split(';')[0]
+		if ctype.strip().lower() in MSGPACK_TYPES:
+			data = decodeResponse(resp)
+			rows = data.pop('rows', []) if isinstance(data, dict) else []
+			for i in range(0, len(rows), batch_size):
+				if on_rows:
+					result_pump.post(handle.progress, on_rows,
+							rows[i:i+batch_size])
+			if isinstance(data, dict):
+				data['rows'] = []
+			return data
+		decoder = RowsDecoder()
+		textdecoder = codecs.getincrementaldecoder(
+					resp.encoding or 'utf-8')('replace')
+		batch = []
+		def flush(batch):
+			if on_rows and batch:
+				result_pump.post(handle.progress, on_rows, batch)
+		try:
+			for chunk in resp.iter_content(chunk_size=16384):
+				if handle.cancelled():
+					return None
+				batch += decoder.feed(textdecoder.decode(chunk))
+				if len(batch) >= batch_size:
+					flush(batch)
+					batch = []
+			batch += decoder.feed(textdecoder.decode(b'', final=True))
+		finally:
+			resp.close()
+		flush(batch)
+		return decodeData(decoder.close())
+
+	def progressReporter(self, handle, on_progress):
+		"""
+		progress(sent, total) for the sending thread, it calls
+		on_progress(handle, (sent, total)) in ui thread, once an
+		upload_progress_interval seconds (config, default 0.1)
+		"""
+		if on_progress is None:
+			return None
+		def report(sent, total):
+			result_pump.post(handle.progress, on_progress, (sent, total))
+		interval = getConfig().upload_progress_interval
+		if interval is None:
+			interval = 0.1
+		return ProgressThrottle(report, interval)
+
+	def upload(self, url, files, params={}, headers={}, method='POST',
+				on_progress=None,
+				callback=None,
+				errback=None,
+				priority=USER_VISIBLE,
+				widget=None,
+				timeout=None):
+		"""
+		multipart upload in worker thread, the files are read from disk
+		while the body is sent, on_progress(handle, (sent, total)) is
+		called in ui thread. return a TaskHandle
+		"""
+		handle = TaskHandle(callback,errback,priority=priority)
+		handle.watch(widget)
+		kwargs = {
+			"url":url,
+			"method":method,
+			"params":params,
+			"files":files,
+			"headers":headers,
+			"timeout":timeout,
+			"progress":self.progressReporter(handle, on_progress)
+		}
+		handle.task = self.workers.add(self.uploadcall,
+					handle.callback,handle.errback,
+					kwargs=kwargs,
+					priority=priority)
+		return handle
+
+	def uploadcall(self, url, method, params, files, headers,
+				timeout=None, progress=None):
+		resp = self._webcall(url, method=method, params=params,
+					files=files, headers=headers, timeout=timeout,
+					progress=progress)
+		return decodeResponse(resp)
+
+	def resumableUpload(self, url, filename, params={}, headers={},
+				method='PUT',
+				chunk_size=None,
+				on_progress=None,
+				callback=None,
+				errback=None,
+				priority=BACKGROUND,
+				widget=None,
+				timeout=None):
+		"""
+		upload filename in chunks with Content-Range (see uploader.py),
+		a failed or cancelled upload goes on from where the server is
+		when it is called again. chunk_size from config
+		upload_chunk_size, default 4M. return a TaskHandle
+		"""
+		if chunk_size is None:
+			chunk_size = getConfig().upload_chunk_size or 4 * 1024 * 1024
+		handle = TaskHandle(callback,errback,priority=priority)
+		handle.watch(widget)
+		kwargs = {
+			"url":url,
+			"filename":filename,
+			"method":method,
+			"params":params,
+			"headers":headers,
+			"chunk_size":chunk_size,
+			"timeout":timeout,
+			"handle":handle,
+			"progress":self.progressReporter(handle, on_progress)
 		}
+		handle.task = self.workers.add(self.resumablecall,
+					handle.callback,handle.errback,
+					kwargs=kwargs,
+					priority=priority)
+		return handle
 
-		self.workers.add(self.webcall,callback,errback,kwargs=kwargs)
+	def resumablecall(self, url, filename, method, params, headers,
+				chunk_size, handle, timeout=None, progress=None):
+		resilience = Resilience()
+		up = ResumableUpload(self.sendData, url, filename, method=method,
+					params=params, headers=headers,
+					chunk_size=chunk_size,
+					timeout=resilience.getTimeout(timeout),
+					progress=progress,
+					cancelled=handle.cancelled,
+					call=partial(resilience.call, url, method))
+		resp = up.run()
+		if resp is None:
+			return None
+		return decodeResponse(resp)
 
-	def get(self, url, params={}, headers={}, callback=None, errback=None):
+	def get(self, url, params={}, headers={}, callback=None, errback=None,
+				priority=USER_VISIBLE, widget=None, timeout=None):
 		return self.__call__(url,method='GET',params=params,
 				headers=headers, callback=callback,
-				errback=errback)
-	def post(self, url, params={}, headers={}, files={}, callback=None, errback=None):
+				errback=errback, priority=priority, widget=widget,
+				timeout=timeout)
+	def post(self, url, params={}, headers={}, files={}, callback=None,
+				errback=None, priority=USER_VISIBLE, widget=None,
+				timeout=None, on_progress=None):
+		if files and callback is not None:
+			return self.upload(url, files, params=params, headers=headers,
+					on_progress=on_progress, callback=callback,
+					errback=errback, priority=priority, widget=widget,
+					timeout=timeout)
 		return self.__call__(url,method='POST',params=params, files=files,
 				headers=headers, callback=callback,
-				errback=errback)
+				errback=errback, priority=priority, widget=widget,
+				timeout=timeout)
 
-	def put(self, url, params={}, headers={}, callback=None, errback=None):
+	def put(self, url, params={}, headers={}, callback=None, errback=None,
+				priority=USER_VISIBLE, widget=None, timeout=None):
 		return self.__call__(url,method='PUT',params=params,
 				headers=headers, callback=callback,
-				errback=errback)
+				errback=errback, priority=priority, widget=widget,
+				timeout=timeout)
 
-	def delete(self, url, params={}, headers={}, callback=None, errback=None):
+	def delete(self, url, params={}, headers={}, callback=None,
+				errback=None, priority=USER_VISIBLE, widget=None,
+				timeout=None):
 		return self.__call__(url,method='DELETE',params=params,
 				headers=headers, callback=callback,
-				errback=errback)
+				errback=errback, priority=priority, widget=widget,
+				timeout=timeout)
 
-	def option(self, url, params={}, headers={}, callback=None, errback=None):
+	def option(self, url, params={}, headers={}, callback=None,
+				errback=None, priority=USER_VISIBLE, widget=None,
+				timeout=None):
 		return self.__call__(url,method='OPTION',params=params,
-				headers=headers, callback=callback, errback=errback)
+				headers=headers, callback=callback, errback=errback,
+				priority=priority, widget=widget, timeout=timeout)
 	
 if __name__ == '__main__':
 	from kivy.uix.textinput import TextInput
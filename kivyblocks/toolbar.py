@@ -1,3 +1,4 @@
+from functools import partial
 from kivy.logger import Logger
 from kivy.graphics import Color, Rectangle
 from kivy.uix.button import ButtonBehavior
@@ -18,6 +19,7 @@ from .color_definitions import getColors
 from .bgcolorbehavior import BGColorBehavior
 from .baseWidget import Text
 from .toggleitems import PressableBox, ToggleItems
+from .prefetch import Prefetcher
 
 """
 toolbar options
@@ -207,7 +209,14 @@ class ToolPage(BGColorBehavior, BoxLayout):
 				return t
 		return None
 
-	def build_widget(self, url):
+	def build_widget(self, url, name=None):
+		"""
+		the widget of a tool's url, a placeholder while the url loads,
+		content_widgets[name] is set to the widget when it is built
+		"""
+		w = Prefetcher().take(url)
+		if w is not None:
+			return w
 		desc = {
 			"widgettype":"urlwidget",
 			"options":{
@@ -215,15 +224,25 @@ class ToolPage(BGColorBehavior, BoxLayout):
 			}
 		}
 		b = Factory.Blocks()
-		return b.widgetBuild(desc)
+		if name is not None:
+			b.bind(on_built=partial(self.tool_built, name),
+					on_failed=partial(self.tool_failed, name))
+		return b.asyncWidgetBuild(desc)
+
+	def tool_built(self, name, o, w):
+		self.content_widgets[name] = w
+
+	def tool_failed(self, name, o, e):
+		self.content_widgets.pop(name, None)
 
 	def on_press_handle(self, o):
 		name = o.getValue()
 		t = self.get_tool_by_name(name)
 		w = self.content_widgets.get(name)
 		if w is None or t.fresh:
-			w = self.build_widget(t.url)
-			self.content_widgets[name] = w
+			w = self.build_widget(t.url, name)
+			if w is not None:
+				self.content_widgets[name] = w
 		if w:
 			self.content.clear_widgets()
 			self.content.add_widget(w)
@@ -10,6 +10,7 @@ from kivy.uix.widget import Widget
 from kivy.uix.button import ButtonBehavior
 from kivyblocks.widgetExt import ScrollWidget
 from kivyblocks.utils import CSize
+from kivyblocks.threadcall import Cancelled
 from appPublic.dictObject import DictObject
 from appPublic.jsonConfig import getConfig
 from .baseWidget import PressableLabel
@@ -82,7 +83,7 @@ class TreeNode(BGColorBehavior,BoxLayout):
 			}
 		"""
 		self.color_level = color_level if color_level != -1 else tree.color_level + 1
-		self.radius = radius if radius!=[] else tree.audius
+		self.radius = radius if radius!=[] else tree.radius
 		BoxLayout.__init__(self,orientation='vertical',size_hint=(None,None))
 		BGColorBehavior.__init__(self,color=self.color_level,
 							radius=self.radius)
@@ -335,9 +336,12 @@ class Tree(BGColorBehavior, ScrollWidget):
 		Logger.info('Tree: getUrlData(),url=%s',url)
 		hc.get(url,params=params,
 					callback=callback,
-					errback=self.showError)
+					errback=self.showError,
+					widget=self)
 
 	def showError(self,o,e):
+		if isinstance(e, Cancelled):
+			return
 		traceback.print_exc()
 		Logger.info('Tree: showError() o=%s,e=%s',o,e)
 		alert(e,title='error')
@@ -15,10 +15,10 @@ class TwoSides(WidgetReady, BoxLayout):
 		self.portrait_widget = None
 		blocks = Factory.Blocks()
 		blocks.bind(on_built=self.landscape_build)
-		blocks.widgetBuild(landscape)
+		blocks.asyncWidgetBuild(landscape)
 		blocks = Factory.Blocks()
 		blocks.bind(on_built=self.portrait_build)
-		blocks.widgetBuild(portrait)
+		blocks.asyncWidgetBuild(portrait)
 		self.on_size_task = None
 		self.ready_task = None
 
@@ -0,0 +1,259 @@
+import os
+import time
+import hashlib
+import mimetypes
+from uuid import uuid4
+
+from appPublic.http_client import HTTPError
+
+"""
+streaming uploads
+
+MultipartReader is a multipart/form-data body read by requests while it
+sends the request, files are read chunk by chunk, so a big video is
+never loaded into memory, and every read reports the progress.
+
+ResumableUpload sends one file in chunks with Content-Range headers:
+	query:  Content-Range: bytes */<total>, empty body
+	chunk:  Content-Range: bytes <first>-<last>/<total>
+the requests carry X-Upload-Id, the server answers 308 with
+"Range: bytes=0-<last received>" while the file is not complete, and
+200/201 with the result data when it is, so an interrupted upload goes
+on from the last byte the server has.
+
+files are given in the requests form, {name: fileobj} or
+{name: (filename, fileobj[, content_type])}, str or bytes in place of the
+fileobj are the file content, as in requests. open a path with
+open(path, 'rb') to upload the file.
+
+a chunk the server does not take (the next offset does not move on)
+is sent again max_stalls times, then the upload fails.
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+class FilePart:
+	def __init__(self, src, chunk_size=CHUNK_SIZE):
+		self.src = src
+		self.chunk_size = chunk_size
+		if isinstance(src, str):
+			src = self.src = src.encode('utf-8')
+		if isinstance(src, (bytes, bytearray)):
+			self.size = len(src)
+			self.start = 0
+		else:
+			self.start = src.tell() if hasattr(src, 'tell') else 0
+			try:
+				self.size = os.fstat(src.fileno()).st_size - self.start
+			except Exception:
+				src.seek(0, os.SEEK_END)
+				self.size = src.tell() - self.start
+				src.seek(self.start)
+
+	def __len__(self):
+		return self.size
+
+	def chunks(self):
+		if isinstance(self.src, (bytes, bytearray)):
+			for i in range(0, self.size, self.chunk_size):
+				yield bytes(self.src[i:i + self.chunk_size])
+		else:
+			self.src.seek(self.start)
+			yield from self.readChunks(self.src)
+
+	def readChunks(self, f):
+		while True:
+			data = f.read(self.chunk_size)
+			if not data:
+				return
+			yield data
+
+def normalizeFile(name, spec):
+	"""
+	return (filename, src, content_type)
+	"""
+	ctype = None
+	if isinstance(spec, (tuple, list)):
+		filename, src = spec[0], spec[1]
+		if len(spec) > 2:
+			ctype = spec[2]
+	else:
+		src = spec
+		filename = getattr(src, 'name', None)
+		if not isinstance(filename, str):
+			filename = name
+	filename = os.path.basename(str(filename))
+	if ctype is None:
+		ctype = mimetypes.guess_type(filename)[0] or \
+					'application/octet-stream'
+	return filename, src, ctype
+
+class MultipartReader:
+	def __init__(self, fields={}, files={}, progress=None,
+				chunk_size=CHUNK_SIZE):
+		self.boundary = uuid4().hex
+		self.progress = progress
+		self.parts = []
+		for k, v in fields.items():
+			vs = v if isinstance(v, list) else [v]
+			for i in vs:
+				self.parts.append(self.header(k) + b'\r\n' + \
+						str(i).encode('utf-8') + b'\r\n')
+		for name, spec in files.items():
+			filename, src, ctype = normalizeFile(name, spec)
+			self.parts.append(self.header(name, filename, ctype) + b'\r\n')
+			self.parts.append(FilePart(src, chunk_size))
+			self.parts.append(b'\r\n')
+		self.parts.append(('--%s--\r\n' % self.boundary).encode('utf-8'))
+		self.length = sum(len(p) for p in self.parts)
+		self.iter = self.chunks()
+		self.buf = b''
+		self.sent = 0
+
+	def header(self, name, filename=None, ctype=None):
+		h = '--%s\r\nContent-Disposition: form-data; name="%s"' % \
+					(self.boundary, name)
+		if filename is not None:
+			h += '; filename="%s"\r\nContent-Type: %s' % (filename, ctype)
+		return (h + '\r\n').encode('utf-8')
+
+	@property
+	def content_type(self):
+		return 'multipart/form-data; boundary=%s' % self.boundary
+
+	def __len__(self):
+		return self.length
+
+	def chunks(self):
+		for p in self.parts:
+			if isinstance(p, bytes):
+				yield p
+			else:
+				yield from p.chunks()
+
+	def read(self, n=-1):
+		while n is None or n < 0 or len(self.buf) < n:
+			try:
+				self.buf += next(self.iter)
+			except StopIteration:
+				break
+		if n is None or n < 0:
+			data, self.buf = self.buf, b''
+		else:
+			data, self.buf = self.buf[:n], self.buf[n:]
+		self.sent += len(data)
+		if self.progress and data:
+			self.progress(self.sent, self.length)
+		return data
+
+class ProgressThrottle:
+	"""
+	call report(done, total) no more than once an interval seconds,
+	the last one is always reported
+	"""
+	def __init__(self, report, interval=0.1):
+		self.report = report
+		self.interval = interval
+		self.last = 0
+
+	def __call__(self, done, total):
+		now = time.time()
+		if done < total and now - self.last < self.interval:
+			return
+		self.last = now
+		self.report(done, total)
+
+def parseRange(resp):
+	"""
+	the next byte offset the server wants, from "Range: bytes=0-N"
+	"""
+	r = resp.headers.get('Range')
+	if not r:
+		return 0
+	try:
+		return int(r.split('=')[-1].split('-')[-1]) + 1
+	except Exception:
+		return 0
+
+class ResumableUpload:
+	def __init__(self, send, url, filename, method='PUT', params={},
+				headers={}, chunk_size=4 * 1024 * 1024, timeout=None,
+				progress=None, cancelled=None, call=None, max_stalls=3):
+		"""
+		send(method, url, params=, data=, headers=, timeout=) sends a
+		request and returns the response, HttpClient passes sendData()
+		so the session cookie is sent and kept.
+		call(f) sends a request with f(), it defaults to f() itself,
+		HttpClient passes Resilience().call for retries
+		"""
+		self.send_request = send
+		self.url = url
+		self.filename = filename
+		self.method = method
+		self.params = params
+		self.headers = headers
+		self.chunk_size = chunk_size
+		self.timeout = timeout
+		self.progress = progress
+		self.cancelled = cancelled
+		self.call = call or (lambda f: f())
+		self.max_stalls = max_stalls
+		self.total = os.path.getsize(filename)
+		st = os.stat(filename)
+		s = '%s|%s|%d|%s' % (url, os.path.abspath(filename),
+						self.total, st.st_mtime)
+		self.upload_id = hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+	def send(self, content_range, data=b''):
+		h = self.headers.copy()
+		h.update({
+			'X-Upload-Id':self.upload_id,
+			'X-Upload-Filename':os.path.basename(self.filename),
+			'Content-Range':content_range
+		})
+		def f():
+			resp = self.send_request(self.method, self.url,
+						params=self.params, data=data, headers=h,
+						timeout=self.timeout)
+			if resp.status_code not in [200, 201, 308]:
+				raise HTTPError(resp.status_code, self.url)
+			return resp
+		return self.call(f)
+
+	def run(self):
+		"""
+		return the final response, None if it is cancelled
+		"""
+		resp = self.send('bytes */%d' % self.total)
+		if resp.status_code in [200, 201]:
+			self.report(self.total)
+			return resp
+		offset = parseRange(resp)
+		stalls = 0
+		with open(self.filename, 'rb') as f:
+			while True:
+				self.report(offset)
+				if self.cancelled and self.cancelled():
+					return None
+				f.seek(offset)
+				data = f.read(self.chunk_size)
+				last = offset + len(data) - 1
+				resp = self.send('bytes %d-%d/%d' % \
+							(offset, last, self.total), data)
+				if resp.status_code in [200, 201]:
+					self.report(self.total)
+					return resp
+				next_offset = parseRange(resp)
+				if next_offset > self.total or len(data) == 0:
+					raise HTTPError(resp.status_code, self.url)
+				if next_offset <= offset:
+					stalls += 1
+					if stalls > self.max_stalls:
+						raise HTTPError(resp.status_code, self.url)
+				else:
+					stalls = 0
+				offset = next_offset
+
+	def report(self, done):
+		if self.progress:
+			self.progress(done, self.total)
@@ -1,10 +1,31 @@
+import sys
 import requests
+from kivyblocks.uploader import MultipartReader, ProgressThrottle
+
+"""
+upload a file with a streamed multipart body
+usage:
+	python uploadfile.py [file [url]]
+"""
 
 url = "http://localhost:8080/uploadfile.dspy"
 
-files = {
-	"afile":("uploadfile.py",open("uploadfile.py","rb"),"application/python")
-}
+def progress(sent, total):
+	print('%d/%d' % (sent, total))
+
+def upload(url, filename):
+	with open(filename, 'rb') as f:
+		files = {
+			"afile":(filename, f)
+		}
+		body = MultipartReader(files=files,
+					progress=ProgressThrottle(progress, 0.5))
+		r = requests.post(url, data=body,
+					headers={'Content-Type':body.content_type})
+	return r.text
 
-r = requests.post(url,files=files)
-print(r.text)
+if __name__ == '__main__':
+	filename = sys.argv[1] if len(sys.argv) > 1 else 'uploadfile.py'
+	if len(sys.argv) > 2:
+		url = sys.argv[2]
+	print(upload(url, filename))
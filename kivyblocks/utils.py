@@ -36,6 +36,8 @@ def blockImage(name):
 	return os.path.join(p,'imgs',name)
 
 def loaded(widget):
+	if getattr(widget,'loadingwidget',None) is None:
+		return
 	widget.loadingwidget.dismiss()
 	# widget.remove_widget(widget.loadingwidget)
 	del widget.loadingwidget
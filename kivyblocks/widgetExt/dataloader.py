@@ -18,5 +18,5 @@ class DataLoader(EventDispatcher):
 	def on_loaded(self,d):
 		pass #print('on_loaded,data=',d)
 
-	def on_loaderror(self,a,e):
+	def on_loaderror(self,e):
 		pass #print('error:',e)
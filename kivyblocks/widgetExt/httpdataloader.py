@@ -1,32 +1,42 @@
-import sys
-sys.path.append('..')
-sys.path.append('.')
-import time
+from ..asynchttp import AsyncHttpClient, AsyncTransport
+from ..threadcall import result_pump
+from .dataloader import DataLoader
 
 class HttpDataLoader(DataLoader):
-	def __init__(self):
-		super(HttpDataLoader,self).__init__()
-		self.hc = HttpClient()
+	"""
+	load data with the asyncio http transport,
+	await loadData() in a coroutine or call load() from kivy code,
+	on_loaded/on_loaderror are fired in ui thread
+	"""
+	def __init__(self,**kw):
+		super(HttpDataLoader,self).__init__(**kw)
+		self.hc = AsyncHttpClient()
 		
 	async def loadData(self,url,method='GET',params={},headers={}):
 		try:
-			resp = None
 			if method=='GET':
-				resp = await self.hc.get(url,params=params,headers=headers)
+				d = await self.hc.get(url,params=params,headers=headers)
 			else:
-				resp = await self.hc.post(url,data=params,headers=headers)
-				return resp
+				d = await self.hc(url,method=method,params=params,
+							headers=headers)
 		except Exception as e:
 			print('loadData(%s) Error ' % url,e)
-			self.loadError(e)
+			result_pump.post(self.loadError,e)
+			return None
+		result_pump.post(self.dataLoaded,d)
+		return d
+
+	def load(self,url,method='GET',params={},headers={}):
+		return AsyncTransport().submit(self.loadData(url,method=method,
+					params=params,headers=headers))
 
 if __name__ == '__main__':
 	import sys
-	from async_app import AsyncApp, wait_coro
+	from kivy.app import App
 	from kivy.uix.boxlayout import BoxLayout
 	from kivy.uix.button import Button
 	from kivy.uix.textinput import TextInput
-	class MyApp(AsyncApp):
+	class MyApp(App):
 		def build(self):
 			root = BoxLayout(orientation='vertical')
 			btn = Button(text='get Remote data',size_hint_y=None,height=44)
@@ -39,9 +49,8 @@ if __name__ == '__main__':
 			url = sys.argv[1] if len(sys.argv)>1 else 'https://www.baidu.com'
 			hdl = HttpDataLoader()
 			hdl.bind(on_loaded=self.showData)
-			wait_coro(hdl.loadData,url)
-			self.loop.call_later(0.001,hdl.loadData(url))
+			hdl.load(url)
 
 		def showData(self,instance,x):
-			self.txt.text = x
+			self.txt.text = str(x)
 	MyApp().run()
@@ -0,0 +1,64 @@
+from weakref import WeakSet
+from threading import Lock
+
+def isDescendant(w, ancestor):
+	while w is not None:
+		if w is ancestor:
+			return True
+		w = getattr(w, 'parent', None)
+	return False
+
+class WidgetIdIndex:
+	"""
+	index from widget_id to the widgets carry it, widgets are kept by
+	weak reference, so removed and destroyed widgets drop out by
+	themselves. find() scopes the lookup to a subtree by walking up the
+	candidate's parent chain, it costs O(depth) instead of walking the
+	whole tree.
+	"""
+	def __init__(self):
+		self.widgets = {}
+		self.lock = Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def add(self, widget_id, widget):
+		with self.lock:
+			ws = self.widgets.get(widget_id)
+			if ws is None:
+				ws = self.widgets[widget_id] = WeakSet()
+			ws.add(widget)
+
+	def remove(self, widget_id, widget):
+		with self.lock:
+			ws = self.widgets.get(widget_id)
+			if ws is None:
+				return
+			ws.discard(widget)
+			if len(ws) == 0:
+				del self.widgets[widget_id]
+
+	def find(self, widget_id, from_widget):
+		"""
+		return the only indexed widget in from_widget's subtree with
+		widget_id, None when there is none or more than one of them,
+		the caller should fall back to scan the tree in this case
+		"""
+		with self.lock:
+			ws = self.widgets.get(widget_id)
+			candidates = list(ws) if ws else []
+		found = [ w for w in candidates if isDescendant(w, from_widget) ]
+		if len(found) == 1:
+			self.hits += 1
+			return found[0]
+		self.misses += 1
+		return None
+
+	def stats(self):
+		return {
+			"ids":len(self.widgets),
+			"hits":self.hits,
+			"misses":self.misses
+		}
+
+widget_index = WidgetIdIndex()
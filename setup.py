@@ -40,6 +40,12 @@ setup(
 	"appPublic",
 	"sqlor"
     ],
+    extras_require={
+	# config "http_transport":"asyncio"
+	"async":["aiohttp"],
+	# MessagePack data responses
+	"msgpack":["msgpack"]
+    },
     packages=packages,
     package_data=package_data,
     keywords = [
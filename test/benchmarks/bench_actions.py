@@ -0,0 +1,76 @@
+"""
+micro benchmark for bind actions
+
+compare the BindAction dispatcher built by Blocks.buildAction() with
+the old exec generated action function (copied below as legacyAction)
+
+usage:
+	python bench_actions.py [count]
+"""
+import os
+import sys
+import json
+import timeit
+from functools import partial
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from kivy.uix.widget import Widget
+from kivyblocks.blocks import Blocks
+
+class Target(Widget):
+	cnt = 0
+	def inc(self, *args, **kw):
+		Target.cnt += 1
+
+def legacyAction(widget, desc):
+	body="""def action(widget, *args, **kw):
+	jsonstr='''%s'''
+	desc = json.loads(jsonstr)
+	conform_desc = desc.get('conform')
+	blocks = Blocks()
+	if not conform_desc:
+		blocks.uniaction(widget, desc,*args, **kw)
+		return
+""" % (json.dumps(desc))
+	l = {}
+	exec(body, globals(), l)
+	return partial(l['action'], widget)
+
+desc = {
+	"wid":"self",
+	"event":"on_press",
+	"actiontype":"method",
+	"target":"self",
+	"method":"inc",
+	"conform":{
+		"title":"confirm",
+		"message":"are you sure"
+	}
+}
+run_desc = desc.copy()
+del run_desc['conform']
+
+def report(name, cnt, seconds):
+	print('%-28s %10.2f us/op' % (name, seconds * 1000000 / cnt))
+
+def main(cnt=2000):
+	w = Target()
+	blocks = Blocks()
+	report('legacy bind creation', cnt,
+		timeit.timeit(lambda:legacyAction(w, desc), number=cnt))
+	report('BindAction creation', cnt,
+		timeit.timeit(lambda:blocks.buildAction(w, desc), number=cnt))
+
+	legacy = legacyAction(w, run_desc)
+	action = blocks.buildAction(w, run_desc)
+	report('legacy dispatch', cnt, timeit.timeit(legacy, number=cnt))
+	report('BindAction dispatch', cnt, timeit.timeit(action, number=cnt))
+
+if __name__ == '__main__':
+	cnt = 2000
+	if len(sys.argv) > 1:
+		cnt = int(sys.argv[1])
+	main(cnt)
@@ -0,0 +1,468 @@
+"""
+headless benchmark suite for the build engine and the data widgets
+
+every benchmark runs against a local stub http server (stubserver.py)
+in a kivy window that is never shown, it is repeated and reported with
+min/median/mean/stdev in milliseconds, the medians are compared with a
+stored baseline (baseline.json), a benchmark slower than the baseline by
+more than threshold (and by min_delta ms) is a regression, and the exit
+code is 1.
+
+usage:
+	python bench_suite.py [--repeat N] [--only name,...] [--list]
+			[--baseline file] [--save] [--threshold 0.25]
+--save writes the results as the new baseline.
+set SDL_VIDEODRIVER=dummy (or offscreen) where there is no display.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+os.environ.setdefault('KIVY_NO_FILELOG', '1')
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', '..'))
+sys.path.insert(0, here)
+
+from kivy.config import Config
+Config.set('graphics', 'maxfps', '0')
+Config.set('graphics', 'width', '1024')
+Config.set('graphics', 'height', '768')
+
+from appPublic.jsonConfig import getConfig
+from stubserver import StubServer, field_names
+
+BENCHMARKS = {}
+
+def benchmark(name, repeat=None):
+	"""
+	register f(ctx, timer) as a benchmark, f does its setup and times
+	the measured part with "with timer:"
+	"""
+	def deco(f):
+		BENCHMARKS[name] = (f, repeat)
+		return f
+	return deco
+
+class Timer:
+	def __init__(self):
+		self.times = []
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		self.times.append((time.perf_counter() - self.start) * 1000)
+		return False
+
+def wait_until(cond, timeout=30):
+	from kivy.clock import Clock
+	end = time.perf_counter() + timeout
+	while not cond():
+		if time.perf_counter() > end:
+			raise TimeoutError('benchmark wait timeout')
+		Clock.tick()
+		time.sleep(0.0005)
+
+def settle(frames=3):
+	from kivy.clock import Clock
+	for i in range(frames):
+		Clock.tick()
+
+class Context:
+	def __init__(self, server):
+		self.server = server
+		self.tmpdir = tempfile.mkdtemp(prefix='kb_bench_')
+
+	def url(self, path):
+		return self.server.url(path)
+
+def synthetic_desc(n, cols=10):
+	"""
+	n Labels in rows of cols, a third of them with "py::" text, every
+	row has a bind
+	"""
+	rows = []
+	for r in range(0, n, cols):
+		labels = []
+		for i in range(r, min(r + cols, n)):
+			text = "py::'label %d'" % i if i % 3 == 0 else 'label %d' % i
+			labels.append({
+				"widgettype":"Label",
+				"id":"l%d" % i,
+				"options":{"text":text, "font_size":12}
+			})
+		rows.append({
+			"widgettype":"BoxLayout",
+			"options":{"orientation":"horizontal"},
+			"subwidgets":labels,
+			"binds":[{
+				"wid":"self",
+				"event":"on_touch_down",
+				"actiontype":"method",
+				"target":"self",
+				"method":"do_layout"
+			}]
+		})
+	return {
+		"widgettype":"BoxLayout",
+		"options":{"orientation":"vertical"},
+		"subwidgets":rows
+	}
+
+def make_build(n):
+	def bench(ctx, timer):
+		from kivyblocks.blocks import Blocks
+		desc = synthetic_desc(n)
+		with timer:
+			Blocks().widgetBuild(desc)
+	return bench
+
+for n, r in [(10, 50), (100, 20), (1000, 5)]:
+	benchmark('build_%d' % n, repeat=r)(make_build(n))
+
+@benchmark('build_url_100')
+def bench_build_url(ctx, timer):
+	from kivyblocks.blocks import Blocks
+	desc = {
+		"widgettype":"urlwidget",
+		"options":{
+			"url":ctx.url('/desc/100.ui'),
+			"params":{"r":random.random()}
+		}
+	}
+	with timer:
+		Blocks().widgetBuild(desc)
+
+def grid_fields():
+	fs = []
+	for i, n in enumerate(field_names()):
+		f = {"name":n, "label":n.upper(), "width":6}
+		if i < 2:
+			f['freeze'] = True
+		fs.append(f)
+	return fs
+
+def make_grid(ctx, loader):
+	from kivy.core.window import Window
+	from kivyblocks.dg import DataGrid
+	dg = DataGrid(fields=grid_fields(), dataloader=loader)
+	Window.add_widget(dg)
+	return dg
+
+@benchmark('datagrid_add_delete', repeat=3)
+def bench_datagrid(ctx, timer):
+	"""
+	add a 60 rows page to a DataGrid and delete it, no network
+	"""
+	from kivy.core.window import Window
+	from stubserver import make_row
+	rows = [ make_row(i) for i in range(60) ]
+	dg = make_grid(ctx, {"data":rows, "page_rows":60})
+	try:
+		with timer:
+			dg.add_page(None, {"page":1, "dir":"down", "data":rows})
+			settle(1)
+			dg.delete_page(None, dg.dataloader.objectPages.pop(1))
+			settle(1)
+	finally:
+		Window.remove_widget(dg)
+
+@benchmark('datagrid_paging', repeat=3)
+def bench_datagrid_paging(ctx, timer):
+	"""
+	load 5 pages of 20 rows from the stub server through the
+	RelatedLoader, old pages are deleted as new ones come
+	"""
+	from kivy.core.window import Window
+	dg = make_grid(ctx, {"dataurl":ctx.url('/rows'), "page_rows":20})
+	loader = dg.dataloader
+	try:
+		with timer:
+			for p in range(1, 6):
+				loader.loadPage(p)
+				wait_until(lambda:not loader.loading)
+	finally:
+		Window.remove_widget(dg)
+
+def query_store(ctx):
+	"""
+	a RowStore of TOTAL_ROWS rows, built once, "k" has 100 values
+	"""
+	store = getattr(ctx, 'query_store', None)
+	if store is None:
+		from kivyblocks.rowstore import RowStore
+		from stubserver import TOTAL_ROWS, make_row
+		store = RowStore()
+		for i in range(TOTAL_ROWS):
+			r = make_row(i)
+			r['k'] = (i * 7919) % 100
+			r['__posInSet__'] = i + 1
+			store.addRow(str(i), r)
+		ctx.query_store = store
+	return store
+
+@benchmark('grid_query_sort', repeat=10)
+def bench_query_sort(ctx, timer):
+	"""
+	sort 100000 rows on a string and an int key
+	"""
+	from kivyblocks.gridquery import GridQuery
+	store = query_store(ctx)
+	q = GridQuery({"sort":["f02", "-f03"]})
+	with timer:
+		q.run(store)
+
+@benchmark('grid_query_group', repeat=10)
+def bench_query_group(ctx, timer):
+	"""
+	filter 100000 rows and group them by a 100 values key
+	"""
+	from kivyblocks.gridquery import GridQuery
+	store = query_store(ctx)
+	q = GridQuery({
+		"filters":[{"field":"f03", "op":">=", "value":1000}],
+		"group":{"by":["k"], "aggregates":{"n":"count", "f03":"sum"}},
+		"sort":["-n"]
+	})
+	with timer:
+		q.run(store)
+
+@benchmark('tree_expand', repeat=3)
+def bench_tree(ctx, timer):
+	"""
+	expand every node of a 258 node tree loaded from the stub server
+	"""
+	from kivy.core.window import Window
+	from kivy.uix.label import Label
+	from kivyblocks.tree import Tree, TreeNode
+	class LabelNode(TreeNode):
+		def buildContent(self):
+			self.content = Label(text=self.data.text, font_size=12,
+						size_hint=(None, None), size=(160, 24))
+	tree = Tree(url=ctx.url('/tree'), idField='id')
+	tree.setNodeKlass(LabelNode)
+	Window.add_widget(tree)
+	try:
+		tree.buildTree()
+		wait_until(lambda:len(tree.nodes) > 0)
+		with timer:
+			for n in tree.nodes:
+				n.expandall()
+			settle(1)
+	finally:
+		Window.remove_widget(tree)
+
+@benchmark('boxviewer_paging', repeat=3)
+def bench_boxviewer(ctx, timer):
+	"""
+	page through 3 pages of 20 records, a viewer a record is built
+	from the stub server
+	"""
+	from kivy.core.window import Window
+	from kivyblocks.boxViewer import BoxViewer
+	bv = BoxViewer(boxwidth=10, boxheight=6,
+			viewer_url=ctx.url('/viewer.ui'),
+			dataloader={
+				"options":{
+					"dataurl":ctx.url('/rows'),
+					"page_rows":20,
+					"params":{"r":random.random()}
+				}
+			})
+	Window.add_widget(bv)
+	loader = bv.dataloader
+	try:
+		with timer:
+			for p in range(1, 4):
+				loader.loadPage(p)
+				wait_until(lambda:not loader.loading)
+	finally:
+		Window.remove_widget(bv)
+
+@benchmark('graph_redraw', repeat=20)
+def bench_graph(ctx, timer):
+	"""
+	replace the 2000 points of a plot and redraw the graph
+	"""
+	import math
+	from kivyblocks.graph import Graph, MeshLinePlot
+	graph = Graph(xmin=0, xmax=2000, ymin=-1, ymax=1,
+			x_ticks_major=100, x_ticks_minor=5,
+			y_ticks_major=0.25, x_grid_label=True, y_grid_label=True,
+			x_grid=True, y_grid=True,
+			size_hint=(None, None), size=(1000, 600))
+	plot = MeshLinePlot(color=[1, 0, 0, 1])
+	graph.add_plot(plot)
+	phase = random.random()
+	with timer:
+		plot.points = [ (x, math.sin(x / 50 + phase)) for x in range(2000) ]
+		graph._redraw_all()
+
+@benchmark('mapview_tiles', repeat=5)
+def bench_mapview(ctx, timer):
+	"""
+	pan and zoom a 1024x768 map, every move loads new tiles from the
+	stub server
+	"""
+	from kivy.core.window import Window
+	from kivyblocks.mapview import MapView, MapSource
+	source = MapSource(url=ctx.url('/tiles/{z}/{x}/{y}.png'),
+			cache_key='bench%d' % random.randint(0, 1 << 30),
+			subdomains='a', cache_dir=ctx.tmpdir)
+	mv = MapView(map_source=source, zoom=10, lat=31.2, lon=121.5,
+			cache_dir=ctx.tmpdir,
+			size_hint=(None, None), size=(1024, 768))
+	Window.add_widget(mv)
+	def loaded():
+		return not [ t for t in mv._tiles if t.state == 'loading' ]
+	try:
+		wait_until(loaded)
+		with timer:
+			for i in range(1, 5):
+				mv.zoom = 10 + i % 2
+				mv.center_on(31.2 + i * 0.2, 121.5 + i * 0.2)
+				mv.do_update(0)
+				wait_until(loaded)
+	finally:
+		Window.remove_widget(mv)
+
+def setup(server):
+	d = tempfile.mkdtemp(prefix='kb_bench_conf_')
+	os.makedirs(os.path.join(d, 'conf'))
+	with open(os.path.join(d, 'conf', 'config.json'), 'w') as f:
+		json.dump({
+			"uihome":server.url(),
+			"i18n_url":"/i18n",
+			"http_cache":False,
+			"maxworkers":8
+		}, f)
+	getConfig(d)
+	from kivy.app import App
+	from kivy.base import EventLoop
+	from kivyblocks.threadcall import Workers, HttpClient
+	import kivyblocks.blocks
+	class BenchApp(App):
+		def __init__(self):
+			App.__init__(self)
+			self.workers = Workers(maxworkers=8)
+			self.workers.start()
+			self.hc = HttpClient()
+
+		@property
+		def user_data_dir(self):
+			return d
+	EventLoop.ensure_window()
+	return BenchApp()
+
+def summary(times):
+	return {
+		"n":len(times),
+		"min":min(times),
+		"median":statistics.median(times),
+		"mean":statistics.mean(times),
+		"stdev":statistics.stdev(times) if len(times) > 1 else 0.0
+	}
+
+def run(names, repeat):
+	server = StubServer()
+	server.start()
+	app = setup(server)
+	ctx = Context(server)
+	results = {}
+	try:
+		for name in names:
+			f, r = BENCHMARKS[name]
+			r = repeat or r or 20
+			f(ctx, Timer())		# warm up
+			timer = Timer()
+			for i in range(r):
+				f(ctx, timer)
+			results[name] = summary(timer.times)
+			s = results[name]
+			print('%-22s %4d %10.3f %10.3f %10.3f %10.3f' % (name, s['n'],
+					s['min'], s['median'], s['mean'], s['stdev']))
+	finally:
+		app.workers.shutdown()
+		server.stop()
+	return results
+
+def compare(results, baseline, threshold, min_delta):
+	"""
+	return the names of the regressions
+	"""
+	regressions = []
+	base = baseline.get('results', {})
+	print('\n%-22s %10s %10s %8s' % ('benchmark', 'baseline', 'median',
+				'ratio'))
+	for name, s in results.items():
+		b = base.get(name)
+		if b is None:
+			print('%-22s %10s %10.3f %8s' % (name, '-', s['median'], 'new'))
+			continue
+		ratio = s['median'] / b['median'] if b['median'] else 1
+		flag = ''
+		if ratio > 1 + threshold and s['median'] - b['median'] > min_delta:
+			flag = ' REGRESSION'
+			regressions.append(name)
+		print('%-22s %10.3f %10.3f %8.2f%s' % (name, b['median'],
+				s['median'], ratio, flag))
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description='kivyblocks benchmarks')
+	parser.add_argument('--repeat', type=int, default=None)
+	parser.add_argument('--only', default=None,
+				help='comma separated benchmark names')
+	parser.add_argument('--list', action='store_true')
+	parser.add_argument('--baseline',
+				default=os.path.join(here, 'baseline.json'))
+	parser.add_argument('--save', action='store_true',
+				help='save the results as the baseline')
+	parser.add_argument('--threshold', type=float, default=0.25)
+	parser.add_argument('--min-delta', type=float, default=0.5,
+				help='ms, smaller differences are noise')
+	args = parser.parse_args()
+	if args.list:
+		for name in BENCHMARKS:
+			print(name)
+		return 0
+	names = list(BENCHMARKS.keys())
+	if args.only:
+		names = [ n for n in args.only.split(',') if n in BENCHMARKS ]
+	print('%-22s %4s %10s %10s %10s %10s' % ('benchmark(ms)', 'n', 'min',
+				'median', 'mean', 'stdev'))
+	results = run(names, args.repeat)
+	if args.save:
+		with open(args.baseline, 'w') as f:
+			json.dump({
+				"meta":{
+					"python":platform.python_version(),
+					"platform":platform.platform(),
+					"time":time.strftime('%Y-%m-%d %H:%M:%S')
+				},
+				"results":results
+			}, f, indent=1)
+		print('baseline saved to', args.baseline)
+		return 0
+	if not os.path.exists(args.baseline):
+		print('no baseline, run with --save to create one')
+		return 0
+	with open(args.baseline) as f:
+		baseline = json.load(f)
+	regressions = compare(results, baseline, args.threshold, args.min_delta)
+	if regressions:
+		print('\nregressions:', ', '.join(regressions))
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
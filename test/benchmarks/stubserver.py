@@ -0,0 +1,139 @@
+"""
+local stub http server for the benchmarks
+
+routes:
+	/desc/<n>.ui		a BoxLayout description with n Labels
+	/viewer.ui			a Label description, for BoxViewer records
+	/rows?page=&rows=	{"total":..., "rows":[...]} of synthetic records
+	/tree				a tree, TREE_FANOUT children a node, TREE_DEPTH levels
+	/tiles/z/x/y.png	a 256x256 png map tile
+	/i18n/<lang>		an empty message table
+
+usage:
+	server = StubServer()
+	server.start()
+	url = server.url('/rows')
+	server.stop()
+"""
+import json
+import zlib
+import struct
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TOTAL_ROWS = 100000
+ROW_FIELDS = 20
+TREE_FANOUT = 6
+TREE_DEPTH = 3
+
+def field_names():
+	return [ 'f%02d' % i for i in range(ROW_FIELDS) ]
+
+def make_row(i):
+	d = { 'id':i }
+	for j, n in enumerate(field_names()[1:]):
+		d[n] = 'r%d c%d' % (i, j) if j % 2 else i * j
+	return d
+
+def make_tree(pid='', depth=TREE_DEPTH):
+	nodes = []
+	for i in range(TREE_FANOUT):
+		nid = '%s.%d' % (pid, i) if pid else str(i)
+		d = { 'id':nid, 'text':'node %s' % nid }
+		if depth > 1:
+			d['children'] = make_tree(nid, depth - 1)
+		nodes.append(d)
+	return nodes
+
+def make_desc(n):
+	return {
+		"widgettype":"BoxLayout",
+		"options":{"orientation":"vertical"},
+		"subwidgets":[ {
+				"widgettype":"Label",
+				"options":{"text":"label %d" % i}
+			} for i in range(n) ]
+	}
+
+def make_png(size=256):
+	def chunk(t, data):
+		c = struct.pack('>I', len(data)) + t + data
+		return c + struct.pack('>I', zlib.crc32(t + data) & 0xffffffff)
+	raw = b''.join(b'\x00' + bytes((x ^ y) & 0xff for x in range(size)) \
+				for y in range(size))
+	return b'\x89PNG\r\n\x1a\n' + \
+			chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0)) + \
+			chunk(b'IDAT', zlib.compress(raw)) + \
+			chunk(b'IEND', b'')
+
+class StubHandler(BaseHTTPRequestHandler):
+	png = None
+	protocol_version = 'HTTP/1.1'
+
+	def send_body(self, body, ctype='application/json'):
+		self.send_response(200)
+		self.send_header('Content-Type', ctype)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def send_json(self, d):
+		self.send_body(json.dumps(d).encode('utf-8'))
+
+	def do_GET(self):
+		u = urlparse(self.path)
+		q = { k:v[0] for k, v in parse_qs(u.query).items() }
+		if u.path.startswith('/desc/'):
+			n = int(u.path[6:].split('.')[0])
+			return self.send_json(make_desc(n))
+		if u.path == '/viewer.ui':
+			return self.send_json({
+				"widgettype":"Label",
+				"options":{"text":"record %s" % q.get('id')}
+			})
+		if u.path == '/rows':
+			page = int(q.get('page', 1))
+			rows = int(q.get('rows', 60))
+			start = (page - 1) * rows
+			end = min(start + rows, TOTAL_ROWS)
+			return self.send_json({
+				"total":TOTAL_ROWS,
+				"rows":[ make_row(i) for i in range(start, end) ]
+			})
+		if u.path == '/tree':
+			return self.send_json(make_tree())
+		if u.path.startswith('/i18n/'):
+			return self.send_json({})
+		if u.path.startswith('/tiles/'):
+			if StubHandler.png is None:
+				StubHandler.png = make_png()
+			return self.send_body(StubHandler.png, 'image/png')
+		self.send_error(404)
+
+	def log_message(self, *args):
+		pass
+
+class StubServer:
+	def __init__(self, host='127.0.0.1', port=0):
+		self.server = ThreadingHTTPServer((host, port), StubHandler)
+		self.server.daemon_threads = True
+		self.thread = None
+
+	def start(self):
+		self.thread = threading.Thread(target=self.server.serve_forever,
+						daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def url(self, path=''):
+		host, port = self.server.server_address
+		return 'http://%s:%d%s' % (host, port, path)
+
+if __name__ == '__main__':
+	server = StubServer(port=8081)
+	print('serving', server.url())
+	server.server.serve_forever()
@@ -0,0 +1,16 @@
+import os
+import json
+import tempfile
+
+# kivy must not parse pytest's command line
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+from appPublic.jsonConfig import getConfig
+
+# an empty app config, getConfig() needs one before kivyblocks reads it
+workdir = tempfile.mkdtemp()
+os.makedirs(os.path.join(workdir, 'conf'))
+with open(os.path.join(workdir, 'conf', 'config.json'), 'w') as f:
+	json.dump({}, f)
+getConfig(workdir)
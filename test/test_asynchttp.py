@@ -0,0 +1,50 @@
+import json
+from threading import Thread
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from kivyblocks.threadcall import SessionPool, hostsessions
+from kivyblocks.asynchttp import AsyncTransport
+
+class Handler(BaseHTTPRequestHandler):
+	"""
+	/login sets the sid cookie, every path answers the Cookie header
+	"""
+	def do_GET(self):
+		body = json.dumps({'cookie':self.headers.get('Cookie')})
+		self.send_response(200)
+		if self.path == '/login':
+			self.send_header('Set-Cookie', 'sid=abc; Path=/')
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body.encode('utf-8'))
+
+	def log_message(self, *args):
+		pass
+
+@pytest.fixture
+def server():
+	httpd = HTTPServer(('127.0.0.1', 0), Handler)
+	Thread(target=httpd.serve_forever, daemon=True).start()
+	url = 'http://127.0.0.1:%d' % httpd.server_port
+	yield url
+	httpd.shutdown()
+	SessionPool().cookies.clear()
+	hostsessions.pop(url, None)
+
+def test_async_requests_share_the_cookies(server):
+	transport = AsyncTransport()
+	def call(url):
+		return transport.submit(transport.webcall(url)).result(10)
+	call(server + '/login')
+	# the login done by the async transport is seen by HttpClient
+	s = SessionPool().getSession()
+	assert s.get(server + '/a').json() == {'cookie':'sid=abc'}
+	SessionPool().cookies.set('lang', 'en', domain='127.0.0.1', path='/')
+	cookie = call(server + '/b')['cookie']
+	assert sorted(cookie.split('; ')) == ['lang=en', 'sid=abc']
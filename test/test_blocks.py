@@ -0,0 +1,99 @@
+from kivyblocks import blocks
+
+class Popup:
+	def __init__(self):
+		self.opened = False
+		self.handlers = {}
+
+	def bind(self, **kw):
+		self.handlers.update(kw)
+
+	def open(self):
+		self.opened = True
+
+def test_conform_uses_a_blocks_of_its_own(monkeypatch):
+	built = []
+	def widgetBuild(self, desc):
+		w = Popup()
+		built.append((self, desc, w))
+		return w
+	monkeypatch.setattr(blocks.Blocks, 'widgetBuild', widgetBuild)
+	page_blocks = blocks.Blocks()
+	action = blocks.BindAction(page_blocks, None, {
+		'actiontype':'script',
+		'script':'print(1)',
+		'conform':{'title':'sure?'}
+	})
+	action()
+	assert len(built) == 1
+	b, desc, w = built[0]
+	# the page's Blocks would dispatch on_built for the popup
+	assert b is not page_blocks
+	assert desc == {'widgettype':'Conform', 'options':{'title':'sure?'}}
+	assert w.opened
+	assert w.handlers['on_conform'] == action.action
+
+def test_desc_changed_in_place_is_rebuilt():
+	b = blocks.Blocks()
+	desc = {'widgettype':'Label', 'options':{'text':'one'}}
+	assert b.widgetBuild(desc).text == 'one'
+	desc['options']['text'] = 'two'
+	assert b.widgetBuild(desc).text == 'two'
+	# the widget keeps its own copy of the description
+	w = b.widgetBuild(desc)
+	desc['options']['text'] = 'three'
+	assert w.build_desc['options']['text'] == 'two'
+
+def test_owned_desc_plan_is_found_by_identity():
+	b = blocks.Blocks()
+	desc = {'widgettype':'Label', 'options':{'text':'one'}}
+	blocks.plan_cache.own(desc)
+	b.widgetBuild(desc)
+	plan = blocks.plan_cache.planOf(desc)
+	assert plan is not None
+	assert b.getPlan(desc) is plan
+
+def test_registered_widget_replaces_the_plans():
+	from kivy.factory import Factory
+	from kivy.uix.label import Label
+	class Old(Label):
+		pass
+	class New(Label):
+		pass
+	b = blocks.Blocks()
+	desc = {'widgettype':'BoxLayout', 'subwidgets':[
+		{'widgettype':'TestWidget', 'options':{'text':'x'}}
+	]}
+	other = {'widgettype':'Label', 'options':{'text':'y'}}
+	blocks.registerWidget('TestWidget', Old)
+	assert isinstance(b.widgetBuild(desc).children[0], Old)
+	b.widgetBuild(other)
+	size = blocks.plan_cache.stats()['size']
+	# a Factory registration alone leaves the plans alone
+	Factory.register('SomeOtherWidget', cls=Label)
+	assert blocks.plan_cache.stats()['size'] == size
+	blocks.registerWidget('TestWidget', New)
+	assert isinstance(b.widgetBuild(desc).children[0], New)
+	assert blocks.plan_cache.get(blocks.planKey(other)) is not None
+
+def test_tab_from_url_is_added_when_loaded(monkeypatch):
+	from kivyblocks.tab import TabsPanel
+	pending = []
+	def getUrlData(self, url, callback=None, errback=None, **kw):
+		# a call without callback blocks the ui thread
+		assert callback is not None
+		pending.append(callback)
+	monkeypatch.setattr(blocks.Blocks, 'getUrlData', getUrlData)
+	monkeypatch.setattr(blocks.Blocks, 'peekUrlData',
+				lambda self, url, **kw:None)
+	tp = TabsPanel()
+	n = len(tp.tab_list)
+	tp.add_tab('t1', 'T1', {
+		'widgettype':'urlwidget',
+		'options':{'url':'http://localhost/t1.ui'}
+	})
+	assert len(pending) == 1
+	assert len(tp.tab_list) == n
+	pending[0](None, {'widgettype':'Label', 'options':{'text':'hi'}})
+	assert len(tp.tab_list) == n + 1
+	assert tp.tab_list[0].content.text == 'hi'
@@ -0,0 +1,79 @@
+from kivyblocks.buildplan import PlanCache, planKey
+
+def test_plan_key():
+	a = {'widgettype':'Text', 'options':{'text':'x', 'size':1}}
+	b = {'options':{'size':1, 'text':'x'}, 'widgettype':'Text'}
+	assert planKey(a) == planKey(b)
+	assert planKey(a) != planKey(dict(a, widgettype='Label'))
+
+def test_plan_key_of_unserializable_desc():
+	d = {}
+	d['self'] = d
+	assert planKey(d) is None
+
+def test_cache_by_content():
+	c = PlanCache()
+	c.put(planKey({'a':1}), 'plan')
+	assert c.get(planKey({'a':1})) == 'plan'
+	assert c.get(planKey({'a':2})) is None
+	assert c.get(None) is None
+	c.put(None, 'plan')
+	assert c.stats()['size'] == 1
+	assert c.stats()['hits'] == 1 and c.stats()['misses'] == 1
+
+def test_cache_by_identity():
+	c = PlanCache()
+	d = {'a':1}
+	# a description of the caller is not kept
+	c.remember(d, 'plan')
+	assert c.planOf(d) is None
+	assert c.stats()['known'] == 0
+	c.own(d)
+	assert c.planOf(d) is None
+	c.remember(d, 'plan')
+	assert c.planOf(d) == 'plan'
+	# an equal desc is another object
+	assert c.planOf({'a':1}) is None
+
+def test_lru():
+	c = PlanCache(maxsize=2)
+	for i in range(3):
+		c.put(planKey(i), i)
+	assert c.get(planKey(0)) is None
+	assert c.get(planKey(2)) == 2
+	descs = [ {'i':i} for i in range(3) ]
+	for d in descs:
+		c.own(d)
+		c.remember(d, d['i'])
+	assert c.planOf(descs[0]) is None
+	assert c.planOf(descs[2]) == 2
+
+def test_clear():
+	c = PlanCache()
+	d = {'a':1}
+	c.own(d)
+	c.remember(d, 'plan')
+	c.put(planKey(d), 'plan')
+	c.clear()
+	assert c.planOf(d) is None
+	assert c.get(planKey(d)) is None
+
+class Plan:
+	def __init__(self, *classes):
+		self.classes = classes
+
+	def usesClass(self, classname):
+		return classname in self.classes
+
+def test_drop_class():
+	c = PlanCache()
+	c.put('a', Plan('Label'))
+	c.put('b', Plan('Box', 'Label'))
+	c.put('c', Plan('Box'))
+	d = {'a':1}
+	c.own(d)
+	c.remember(d, Plan('Label'))
+	c.dropClass('Label')
+	assert c.get('a') is None and c.get('b') is None
+	assert c.get('c') is not None
+	assert c.planOf(d) is None
@@ -0,0 +1,102 @@
+import os
+import time
+
+from kivyblocks import desccache
+from kivyblocks.desccache import DescCache
+
+class Resp:
+	def __init__(self, data, headers={}, status_code=200):
+		self.status_code = status_code
+		self.content = data
+		self.headers = dict(headers, **{'Content-Type':'application/json'})
+		self.encoding = 'utf-8'
+
+class Client:
+	"""
+	answers _webcall() with the responses given, the login session
+	is scope
+	"""
+	def __init__(self, *resps, scope=None):
+		self.resps = list(resps)
+		self.sent = []
+		self.scope = scope
+
+	def __call__(self):
+		return self
+
+	def cacheScope(self, url):
+		return self.scope
+
+	def _webcall(self, url, method='GET', params={}, headers={}):
+		self.sent.append(headers)
+		r = self.resps.pop(0)
+		if isinstance(r, Exception):
+			raise r
+		return r
+
+def desc_cache(tmp_path, monkeypatch, client, **kw):
+	monkeypatch.setattr(desccache, 'HttpClient', client)
+	# a fresh instance, not the process wide singleton
+	c = DescCache.klass()
+	c.cache_dir = str(tmp_path)
+	for k, v in kw.items():
+		setattr(c, k, v)
+	return c
+
+def test_revalidated_without_cache_control(tmp_path, monkeypatch):
+	hc = Client(Resp(b'{"a":1}', {'ETag':'"x"'}), Resp(b'', status_code=304))
+	c = desc_cache(tmp_path, monkeypatch, hc)
+	assert c.fetch('http://h/a') == {'a':1}
+	assert c.fetch('http://h/a') == {'a':1}
+	assert hc.sent[1]['If-None-Match'] == '"x"'
+	assert c.revalidated == 1
+
+def test_max_age(tmp_path, monkeypatch):
+	hc = Client(Resp(b'{"a":1}', {'Cache-Control':'max-age=60'}))
+	c = desc_cache(tmp_path, monkeypatch, hc)
+	c.fetch('http://h/a')
+	assert c.fetch('http://h/a') == {'a':1}
+	assert len(hc.sent) == 1
+
+def test_no_store(tmp_path, monkeypatch):
+	hc = Client(Resp(b'{"a":1}', {'Cache-Control':'max-age=60'}),
+				Resp(b'{"a":2}', {'Cache-Control':'no-store'}),
+				Resp(b'{"a":3}', {'Cache-Control':'no-store'}))
+	c = desc_cache(tmp_path, monkeypatch, hc)
+	c.fetch('http://h/a')
+	for e in c.entries.values():
+		e['fetched_at'] = 0
+	assert c.fetch('http://h/a') == {'a':2}
+	assert c.fetch('http://h/a') == {'a':3}
+	assert os.listdir(str(tmp_path)) == []
+
+def test_scoped_by_session(tmp_path, monkeypatch):
+	hc = Client(Resp(b'{"user":1}', {'Cache-Control':'max-age=60'}),
+				Resp(b'{"user":2}', {'Cache-Control':'max-age=60'}),
+				scope=['s1', None])
+	c = desc_cache(tmp_path, monkeypatch, hc)
+	assert c.fetch('http://h/a') == {'user':1}
+	hc.scope = ['s2', None]
+	assert c.fetch('http://h/a') == {'user':2}
+	assert c.peek('http://h/a') == {'user':2}
+	hc.scope = ['s1', None]
+	assert c.peek('http://h/a') == {'user':1}
+
+def test_disk_is_bounded(tmp_path, monkeypatch):
+	body = b'{"a":"' + b'x' * 1000 + b'"}'
+	resps = [ Resp(body, {'Cache-Control':'max-age=60'}) for i in range(5) ]
+	c = desc_cache(tmp_path, monkeypatch, Client(*resps), max_bytes=3000)
+	for i in range(5):
+		c.fetch('http://h/a', params={'id':i})
+		# distinct mtimes for the eviction order
+		for f in os.scandir(str(tmp_path)):
+			t = time.time() - 100 + i
+			if f.stat().st_mtime > t:
+				os.utime(f.path, (t, t))
+	assert len(os.listdir(str(tmp_path))) == 2
+	assert c.disk_bytes <= 3000
+	assert c.evicted == 3
+	# the newest ones are kept
+	c.clear()
+	assert c.get('http://h/a', {'id':4}) is not None
+	assert c.get('http://h/a', {'id':0}) is None
@@ -0,0 +1,105 @@
+import pytest
+
+from kivyblocks.rowstore import RowStore
+from kivyblocks.gridquery import GridQuery, valueTest
+
+def people():
+	rows = [
+		{'name':'ann', 'city':'Paris', 'age':31},
+		{'name':'bob', 'city':'Lyon', 'age':25},
+		{'name':'cid', 'city':'Paris', 'age':None},
+		{'name':'dan', 'city':'Nice', 'age':40},
+		{'name':'eve', 'city':'Lyon', 'age':25},
+	]
+	s = RowStore()
+	s.addRows([ r['name'] for r in rows ], rows)
+	return s
+
+def test_no_query_keeps_the_store_order():
+	r = GridQuery().run(people())
+	assert r.ids == ['ann', 'bob', 'cid', 'dan', 'eve']
+	assert r.groups is None
+	assert r.total == 5
+
+def test_pos_field_gives_the_order():
+	s = RowStore()
+	s.addRows(['a', 'b', 'c'], [ {'__posInSet__':p} for p in [3, 1, 2] ])
+	assert GridQuery().run(s).ids == ['b', 'c', 'a']
+
+def test_filters():
+	s = people()
+	q = GridQuery({'filters':[
+		{'field':'city', 'op':'in', 'value':['Paris', 'Lyon']},
+		{'field':'age', 'op':'>=', 'value':25},
+	]})
+	assert q.run(s).ids == ['ann', 'bob', 'eve']
+	q = GridQuery({'filters':[{'field':'age', 'op':'isnull'}]})
+	assert q.run(s).ids == ['cid']
+	q = GridQuery({'filters':[{'field':'name', 'op':lambda v:v > 'c'}]})
+	assert q.run(s).ids == ['cid', 'dan', 'eve']
+	q = GridQuery({'filters':[lambda r:r['city'] == 'Nice']})
+	assert q.run(s).ids == ['dan']
+
+def test_filter_ops():
+	assert valueTest('between', [1, 3])(3)
+	assert not valueTest('between', [1, 3])(None)
+	assert valueTest('contains', 'ar')('Paris')
+	assert valueTest('not_in', [1])(2)
+	assert valueTest('!=', 1)(None)
+	assert not valueTest('<', 1)(None)
+	with pytest.raises(ValueError):
+		valueTest('like', 1)
+
+def test_sort_is_stable_with_none_last():
+	s = people()
+	r = GridQuery({'sort':['age']}).run(s)
+	assert r.ids == ['bob', 'eve', 'ann', 'dan', 'cid']
+	r = GridQuery({'sort':['-age']}).run(s)
+	assert r.ids == ['dan', 'ann', 'bob', 'eve', 'cid']
+	r = GridQuery({'sort':['city', {'field':'name', 'desc':True}]}).run(s)
+	assert r.ids == ['eve', 'bob', 'dan', 'cid', 'ann']
+
+def test_group():
+	s = people()
+	r = GridQuery({
+		'group':{
+			'by':'city',
+			'aggregates':{
+				'n':'count',
+				'age':'avg',
+				'oldest':['max', 'age']
+			}
+		},
+		'sort':['-n', 'city']
+	}).run(s)
+	assert r.total == 5
+	assert [ g['city'] for g in r.groups ] == ['Lyon', 'Paris', 'Nice']
+	lyon, paris, nice = r.groups
+	assert lyon['n'] == 2 and lyon['age'] == 25
+	assert sorted(lyon['__ids__']) == ['bob', 'eve']
+	assert paris['age'] == 31 and paris['oldest'] == 31
+	assert nice['__ids__'] == ['dan']
+
+def test_deleted_rows_are_not_queried():
+	s = people()
+	s.delRows(['bob', 'dan'])
+	r = GridQuery({'sort':['name']}).run(s)
+	assert r.ids == ['ann', 'cid', 'eve']
+	s.addRow('fay', {'name':'fay', 'city':'Nice', 'age':50})
+	r = GridQuery({'filters':[{'field':'city', 'value':'Nice'}]}).run(s)
+	assert r.ids == ['fay']
+
+def test_query_failure_is_reported():
+	from kivyblocks.dg import DataGrid
+	class Grid:
+		query_spec = {'sort':['a']}
+		def __init__(self):
+			self.query_task = self.task = object()
+			self.events = []
+		def dispatch(self, name, *args):
+			self.events.append((name,) + args)
+	g = Grid()
+	e = Exception('broken')
+	DataGrid.queryError(g, g.task, e)
+	assert g.query_task is None
+	assert g.events == [('on_query_failed', e)]
@@ -0,0 +1,139 @@
+import time
+
+from kivyblocks.httpcache import HttpCache, MemoryStore, SqliteStore, \
+			parseCacheControl
+
+class Resp:
+	def __init__(self, data, headers={}, status_code=200):
+		self.status_code = status_code
+		self.content = data
+		self.headers = dict(headers, **{'Content-Type':'application/json'})
+		self.encoding = 'utf-8'
+
+class Client:
+	"""
+	answers _webcall() with the responses given, records the headers
+	"""
+	def __init__(self, *resps):
+		self.resps = list(resps)
+		self.sent = []
+
+	def _webcall(self, url, method='GET', params={}, headers={},
+				timeout=None):
+		self.sent.append(headers)
+		r = self.resps.pop(0)
+		if isinstance(r, Exception):
+			raise r
+		return r
+
+def httpcache(*stores):
+	# a fresh instance, not the process wide singleton
+	c = HttpCache.klass()
+	c.enabled = True
+	c.stores = list(stores) or [ MemoryStore() ]
+	return c
+
+def test_parse_cache_control():
+	assert parseCacheControl('no-cache, Max-Age="10"') == \
+				{'no-cache':True, 'max-age':'10'}
+	assert parseCacheControl(None) == {}
+
+def test_policy():
+	c = httpcache()
+	assert c.policy(Resp(b'1', {'Cache-Control':'no-store'})) is None
+	assert c.policy(Resp(b'1')) is None
+	p = c.policy(Resp(b'1', {'Cache-Control':'max-age=5'}))
+	assert p['max_age'] == 5
+	p = c.policy(Resp(b'1', {'ETag':'"x"', 'Cache-Control':'no-cache'}))
+	assert p['max_age'] == 0 and p['etag'] == '"x"'
+
+def test_fresh_response_is_served_from_cache():
+	c = httpcache()
+	hc = Client(Resp(b'{"a":1}', {'Cache-Control':'max-age=60'}))
+	assert c.fetch(hc, 'http://h/a') == {'a':1}
+	data = c.fetch(hc, 'http://h/a')
+	assert data == {'a':1}
+	assert len(hc.sent) == 1
+	# the callers get copies
+	data['a'] = 2
+	assert c.peek('http://h/a') == (True, {'a':1})
+
+def test_scope_keeps_sessions_apart():
+	c = httpcache()
+	hc = Client(Resp(b'"one"', {'Cache-Control':'max-age=60'}),
+				Resp(b'"two"', {'Cache-Control':'max-age=60'}))
+	assert c.fetch(hc, 'http://h/me', scope='s1') == 'one'
+	assert c.fetch(hc, 'http://h/me', scope='s2') == 'two'
+	assert c.fetch(hc, 'http://h/me', scope='s1') == 'one'
+	assert c.peek('http://h/me')[0] is False
+
+def test_stale_entry_is_revalidated():
+	c = httpcache()
+	hc = Client(Resp(b'[1]', {'ETag':'"v1"', 'Cache-Control':'no-cache'}),
+				Resp(b'', status_code=304))
+	assert c.fetch(hc, 'http://h/l') == [1]
+	assert c.fetch(hc, 'http://h/l') == [1]
+	assert hc.sent[1]['If-None-Match'] == '"v1"'
+	assert c.revalidated == 1
+
+def test_no_store_drops_the_entry():
+	c = httpcache()
+	hc = Client(Resp(b'1', {'ETag':'"v1"'}),
+				Resp(b'2', {'Cache-Control':'no-store'}))
+	c.fetch(hc, 'http://h/n')
+	assert c.download(hc, 'http://h/n') == 2
+	key = c.key('http://h/n')
+	assert c.get(key) is None
+
+def test_disabled_cache_misses():
+	c = httpcache()
+	c.enabled = False
+	assert c.peek('http://h/a') == (False, None)
+
+def test_memory_lookup_skips_other_tiers(tmp_path):
+	mem = MemoryStore()
+	disk = SqliteStore(str(tmp_path / 'c.db'))
+	c = httpcache(mem, disk)
+	entry = {'url':'u', 'fetched_at':time.time(), 'max_age':60, 'swr':0,
+				'data':1}
+	disk.put('k', entry)
+	assert c.get('k', memory=True) is None
+	assert c.get('k') == entry
+	# found on disk, kept in memory too
+	assert mem.get('k') == entry
+
+def test_memory_store_lru():
+	s = MemoryStore(maxsize=2)
+	s.put('a', 1)
+	s.put('b', 2)
+	s.get('a')
+	s.put('c', 3)
+	assert s.get('b') is None
+	assert s.get('a') == 1 and s.get('c') == 3
+
+def test_sqlite_store(tmp_path):
+	fname = str(tmp_path / 'c.db')
+	s = SqliteStore(fname)
+	s.put('a', {'url':'u', 'data':b'\x00\xffbytes'})
+	s.put('a', {'url':'u', 'data':[1, 2]})
+	s.put('b', {'url':'u', 'data':{'x':None}})
+	assert s.get('a')['data'] == [1, 2]
+	assert s.stats()['size'] == 2
+	s.put('c', {'url':'u', 'data':b'\x00\xff'})
+	assert s.get('c')['data'] == b'\x00\xff'
+	# data json can not keep is not cached on disk
+	s.put('b', {'url':'u', 'data':object()})
+	assert s.get('b') is None
+	assert s.stats()['size'] == 2
+	s.db.close()
+	s = SqliteStore(fname)
+	assert s.stats()['size'] == 2
+	assert s.get('c')['data'] == b'\x00\xff'
+
+def test_sqlite_store_evicts(tmp_path):
+	s = SqliteStore(str(tmp_path / 'c.db'), maxbytes=300)
+	for i in range(10):
+		s.put(str(i), {'url':'u', 'data':'x' * 50})
+	assert s.stats()['bytes'] <= 300
+	assert s.get('9') is not None
+	assert s.get('0') is None
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from kivyblocks.jsonstream import RowsDecoder
+
+DOC = {
+	"total":3,
+	"note":"a \"rows\": [ in a string",
+	"rows":[{"id":1, "name":"a,]"}, {"id":2, "tags":[1, 2]}, 12345],
+	"page":1
+}
+
+def decode(text, size):
+	d = RowsDecoder()
+	rows = []
+	for i in range(0, len(text), size):
+		rows += d.feed(text[i:i+size])
+	return rows, d.close()
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+def test_rows_in_chunks(size):
+	rows, rest = decode(json.dumps(DOC), size)
+	assert rows == DOC['rows']
+	assert rest == dict(DOC, rows=[])
+
+def test_rows_come_as_they_complete():
+	d = RowsDecoder()
+	assert d.feed('{"rows":[{"id":1},') == [{'id':1}]
+	assert d.feed('{"id":') == []
+	assert d.feed('2}]}') == [{'id':2}]
+	assert d.rows == 2
+	assert d.close() == {'rows':[]}
+
+def test_other_key():
+	d = RowsDecoder(key='data')
+	assert d.feed('{"rows":1,"data":[[1],[2]]}') == [[1], [2]]
+	assert d.close() == {'rows':1, 'data':[]}
+
+def test_document_without_rows():
+	d = RowsDecoder()
+	assert d.feed('{"total":0}') == []
+	assert d.close() == {'total':0}
+
+def test_truncated_rows():
+	d = RowsDecoder()
+	d.feed('{"rows":[{"id":1}')
+	with pytest.raises(ValueError):
+		d.close()
@@ -0,0 +1,31 @@
+import threading
+
+from kivyblocks.prefetch import Prefetcher
+
+class Blocks:
+	"""
+	records the thread getPlan() is called in
+	"""
+	def __init__(self, desc):
+		self.desc = desc
+		self.plan_threads = []
+
+	def getUrlData(self, url, params={}):
+		return self.desc
+
+	def getPlan(self, desc):
+		self.plan_threads.append(threading.current_thread())
+		return 'plan'
+
+def test_plans_are_compiled_in_the_ui_thread():
+	p = Prefetcher.klass()
+	p.blocks = Blocks({'widgettype':'Label', 'options':{}})
+	result = []
+	t = threading.Thread(target=lambda: result.append(p.load('http://h/a', {})))
+	t.start()
+	t.join()
+	assert p.blocks.plan_threads == []
+	p.inflight = 1
+	p.loaded('http://h/a', {}, p.depth, None, result[0])
+	assert p.blocks.plan_threads == [threading.current_thread()]
+	assert p.stats()['compiled'] == 1
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from kivyblocks.resilience import CircuitBreaker, CircuitOpen, Resilience
+
+class RespError(Exception):
+	def __init__(self, code):
+		self.resp_code = code
+		Exception.__init__(self, code)
+
+def resilience(**kw):
+	# a fresh instance, not the process wide singleton
+	r = Resilience.klass()
+	r.backoff = 0
+	for k, v in kw.items():
+		setattr(r, k, v)
+	return r
+
+def failing(errors, result='ok'):
+	calls = []
+	def f():
+		calls.append(1)
+		if len(calls) <= len(errors):
+			raise errors[len(calls) - 1]
+		return result
+	return f, calls
+
+def test_breaker_opens_after_threshold():
+	b = CircuitBreaker('http://h', threshold=2, reset_timeout=30)
+	b.allow()
+	b.failure()
+	b.allow()
+	b.failure()
+	assert b.state == 'open'
+	with pytest.raises(CircuitOpen):
+		b.allow()
+	assert b.stats()['fast_fails'] == 1
+	assert b.stats()['opens'] == 1
+
+def test_breaker_half_open_probe():
+	b = CircuitBreaker('http://h', threshold=1, reset_timeout=0.05)
+	b.failure()
+	time.sleep(0.06)
+	b.allow()
+	assert b.state == 'half-open'
+	# one probe at a time
+	with pytest.raises(CircuitOpen):
+		b.allow()
+	b.failure()
+	assert b.state == 'open'
+	time.sleep(0.06)
+	b.allow()
+	b.success()
+	assert b.state == 'closed'
+	b.allow()
+
+def test_success_resets_failures():
+	b = CircuitBreaker('http://h', threshold=2)
+	b.failure()
+	b.success()
+	b.failure()
+	assert b.state == 'closed'
+
+def test_get_is_retried():
+	r = resilience()
+	f, calls = failing([ConnectionError(), RespError(503)])
+	assert r.call('http://retry.test/a', 'GET', f) == 'ok'
+	assert len(calls) == 3
+	assert r.retried == 2
+	assert r.recovered == 1
+
+def test_post_is_not_retried():
+	r = resilience()
+	f, calls = failing([ConnectionError()])
+	with pytest.raises(ConnectionError):
+		r.call('http://post.test/a', 'POST', f)
+	assert len(calls) == 1
+
+def test_client_error_is_not_retried():
+	r = resilience()
+	f, calls = failing([RespError(404)])
+	with pytest.raises(RespError):
+		r.call('http://notfound.test/a', 'GET', f)
+	assert len(calls) == 1
+	# a 4xx says nothing about the host
+	assert r.breaker('http://notfound.test/b').failures == 0
+
+def test_retries_give_up():
+	r = resilience(retries=1)
+	f, calls = failing([ConnectionError()] * 5)
+	with pytest.raises(ConnectionError):
+		r.call('http://down.test/a', 'GET', f)
+	assert len(calls) == 2
+	assert r.giveups == 1
+
+def test_open_circuit_fails_fast():
+	r = resilience(retries=0, threshold=2)
+	url = 'http://broken.test/a'
+	for i in range(2):
+		f, calls = failing([RespError(500)])
+		with pytest.raises(RespError):
+			r.call(url, 'GET', f)
+	f, calls = failing([])
+	with pytest.raises(CircuitOpen):
+		r.call('http://broken.test/other', 'GET', f)
+	assert calls == []
+	assert r.stats()['hosts']['http://broken.test']['state'] == 'open'
+
+def test_streaming_body_is_not_retried():
+	r = resilience()
+	f, calls = failing([ConnectionError()])
+	with pytest.raises(ConnectionError):
+		r.call('http://upload.test/a', 'PUT', f, retries=0)
+	assert len(calls) == 1
+
+def test_streaming_timeout():
+	r = resilience(timeout=30)
+	assert r.getTimeout() == 30
+	assert r.getTimeout(streaming=True) == (30, None)
+	assert r.getTimeout(5, streaming=True) == 5
+	r = resilience(timeout=(3, 30))
+	assert r.getTimeout(streaming=True) == (3, None)
@@ -0,0 +1,58 @@
+from kivyblocks.rowstore import RowStore, MISSING
+
+def test_add_get_row():
+	s = RowStore()
+	s.addRows(['a', 'b'], [{'x':1, 'y':2}, {'x':3}])
+	assert len(s) == 2
+	assert s.get('a', 'y') == 2
+	assert s.get('b', 'y') is None
+	assert s.get('b', 'y', 0) == 0
+	assert s.get('a', 'nofield') is None
+	assert s.row('b') == {'x':3}
+	assert s.hasMissing('y')
+	assert not s.hasMissing('x')
+
+def test_new_field_is_missing_in_old_rows():
+	s = RowStore()
+	s.addRow('a', {'x':1})
+	s.addRow('b', {'x':2, 'z':9})
+	assert s.columns['z'][s.slot('a')] is MISSING
+	assert s.row('a') == {'x':1}
+	assert s.hasMissing('z')
+
+def test_readd_replaces_the_record():
+	s = RowStore()
+	s.addRow('a', {'x':1, 'y':2})
+	s.addRow('a', {'x':5})
+	assert len(s) == 1
+	assert s.row('a') == {'x':5}
+
+def test_deleted_slots_are_reused():
+	s = RowStore()
+	s.addRows(['a', 'b', 'c'], [{'x':1}, {'x':2}, {'x':3}])
+	slot = s.slot('b')
+	s.delRows(['b', 'nosuchrow'])
+	assert 'b' not in s
+	assert len(s) == 2
+	assert s.rowIds() == ['a', 'c']
+	s.addRow('d', {'x':4})
+	assert s.slot('d') == slot
+	assert s.slot('a') == 0 and s.slot('c') == 2
+	assert s.stats() == {'rows':3, 'slots':3, 'columns':1}
+
+def test_column():
+	s = RowStore()
+	s.addRows(['a', 'b', 'c'], [{'x':1}, {'y':2}, {'x':3}])
+	s.delRow('a')
+	assert s.column('x') == [None, 3]
+	assert s.column('x', ['c', 'b']) == [3, None]
+	assert s.column('nofield', ['c']) == [None]
+
+def test_clear():
+	s = RowStore()
+	s.addRows(['a', 'b'], [{'x':1}, {'x':2}])
+	s.clear()
+	assert len(s) == 0
+	assert s.rowIds() == []
+	s.addRow('c', {'x':3})
+	assert s.slot('c') == 0
@@ -0,0 +1,285 @@
+import time
+from threading import Barrier, Event, Lock, Thread
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from kivyblocks import threadcall
+from kivyblocks.threadcall import Workers, SingleFlight, HttpClient
+from kivyblocks.uploader import ResumableUpload
+from kivyblocks.resilience import Resilience
+
+def run_tasks(workers, f, n, timeout=10):
+	done = []
+	lock = Lock()
+	def task(i):
+		f(i)
+		with lock:
+			done.append(i)
+	for i in range(n):
+		workers.add(task, None, kwargs={'i':i})
+	t = time.time()
+	while len(done) < n and time.time() - t < timeout:
+		time.sleep(0.01)
+	return done
+
+def test_workers_burst_runs_concurrently():
+	workers = Workers(maxworkers=8)
+	workers.start()
+	try:
+		# a thread waiting for tasks must not stop the burst
+		# from starting more threads
+		run_tasks(workers, lambda i:None, 1)
+		time.sleep(0.05)
+		# every task waits for all the others, one thread would time out
+		barrier = Barrier(8, timeout=5)
+		t = time.time()
+		done = run_tasks(workers, lambda i:barrier.wait(), 8)
+		assert len(done) == 8
+		assert time.time() - t < 5
+		assert workers.stats()['threads'] == 8
+	finally:
+		workers.shutdown(wait=True, timeout=5)
+
+def test_workers_reuse_idle_threads():
+	workers = Workers(maxworkers=8)
+	workers.start()
+	try:
+		for i in range(5):
+			done = run_tasks(workers, lambda i:None, 1)
+			assert len(done) == 1
+			# let the thread get back to the queue
+			time.sleep(0.05)
+		assert workers.stats()['threads'] == 1
+	finally:
+		workers.shutdown(wait=True, timeout=5)
+
+def test_workers_max_threads():
+	workers = Workers(maxworkers=2)
+	workers.start()
+	try:
+		done = run_tasks(workers, lambda i:time.sleep(0.05), 6)
+		assert len(done) == 6
+		assert workers.stats()['threads'] <= 2
+	finally:
+		workers.shutdown(wait=True, timeout=5)
+
+def test_task_of_removed_widget_gets_cancelled():
+	from kivy.clock import Clock
+	from kivy.uix.widget import Widget
+	from kivyblocks.threadcall import WorkerTask, Cancelled
+	errors = []
+	parent = Widget()
+	w = Widget()
+	parent.add_widget(w)
+	task = WorkerTask(lambda:None, None,
+				errback=lambda t, e:errors.append(e))
+	task.watch(w)
+	parent.remove_widget(w)
+	Clock.tick()
+	assert task.cancelled()
+	assert len(errors) == 1 and isinstance(errors[0], Cancelled)
+
+def test_task_of_moved_widget_is_kept():
+	from kivy.clock import Clock
+	from kivy.uix.widget import Widget
+	from kivyblocks.threadcall import WorkerTask
+	errors = []
+	p1 = Widget()
+	p2 = Widget()
+	w = Widget()
+	p1.add_widget(w)
+	task = WorkerTask(lambda:None, None,
+				errback=lambda t, e:errors.append(e))
+	task.watch(w)
+	p1.remove_widget(w)
+	p2.add_widget(w)
+	Clock.tick()
+	assert not task.cancelled()
+	assert errors == []
+
+def test_single_flight_run_shares_one_call():
+	sf = SingleFlight()
+	calls = []
+	started = Event()
+	release = Event()
+	def f():
+		calls.append(1)
+		started.set()
+		release.wait(5)
+		return {'n':1}
+	results = []
+	def run():
+		results.append(sf.run('k', f))
+	threads = [ Thread(target=run) ]
+	threads[0].start()
+	started.wait(5)
+	for i in range(3):
+		t = Thread(target=run)
+		t.start()
+		threads.append(t)
+	# the followers are waiting for the leader
+	time.sleep(0.05)
+	release.set()
+	for t in threads:
+		t.join(5)
+	assert len(calls) == 1
+	assert results == [{'n':1}] * 4
+	assert sf.stats() == {'inflight':0, 'requests':4, 'coalesced':3}
+
+def test_single_flight_run_shares_the_error():
+	sf = SingleFlight()
+	def f():
+		raise ValueError('x')
+	with pytest.raises(ValueError):
+		sf.run('k', f)
+	# a finished flight is not reused
+	assert sf.run('k', lambda:1) == 1
+
+def test_single_flight_fan_out():
+	sf = SingleFlight()
+	got = []
+	def cb(o, data):
+		got.append(data)
+	assert sf.join('k', cb, None) is False
+	assert sf.join('k', cb, None) is True
+	data = {'rows':[1]}
+	sf.done('k', None, data)
+	assert got == [data, data]
+	# every caller but the first gets a copy
+	assert got[0] is data and got[1] is not data
+	assert sf.join('k', cb, None) is False
+
+def test_single_flight_failed():
+	sf = SingleFlight()
+	errors = []
+	sf.join('k', None, lambda o, e:errors.append(e))
+	sf.join('k', None, lambda o, e:errors.append(e))
+	e = ValueError()
+	sf.failed('k', None, e)
+	assert errors == [e, e]
+
+def test_single_flight_leave_cancels_the_last():
+	sf = SingleFlight()
+	class Task:
+		cancelled = False
+		def cancel(self):
+			self.cancelled = True
+	cb1 = lambda o, d:None
+	cb2 = lambda o, d:None
+	task = Task()
+	sf.join('k', cb1, None)
+	sf.setTask('k', task)
+	sf.join('k', cb2, None)
+	sf.leave('k', cb1)
+	assert not task.cancelled
+	sf.leave('k', cb2)
+	assert task.cancelled
+	assert sf.stats()['inflight'] == 0
+
+def test_single_flight_key():
+	sf = SingleFlight()
+	assert sf.key('GET', 'u', {'a':1, 'b':2}) == \
+				sf.key('GET', 'u', {'b':2, 'a':1})
+	assert sf.key('GET', 'u') != sf.key('GET', 'v')
+
+class Resp:
+	def __init__(self, status_code, headers={}):
+		self.status_code = status_code
+		self.headers = headers
+
+	def close(self):
+		pass
+
+class Session:
+	"""
+	answers every request with status_code
+	"""
+	def __init__(self, status_code):
+		self.status_code = status_code
+
+	def prepare_request(self, req):
+		return req
+
+	def send(self, prepped, stream=False, timeout=None):
+		return Resp(self.status_code)
+
+@pytest.fixture
+def app(monkeypatch):
+	class App:
+		workers = None
+	monkeypatch.setattr(threadcall.App, 'get_running_app',
+				staticmethod(lambda: App))
+
+def test_http_client_session(app, monkeypatch):
+	inits = []
+	init = threadcall.Http_Client.__init__
+	def record(self):
+		inits.append(self)
+		init(self)
+	monkeypatch.setattr(threadcall.Http_Client, '__init__', record)
+	hc = HttpClient()
+	assert inits == [hc]
+	# the session Http_Client.__init__() made is not used
+	assert hc.s is hc.pool.getSession()
+	s = Session(200)
+	hc.s = s
+	assert hc.s is s
+
+def test_http_client_not_modified(app, capsys):
+	hc = HttpClient()
+	hc.s = Session(304)
+	resp = hc._send('http://h/a', headers={'If-None-Match':'"x"'})
+	assert resp.status_code == 304
+	assert capsys.readouterr().out == ''
+	hc.s = Session(404)
+	with pytest.raises(threadcall.HTTPError):
+		hc._send('http://h/a')
+
+class Replies:
+	"""
+	answers the requests with the responses given, records them
+	"""
+	def __init__(self, *resps):
+		self.resps = list(resps)
+		self.sent = []
+
+	def prepare_request(self, req):
+		return req
+
+	def send(self, prepped, stream=False, timeout=None):
+		self.sent.append(prepped)
+		return self.resps.pop(0)
+
+def test_resumable_upload_keeps_the_session(app, tmp_path):
+	fname = tmp_path / 'f'
+	fname.write_bytes(b'x' * 10)
+	hc = HttpClient()
+	hc.s = Replies(Resp(308, {'Set-Cookie':'sid=1; path=/'}),
+				Resp(201, {}))
+	up = ResumableUpload(hc.sendData, 'http://up.host/u', str(fname))
+	assert up.run().status_code == 201
+	assert threadcall.hostsessions['http://up.host'] == 'sid=1'
+	assert hc.s.sent[1].headers['session'] == 'sid=1'
+	assert hc.s.sent[1].data == b'x' * 10
+	hc.s = Replies(Resp(401))
+	with pytest.raises(threadcall.NeedLogin):
+		ResumableUpload(hc.sendData, 'http://up.host/u', str(fname)).run()
+
+def test_upload_is_sent_once(app, tmp_path, monkeypatch):
+	monkeypatch.setattr(threadcall, 'Resilience', Resilience.klass)
+	fname = tmp_path / 'f'
+	fname.write_bytes(b'x' * 10)
+	timeouts = []
+	class Flaky(Replies):
+		def send(self, prepped, stream=False, timeout=None):
+			timeouts.append(timeout)
+			prepped.data.read()
+			raise ConnectionError()
+	hc = HttpClient()
+	hc.s = Flaky()
+	with open(fname, 'rb') as f, pytest.raises(ConnectionError):
+		hc._webcall('http://flaky.host/u', method='PUT',
+					files={'f':f})
+	# the file is read, sending it again would send nothing
+	assert timeouts == [(30, None)]